@@ -0,0 +1,112 @@
+"""Time and AppendEntries rounds for a follower far behind, with a divergent tail, to catch up.
+
+A follower of a 3-node cluster goes down, leadership moves to the other follower, and the
+new leader commits --behind entries. The stopped follower's log also gets --divergent entries
+of the old term that no one else has, as if it crashed right after receiving them. Then the
+new leader goes down and the follower comes back; the first leader wins the election knowing
+nothing of the follower's log. The follower's conflict hints let it skip the whole divergent
+term in one round, then the missing entries arrive max_append_entries at a time: a handful of
+rounds, not one per entry.
+
+    python bench/catch_up.py [--behind 10000] [--divergent 1000]
+"""
+import argparse
+import os
+import time
+from concurrent import futures
+
+from local_cluster import WORK_DIR, LocalCluster, wait_until
+from lms_pb2 import LogEntry
+from raft_log import RaftLog
+
+WRITERS = 32  # Threads committing at once, so the entries the follower misses go out in batches
+
+
+class CountingPeer:
+    """A node's Raft service that counts the AppendEntries carrying entries it receives, and those it rejects."""
+
+    def __init__(self, servicer):
+        self.servicer = servicer
+        self.appends = 0
+        self.rejected = 0
+
+    def __getattr__(self, name):
+        return getattr(self.servicer, name)
+
+    def _count(self, request, response):
+        self.appends += bool(request.entries)
+        self.rejected += not response.success
+
+    def AppendEntries(self, request, context):
+        response = self.servicer.AppendEntries(request, context)
+        self._count(request, response)
+        return response
+
+    def AppendEntriesStream(self, request_iterator, context):
+        received = []
+
+        def recorded(requests):
+            for request in requests:
+                received.append(request)
+                yield request
+
+        for response in self.servicer.AppendEntriesStream(recorded(request_iterator), context):
+            self._count(received.pop(0), response)
+            yield response
+
+
+def write(node, count: int):
+    with futures.ThreadPoolExecutor(max_workers=WRITERS) as pool:
+        if not all(committed for committed, _ in pool.map(lambda n: node.execute(f"write-{n}"), range(count))):
+            raise RuntimeError("A write was not committed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--behind", type=int, default=10000, help="Entries committed while the follower is down")
+    parser.add_argument("--divergent", type=int, default=1000, help="Entries of an old term only the follower has")
+    args = parser.parse_args()
+    cluster = LocalCluster(3, os.path.join(WORK_DIR, "catch-up"), CountingPeer).start_all()
+    try:
+        leader = cluster.leader()
+        write(leader, 100)
+        follower, other = [node for node in cluster.nodes.values() if node is not leader]
+        wait_until(lambda: len(follower.log) == len(leader.log))
+        first_leader, old_term = leader, leader.current_term
+        follower_address, other_address = follower.node_address, other.node_address
+        cluster.stop(follower_address)
+        success, message = leader.transfer_leadership(other_address)
+        if not success:
+            raise RuntimeError(message)
+        leader = cluster.leader()
+        write(leader, args.behind)
+        wait_until(lambda: len(first_leader.log) == len(leader.log))
+        cluster.stop(other_address)
+
+        wal = RaftLog(os.path.join(cluster.log_dir, follower_address.split(":")[0], "wal"))
+        wal.append([LogEntry(term=old_term, data=f"divergent-{n}") for n in range(args.divergent)])
+        wal.sync()
+        wal.close()
+
+        follower = cluster.start(follower_address)
+        leader = cluster.leader()
+        if leader is not first_leader:
+            raise RuntimeError("The first leader did not win the election")
+        start = time.perf_counter()
+        cluster.start(other_address)
+        if not wait_until(lambda: follower.last_applied == leader.commit_index and len(follower.log) == len(leader.log), timeout=120):
+            raise RuntimeError("The follower did not catch up")
+        elapsed = time.perf_counter() - start
+        counts = cluster.servicers[follower_address]
+        rewinds = leader.rewinds.get(follower_address, 0)
+    finally:
+        cluster.close()
+    print(f"Follower {args.behind} entries behind with {args.divergent} divergent entries; "
+          f"up to {leader.max_append_entries} entries per AppendEntries")
+    print(f"Caught up in {elapsed * 1000:.0f} ms: {counts.appends} AppendEntries with entries, {counts.rejected} rejected")
+    # Frames already in flight when the first rejection arrives are rejected too; rewinds counts the backtracking steps
+    print(f"The leader moved next_index back {rewinds} times")
+
+
+if __name__ == "__main__":
+    main()
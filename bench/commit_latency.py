@@ -0,0 +1,67 @@
+"""Commit latency of a 3-node cluster with every peer up, with one peer slowed, and with one peer down.
+
+The leader replicates to all peers at once and commits as soon as a majority has an entry,
+so a slow or dead peer should barely move p50 or p99. Each client commits its writes one
+after another; run with --clients above 1 to see group commit batch concurrent writes.
+
+    python bench/commit_latency.py [--writes 500] [--clients 1] [--slow-ms 200]
+"""
+import argparse
+import os
+import time
+from concurrent import futures
+
+from local_cluster import WORK_DIR, LocalCluster, SlowPeer, percentile
+
+
+def measure(cluster: LocalCluster, writes: int, clients: int):
+    """Latency in ms of each of writes commits, sent by clients threads at once, and the commits per second."""
+    leader = cluster.leader()
+    leader.execute("warm-up")
+
+    def client(n):
+        latencies = []
+        for i in range(writes // clients):
+            start = time.perf_counter()
+            committed, _ = leader.execute(f"write-{n}-{i}")
+            if not committed:
+                raise RuntimeError("A write was not committed")
+            latencies.append(1000 * (time.perf_counter() - start))
+        return latencies
+
+    start = time.perf_counter()
+    with futures.ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = [latency for result in pool.map(client, range(clients)) for latency in result]
+    return latencies, len(latencies) / (time.perf_counter() - start)
+
+
+def run(scenario: str, writes: int, clients: int, slow_ms: float):
+    cluster = LocalCluster(3, os.path.join(WORK_DIR, scenario), SlowPeer).start_all()
+    try:
+        leader = cluster.leader()
+        follower = next(node for node in cluster.nodes.values() if node is not leader)
+        if scenario == "one peer slowed":
+            cluster.servicers[follower.node_address].delay = slow_ms / 1000
+        elif scenario == "one peer down":
+            cluster.stop(follower.node_address)
+        latencies, throughput = measure(cluster, writes, clients)
+    finally:
+        cluster.close()
+    print(f"{scenario:<16} {percentile(latencies, 50):>8.1f} {percentile(latencies, 99):>8.1f} "
+          f"{max(latencies):>8.1f} {throughput:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writes", type=int, default=500, help="Commits per scenario")
+    parser.add_argument("--clients", type=int, default=1, help="Threads committing at once")
+    parser.add_argument("--slow-ms", type=float, default=200, help="Time the slowed peer spends on each AppendEntries")
+    args = parser.parse_args()
+    print(f"{args.writes} commits from {args.clients} clients; the slowed peer takes {args.slow_ms:.0f} ms per AppendEntries")
+    print(f"{'scenario':<16} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'commits/s':>10}")
+    for scenario in ("all peers up", "one peer slowed", "one peer down"):
+        run(scenario, args.writes, args.clients, args.slow_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Time from a leader crash until a 3-node cluster accepts writes again.
+
+Each round stops the leader without warning, times how long the other two nodes take to
+elect a new leader and to commit a write through it, then brings the old leader back and
+lets it catch up. Timings come from the environment as on a real node, for example
+
+    RAFT_ELECTION_TIMEOUT_MIN=0.15 RAFT_ELECTION_TIMEOUT_MAX=0.3 python bench/failover.py [--rounds 10]
+"""
+import argparse
+import os
+import statistics
+import time
+
+from local_cluster import WORK_DIR, LocalCluster, wait_until
+from conts import RAFT_ELECTION_TIMEOUT_MAX, RAFT_ELECTION_TIMEOUT_MIN, RAFT_HEARTBEAT_INTERVAL  # Importable once local_cluster set up the path
+
+
+def fail_over(cluster: LocalCluster):
+    """Stop the leader and return the seconds until another node leads, and until it commits a write."""
+    leader = cluster.leader()
+    if not leader.execute("before")[0]:
+        raise RuntimeError("The leader did not commit a write before the crash")
+    crashed = leader.node_address
+    start = time.perf_counter()
+    cluster.stop(crashed)
+    elected = None
+    while True:
+        new_leader = next(iter(cluster.leaders()), None)
+        if new_leader is None:
+            time.sleep(0.002)
+            continue
+        elected = elected or time.perf_counter() - start
+        if new_leader.execute("after")[0]:
+            break
+    committed = time.perf_counter() - start
+
+    cluster.start(crashed)
+    if not wait_until(lambda: cluster.nodes[crashed].last_applied == new_leader.commit_index, timeout=30):
+        raise RuntimeError("The restarted node did not catch up")
+    return elected, committed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=10, help="Leader crashes to time")
+    args = parser.parse_args()
+    print(f"Heartbeat every {RAFT_HEARTBEAT_INTERVAL * 1000:.0f} ms, "
+          f"election timeout {RAFT_ELECTION_TIMEOUT_MIN * 1000:.0f}-{RAFT_ELECTION_TIMEOUT_MAX * 1000:.0f} ms")
+    print(f"{'round':>5} {'new leader ms':>14} {'first write ms':>15}")
+    cluster = LocalCluster(3, os.path.join(WORK_DIR, "failover")).start_all()
+    try:
+        results = []
+        for round_number in range(1, args.rounds + 1):
+            elected, committed = fail_over(cluster)
+            results.append(committed)
+            print(f"{round_number:>5} {elected * 1000:>14.0f} {committed * 1000:>15.0f}")
+    finally:
+        cluster.close()
+    print(f"Writes accepted again after {statistics.median(results) * 1000:.0f} ms median, {max(results) * 1000:.0f} ms worst")
+
+
+if __name__ == "__main__":
+    main()
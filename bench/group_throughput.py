@@ -0,0 +1,78 @@
+"""Write throughput of a 3-node cluster as course data is sharded over more Raft groups.
+
+Each run hosts the meta group and --groups course groups on every node, as RAFT_COURSE_GROUPS
+does, waits for the groups' leaders to spread over the nodes, then has --clients threads per
+group commit writes to their group's leader for --seconds. Groups log, replicate and apply
+independently, so total throughput should grow with the number of groups.
+
+    python bench/group_throughput.py [--groups 1 2 4] [--clients 8] [--seconds 5]
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent import futures
+
+from local_cluster import WORK_DIR, LocalCluster, wait_until
+from raft_groups import RaftGroups  # Importable once local_cluster set up the path
+
+
+def group_leader(cluster: LocalCluster, group: int):
+    """The node leading group, or None while it has no leader."""
+    return next((servicer.nodes[group] for servicer in cluster.servicers.values() if servicer.nodes[group].is_leader()), None)
+
+
+def run(course_groups: int, clients: int, seconds: float):
+    cluster = LocalCluster(3, os.path.join(WORK_DIR, f"groups-{course_groups}"),
+                           lambda node: RaftGroups(node, course_groups)).start_all()
+    groups = range(1, course_groups + 1)
+    try:
+        # Leaders move to their preferred nodes within a few balancing rounds
+        spread = min(course_groups, len(cluster.members))
+
+        def leading_nodes():
+            leaders = [group_leader(cluster, group) for group in groups]
+            return None if None in leaders else {leader.node_address for leader in leaders}
+
+        wait_until(lambda: len(leading_nodes() or ()) == spread, timeout=30)
+        stop = threading.Event()
+
+        def client(group):
+            committed = 0
+            while not stop.is_set():
+                leader = group_leader(cluster, group)
+                if leader is None:
+                    time.sleep(0.01)
+                    continue
+                committed += leader.execute(f"write-{group}")[0]
+            return group, committed
+
+        with futures.ThreadPoolExecutor(max_workers=clients * course_groups) as pool:
+            running = [pool.submit(client, group) for group in groups for _ in range(clients)]
+            time.sleep(seconds)
+            stop.set()
+            per_group = dict.fromkeys(groups, 0)
+            for future in running:
+                group, committed = future.result()
+                per_group[group] += committed
+        nodes = len(leading_nodes() or ())
+    finally:
+        cluster.close()
+    total = sum(per_group.values()) / seconds
+    print(f"{course_groups:>6} {nodes:>12} {total:>10.0f} {total / course_groups:>14.0f}   "
+          + " ".join(f"{committed / seconds:.0f}" for committed in per_group.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, nargs="+", default=[1, 2, 4], help="Numbers of course groups to compare")
+    parser.add_argument("--clients", type=int, default=8, help="Threads writing to each group")
+    parser.add_argument("--seconds", type=float, default=5, help="Length of each run")
+    args = parser.parse_args()
+    print(f"{'groups':>6} {'leader nodes':>12} {'commits/s':>10} {'per group/s':>14}   each group")
+    for course_groups in args.groups:
+        run(course_groups, args.clients, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
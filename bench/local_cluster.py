@@ -0,0 +1,139 @@
+import atexit
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent import futures
+
+os.environ.setdefault("GRPC_VERBOSITY", "ERROR")  # Keep gRPC's own connection notices out of the results
+import grpc  # noqa: E402
+from grpc_tools import protoc  # noqa: E402
+
+# Shared setup for the benchmarks, which run Raft nodes in this process on loopback addresses
+# (127.0.0.1:5000, 127.0.0.2:5000, ...) and talk to each other over real gRPC, each with its own
+# log on disk. As in the tests, lms_pb2 is generated into a scratch directory, and the Raft
+# environment is set before any server module is imported: importing raft starts the module's
+# node, which must not join the default cluster.
+SERVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server")
+PROTO_DIR = os.path.join(os.path.dirname(SERVER_DIR), "proto")
+WORK_DIR = tempfile.mkdtemp(prefix="lms-bench-")
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+
+os.environ["RAFT_LOG_DIR"] = os.path.join(WORK_DIR, "logs")
+os.environ["RAFT_INITIAL_MEMBERS"] = ""
+os.environ["SERVER_NAME"] = "lms_bench"
+os.chdir(WORK_DIR)
+if protoc.main(["protoc", f"-I{PROTO_DIR}", f"--python_out={WORK_DIR}", f"--grpc_python_out={WORK_DIR}",
+                os.path.join(PROTO_DIR, "lms.proto")]) != 0:
+    raise RuntimeError("Could not generate the gRPC code from lms.proto")
+sys.path[:0] = [WORK_DIR, SERVER_DIR]
+
+logging.disable(logging.ERROR)  # Nodes log every election and unreachable peer; keep the results readable
+import raft  # noqa: E402
+from lms_pb2_grpc import add_RaftServiceServicer_to_server  # noqa: E402
+from peer_channels import SERVER_OPTIONS  # noqa: E402
+
+
+def address(n: int) -> str:
+    """Address of the n-th node of a benchmark cluster, counting from 1."""
+    return f"127.0.0.{n}:5000"
+
+
+def percentile(samples, p: float) -> float:
+    """The p-th percentile of samples, by nearest rank."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def wait_until(predicate, timeout: float = 10, interval: float = 0.01) -> bool:
+    """Poll predicate until it holds or timeout seconds pass. Returns its last result."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return predicate()
+        time.sleep(interval)
+    return True
+
+
+class SlowPeer:
+    """A node's Raft service that spends delay seconds on each AppendEntries first, like a peer with a slow disk or link."""
+
+    def __init__(self, servicer, delay: float = 0.0):
+        self.servicer = servicer
+        self.delay = delay  # May be changed while the node runs
+
+    def __getattr__(self, name):
+        return getattr(self.servicer, name)
+
+    def AppendEntries(self, request, context):
+        time.sleep(self.delay)
+        return self.servicer.AppendEntries(request, context)
+
+    def AppendEntriesStream(self, request_iterator, context):
+        def delayed(requests):
+            for request in requests:
+                time.sleep(self.delay)
+                yield request
+        return self.servicer.AppendEntriesStream(delayed(request_iterator), context)
+
+
+class LocalCluster:
+    """Raft nodes served on loopback addresses, with their logs under log_dir.
+
+    make_servicer turns a new node into the Raft service that is registered for it, e.g. to
+    host several groups on one node or to slow it down. Starting an address again restarts
+    its node from the log it left behind.
+    """
+
+    def __init__(self, size: int, log_dir: str, make_servicer=None):
+        self.members = [address(n) for n in range(1, size + 1)]
+        self.log_dir = log_dir
+        self.make_servicer = make_servicer or (lambda node: node)
+        self.nodes = {}
+        self.servicers = {}
+        self.servers = {}
+
+    def start(self, node_address: str) -> raft.RaftNode:
+        name = node_address.split(":")[0]
+        os.environ["SERVER_NAME"] = name
+        raft.RAFT_LOG_DIR = os.path.join(self.log_dir, name)
+        raft.RAFT_INITIAL_MEMBERS = list(self.members)
+        node = raft.RaftNode()
+        servicer = self.make_servicer(node)
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=16), options=SERVER_OPTIONS)
+        add_RaftServiceServicer_to_server(servicer, server)
+        server.add_insecure_port(node_address)
+        server.start()
+        self.nodes[node_address], self.servicers[node_address], self.servers[node_address] = node, servicer, server
+        return node
+
+    def start_all(self) -> "LocalCluster":
+        for node_address in self.members:
+            self.start(node_address)
+        return self
+
+    def stop(self, node_address: str):
+        """Take a node off the network and stop it, as if it crashed."""
+        self.servers.pop(node_address).stop(grace=None).wait()
+        servicer, node = self.servicers.pop(node_address), self.nodes.pop(node_address)
+        # A servicer that hosts several Raft groups, like RaftGroups, has a node for each
+        for hosted in {node, *getattr(servicer, "nodes", {}).values()}:
+            hosted.stop()
+
+    def leader(self, timeout: float = 10) -> raft.RaftNode:
+        """The single leader among the running nodes, once there is one."""
+        if not wait_until(lambda: len(self.leaders()) == 1, timeout):
+            raise RuntimeError("No leader was elected")
+        return self.leaders()[0]
+
+    def leaders(self):
+        return [node for node in self.nodes.values() if node.is_leader()]
+
+    def followers(self):
+        return [node for node in self.nodes.values() if not node.is_leader()]
+
+    def close(self):
+        for node_address in list(self.servers):
+            self.stop(node_address)
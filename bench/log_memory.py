@@ -0,0 +1,85 @@
+"""Startup time and memory of the Raft log with a long history.
+
+Writes a log of --entries entries, then opens it again the way a restarting node does, and
+reads old entries the way a leader does for a lagging follower. Opening scans only the
+active segment and keeps no entries in memory, so both its time and its memory should stay
+flat as the history grows. For comparison, the last line holds every entry in memory, as the
+log did when it was loaded from a single JSON file.
+
+    python bench/log_memory.py [--entries 1000000] [--entry-bytes 100]
+"""
+import argparse
+import os
+import random
+import resource
+import time
+
+from local_cluster import WORK_DIR
+from lms_pb2 import LogEntry
+from raft_log import RaftLog
+
+WRITE_BATCH = 1000  # Entries appended and synced together, as one group commit would
+SLICE = 1000  # Entries read for a lagging follower, as in one AppendEntries
+
+
+def resident_bytes() -> int:
+    """Memory of this process held in RAM, including the entries protobuf keeps outside Python's heap. Linux only."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def directory_size(directory: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def write_log(directory: str, entries: int, entry_bytes: int) -> float:
+    """Write a log of entries entries and return the seconds it took."""
+    log = RaftLog(directory)
+    data = "x" * entry_bytes
+    start = time.perf_counter()
+    for base in range(0, entries, WRITE_BATCH):
+        log.append([LogEntry(term=1 + index // 100000, data=data) for index in range(base, min(entries, base + WRITE_BATCH))])
+        log.sync()
+    elapsed = time.perf_counter() - start
+    log.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1000000, help="Entries in the log")
+    parser.add_argument("--entry-bytes", type=int, default=100, help="Size of each entry's command")
+    parser.add_argument("--skip-full-load", action="store_true", help="Do not hold every entry in memory for comparison")
+    args = parser.parse_args()
+    directory = os.path.join(WORK_DIR, "wal")
+
+    elapsed = write_log(directory, args.entries, args.entry_bytes)
+    print(f"Wrote {args.entries} entries in {elapsed:.1f} s: {directory_size(directory) / (1 << 20):.0f} MiB on disk")
+
+    start = time.perf_counter()
+    log = RaftLog(directory)
+    print(f"Open:                    {1000 * (time.perf_counter() - start):7.1f} ms, {len(log.segments)} segments")
+    log.close()
+
+    baseline = resident_bytes()
+    log = RaftLog(directory)
+    print(f"Memory for the open log: {(resident_bytes() - baseline) / (1 << 20):7.2f} MiB")
+
+    old = random.sample(range(len(log) // 2), min(1000, len(log) // 2))
+    start = time.perf_counter()
+    for index in old:
+        log.entry(index)
+    print(f"Random old entry:        {1000 * (time.perf_counter() - start) / max(1, len(old)):7.3f} ms each")
+    start = time.perf_counter()
+    log.read(0, SLICE)
+    print(f"{SLICE} oldest entries:      {1000 * (time.perf_counter() - start):7.1f} ms")
+    print(f"Memory after the reads:  {(resident_bytes() - baseline) / (1 << 20):7.2f} MiB")
+
+    if not args.skip_full_load:
+        entries = log.read(0)
+        print(f"Every entry in memory:   {(resident_bytes() - baseline) / (1 << 20):7.2f} MiB for {len(entries)} entries")
+    log.close()
+
+
+if __name__ == "__main__":
+    main()
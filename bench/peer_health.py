@@ -0,0 +1,93 @@
+"""Heartbeat round trip, open file descriptors and threads over a long idle run of a 3-node cluster.
+
+First the leader heartbeats its followers for --seconds over the channels it keeps open to
+them, and GetPeerHealth is sampled every --interval. Then, for as long again, each follower
+gets a call every heartbeat interval over a new channel that is never closed, as heartbeats
+were sent before the channels were kept, and its round trip includes making the channel.
+Compare the round trips and how the descriptors and threads grow over each run.
+
+    python bench/peer_health.py [--seconds 60] [--interval 5]
+"""
+import argparse
+import os
+import threading
+import time
+
+import grpc
+
+from local_cluster import WORK_DIR, LocalCluster, percentile
+from lms_pb2 import Empty, PeerHealthRequest
+from lms_pb2_grpc import RaftServiceStub
+from peer_channels import open_file_descriptors
+
+
+def shared_channels(cluster: LocalCluster, seconds: float, interval: float):
+    """RTTs in ms and (elapsed, fds, threads) samples while the leader heartbeats over its own channels."""
+    leader = cluster.leader()
+    with grpc.insecure_channel(leader.node_address) as channel:
+        status = RaftServiceStub(channel).GetPeerHealth
+        start, rtts, samples = time.monotonic(), [], []
+        while True:
+            elapsed = time.monotonic() - start
+            health = status(PeerHealthRequest())
+            rtts += [peer.heartbeat_rtt_ms for peer in health.peers if peer.heartbeat_rtt_ms]
+            samples.append((elapsed, health.open_fds, health.threads))
+            if elapsed >= seconds:
+                return rtts, samples
+            time.sleep(interval)
+
+
+def channel_per_heartbeat(cluster: LocalCluster, seconds: float, interval: float):
+    """Same as shared_channels, with every heartbeat sent on a new channel that is left open."""
+    leader = cluster.leader()
+    followers = [node.node_address for node in cluster.followers()]
+    channels, rtts, samples = [], [], []
+    start = next_sample = time.monotonic()
+    try:
+        while True:
+            elapsed = time.monotonic() - start
+            if time.monotonic() >= next_sample or elapsed >= seconds:
+                samples.append((elapsed, open_file_descriptors(), threading.active_count()))
+                next_sample += interval
+                if elapsed >= seconds:
+                    return rtts, samples
+            for follower in followers:
+                sent_at = time.perf_counter()
+                channel = grpc.insecure_channel(follower)
+                channels.append(channel)
+                RaftServiceStub(channel).GetLeader(Empty(), timeout=1)
+                rtts.append((time.perf_counter() - sent_at) * 1000)
+            time.sleep(leader.heartbeat_interval)
+    finally:
+        print(f"Opened {len(channels)} channels, one per heartbeat")
+        for channel in channels:
+            channel.close()
+
+
+def report(name: str, rtts, samples):
+    (_, first_fds, first_threads), (_, last_fds, last_threads) = samples[0], samples[-1]
+    print(f"{name:<24} {percentile(rtts, 50):>8.2f} {percentile(rtts, 99):>8.2f} "
+          f"{first_fds:>6} -> {last_fds:<6} {first_threads:>6} -> {last_threads:<6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60, help="Length of each run")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between samples")
+    args = parser.parse_args()
+    cluster = LocalCluster(3, os.path.join(WORK_DIR, "peer-health")).start_all()
+    try:
+        shared = shared_channels(cluster, args.seconds, args.interval)
+        per_heartbeat = channel_per_heartbeat(cluster, args.seconds, args.interval)
+    finally:
+        cluster.close()
+    print(f"{args.seconds:.0f} s of heartbeats")
+    print(f"{'channels':<24} {'p50 ms':>8} {'p99 ms':>8} {'open fds':>16} {'threads':>16}")
+    report("shared, one per peer", *shared)
+    report("new one per heartbeat", *per_heartbeat)
+    for name, (_, samples) in [("shared", shared), ("per heartbeat", per_heartbeat)]:
+        print(f"  {name}: " + " ".join(f"{elapsed:.0f}s={fds}" for elapsed, fds, _ in samples))
+
+
+if __name__ == "__main__":
+    main()
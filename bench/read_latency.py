@@ -0,0 +1,86 @@
+"""Latency of each kind of read, and read throughput on the leader alone against every node.
+
+A linearizable read on the leader waits for a heartbeat round, or for nothing while its lease
+holds. A follower asks the leader for its commit index (ReadIndex) and waits to apply it, or
+with a staleness bound serves straight away if it heard from the leader recently enough.
+
+Here every node shares one process and CPU, so spreading reads over the nodes cannot add
+capacity the way separate machines do; the throughput lines show what each kind of read
+costs, and on separate machines the every-node figure is the one that grows with the cluster.
+
+    python bench/read_latency.py [--reads 1000] [--clients 8] [--seconds 3]
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent import futures
+
+from local_cluster import WORK_DIR, LocalCluster, percentile
+
+STALENESS = 0.5  # Seconds of staleness the bounded reads accept
+
+
+def latencies(read, reads: int):
+    """Latency in ms of each of reads calls to read, one after another."""
+    samples = []
+    for _ in range(reads):
+        start = time.perf_counter()
+        if not read():
+            raise RuntimeError("A read could not be served")
+        samples.append(1000 * (time.perf_counter() - start))
+    return samples
+
+
+def throughput(nodes, clients: int, seconds: float) -> float:
+    """Linearizable reads per second from clients threads spread round-robin over nodes."""
+    stop = threading.Event()
+
+    def client(n):
+        node, served = nodes[n % len(nodes)], 0
+        while not stop.is_set():
+            served += node.wait_for_read()
+        return served
+
+    with futures.ThreadPoolExecutor(max_workers=clients) as pool:
+        running = [pool.submit(client, n) for n in range(clients)]
+        time.sleep(seconds)
+        stop.set()
+        return sum(future.result() for future in running) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reads", type=int, default=1000, help="Reads timed for each kind")
+    parser.add_argument("--clients", type=int, default=8, help="Threads reading at once for the throughput runs")
+    parser.add_argument("--seconds", type=float, default=3, help="Length of each throughput run")
+    args = parser.parse_args()
+    cluster = LocalCluster(3, os.path.join(WORK_DIR, "reads")).start_all()
+    try:
+        leader = cluster.leader()
+        follower = next(node for node in cluster.nodes.values() if node is not leader)
+        for n in range(100):
+            leader.execute(f"write-{n}")
+
+        print(f"{'read':<32} {'p50 ms':>8} {'p99 ms':>8}")
+        kinds = [
+            ("leader, heartbeat round", leader.wait_for_read),
+            ("leader, lease", leader.wait_for_read),
+            ("follower, ReadIndex", follower.wait_for_read),
+            (f"follower, {STALENESS * 1000:.0f} ms staleness", lambda: follower.wait_for_read(STALENESS)),
+        ]
+        for name, read in kinds:
+            leader.lease_reads = name == "leader, lease"
+            samples = latencies(read, args.reads)
+            print(f"{name:<32} {percentile(samples, 50):>8.2f} {percentile(samples, 99):>8.2f}")
+        leader.lease_reads = False
+
+        print(f"Linearizable reads/s with {args.clients} clients:")
+        print(f"  leader only:    {throughput([leader], args.clients, args.seconds):8.0f}")
+        print(f"  every node:     {throughput(list(cluster.nodes.values()), args.clients, args.seconds):8.0f}")
+    finally:
+        cluster.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Longest pause in accepted writes while every node of a 3-node cluster is restarted in turn.
+
+Writers keep committing through whichever node leads. Each node in turn is stopped, left down
+for --down seconds and started again, and the next one waits until it has caught up. With
+leadership transferred away first, as on SIGTERM, restarting the leader should pause writes
+for about a heartbeat round; stopping it without a transfer costs an election timeout.
+Restarting a follower should not pause writes longer than a busy commit does.
+
+    python bench/rolling_restart.py [--writers 4] [--down 1]
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent import futures
+
+from local_cluster import WORK_DIR, LocalCluster, wait_until
+from conts import RAFT_ELECTION_TIMEOUT_MIN, RAFT_HEARTBEAT_INTERVAL  # Importable once local_cluster set up the path
+
+
+def write_steadily(cluster: LocalCluster, stop: threading.Event, accepted: list):
+    """Commit writes through the current leader until stop is set, recording when each was accepted."""
+    n = 0
+    while not stop.is_set():
+        try:
+            leader = next(iter(cluster.leaders()), None)
+            committed = leader is not None and leader.execute(f"write-{threading.get_ident()}-{n}")[0]
+        except (RuntimeError, futures.CancelledError):
+            committed = False  # The node was stopped under the write, or the cluster changed while it was read
+        if committed:
+            accepted.append(time.perf_counter())
+            n += 1
+        else:
+            time.sleep(0.002)
+
+
+def restart(cluster: LocalCluster, node_address: str, transfer: bool, down: float):
+    """Stop a node, transferring leadership away first if asked, then start it and wait for it to catch up."""
+    node = cluster.nodes[node_address]
+    was_leader = node.is_leader()
+    if transfer and was_leader:
+        success, message = node.transfer_leadership()
+        if not success:
+            raise RuntimeError(message)
+    cluster.stop(node_address)
+    time.sleep(down)
+    node = cluster.start(node_address)
+    leader = cluster.leader()
+    if not wait_until(lambda: node.last_applied >= leader.commit_index, timeout=30):
+        raise RuntimeError(f"{node_address} did not catch up")
+    return was_leader
+
+
+def longest_gap(accepted, start: float, end: float) -> float:
+    """Longest time in ms between consecutive accepted writes, over the pauses that end between start and end."""
+    gaps = [later - earlier for earlier, later in zip(accepted, accepted[1:]) if start < later <= end]
+    return max(gaps, default=0) * 1000
+
+
+def run(transfer: bool, writers: int, down: float):
+    cluster = LocalCluster(3, os.path.join(WORK_DIR, "transfer" if transfer else "crash")).start_all()
+    stop, accepted, windows = threading.Event(), [], []
+    try:
+        cluster.leader()
+        with futures.ThreadPoolExecutor(max_workers=writers) as pool:
+            running = [pool.submit(write_steadily, cluster, stop, accepted) for _ in range(writers)]
+            if not wait_until(lambda: len(accepted) >= 100):
+                raise RuntimeError("The cluster is not accepting writes")
+            for node_address in cluster.members:
+                start = time.perf_counter()
+                was_leader = restart(cluster, node_address, transfer, down)
+                windows.append((node_address, was_leader, start, time.perf_counter()))
+            time.sleep(0.5)  # Let the writers show the cluster accepting writes after the last restart
+            stop.set()
+            for writer in running:
+                writer.result()
+    finally:
+        stop.set()
+        cluster.close()
+    accepted.sort()
+    mode = "transfer first" if transfer else "no transfer"
+    for node_address, was_leader, start, end in windows:
+        role = "leader" if was_leader else "follower"
+        print(f"{mode:<16} {node_address:<16} {role:<10} {(end - start) * 1000:>12.0f} {longest_gap(accepted, start, end):>16.0f}")
+    return longest_gap(accepted, windows[0][2], windows[-1][3])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=4, help="Threads writing throughout")
+    parser.add_argument("--down", type=float, default=1, help="Seconds each node stays down")
+    args = parser.parse_args()
+    print(f"Heartbeat every {RAFT_HEARTBEAT_INTERVAL * 1000:.0f} ms, election timeout from {RAFT_ELECTION_TIMEOUT_MIN * 1000:.0f} ms")
+    print(f"{'restart':<16} {'node':<16} {'role':<10} {'restart ms':>12} {'longest gap ms':>16}")
+    worst = {transfer: run(transfer, args.writers, args.down) for transfer in (True, False)}
+    print(f"Longest pause in accepted writes over the whole rolling restart: "
+          f"{worst[True]:.0f} ms transferring leadership first, {worst[False]:.0f} ms without")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,55 +3,133 @@ from lms_pb2 import Empty
 from lms_pb2_grpc import RaftServiceStub
 
 import grpc
+import hashlib
+import itertools
 import lms_pb2
 import lms_pb2_grpc
 import logging
+import os
 import time
+import zlib
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+# Nodes asked for the cluster membership at startup; the cluster's own member list replaces them
+SEED_NODES = os.getenv("LMS_SEED_NODES", "lms_server_1:5000,lms_server_2:5000,lms_server_3:5000").split(",")
+MEMBERS_REFRESH_INTERVAL = 30  # Seconds between membership refreshes, so added nodes start serving reads
+LEADER_HINT = "x-leader-address"  # Trailing metadata a follower adds to a response it forwarded from the leader
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Bytes read at a time while hashing a file to upload
+UPLOAD_RETRIES = 5  # Times an interrupted upload is resumed before giving up
+UPLOAD_RETRY_DELAY = 0.2  # Seconds before the first resume, doubling after each
+RESUMABLE_ERRORS = (
+    grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.CANCELLED,
+    grpc.StatusCode.ABORTED, grpc.StatusCode.DATA_LOSS,
+)
+
+
+def missing_ranges(upload):
+    """Byte ranges of a resumable upload that the server has not received, as (start, end) pairs."""
+    missing = []
+    position = 0
+    for received in upload.received:
+        if received.start > position:
+            missing.append((position, received.start))
+        position = max(position, received.end)
+    if position < upload.size:
+        missing.append((position, upload.size))
+    return missing
+
+
+class LeaderHintInterceptor(grpc.UnaryUnaryClientInterceptor, grpc.StreamUnaryClientInterceptor):
+    """Points the client at the leader named in a forwarded response, so later writes skip the extra hop."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        call = continuation(client_call_details, request)
+        for key, value in call.trailing_metadata() or ():
+            if key == LEADER_HINT and value != self.client.leader_address:
+                logger.info(f"Request was forwarded; current leader is {value}")
+                self.client.leader_address = value
+        return call
+
+    def intercept_stream_unary(self, continuation, client_call_details, request_iterator):
+        return self.intercept_unary_unary(continuation, client_call_details, request_iterator)
+
+
 class GRPCClient:
     def __init__(self):
-        self.peer_nodes = ["lms_server_1:5000", "lms_server_2:5000", "lms_server_3:5000"]
+        # One long-lived channel per node, shared by writes and reads
+        self.stubs = {}
+        self.read_stubs = []
+        self.read_counter = itertools.count()
+        self.set_members(SEED_NODES)
+        self.members_refreshed = 0.0
         self.leader_address = None
-        self.find_leader_address()
-        self.channel = None
-        self.stub = None
-        self.setup_grpc_client()
-
-    def setup_grpc_client(self):
-        self.channel = grpc.insecure_channel(self.leader_address)
-        self.stub = lms_pb2_grpc.LMSStub(self.channel)
-        logger.info("Client connected to LMS Server Leader")
+        if not self.find_leader_address():
+            # Any node accepts writes and forwards them to the leader
+            self.leader_address = self.peer_nodes[0]
+        logger.info(f"Client sending writes to {self.leader_address}")
+
+    def _open_stub(self, address):
+        channel = grpc.intercept_channel(grpc.insecure_channel(address), LeaderHintInterceptor(self))
+        return lms_pb2_grpc.LMSStub(channel)
+
+    @property
+    def stub(self):
+        """Stub for RPCs that change state, bound to the cached leader."""
+        if self.leader_address not in self.stubs:
+            self.stubs[self.leader_address] = self._open_stub(self.leader_address)
+        return self.stubs[self.leader_address]
+
+    @property
+    def read_stub(self):
+        """Stub for read-only RPCs, picking the next node round-robin. Voters and learners both serve reads."""
+        if time.monotonic() - self.members_refreshed > MEMBERS_REFRESH_INTERVAL:
+            self.find_leader_address()
+        return self.read_stubs[next(self.read_counter) % len(self.read_stubs)]
+
+    def set_members(self, addresses):
+        """Use the given nodes for reads and failover, opening a channel to any new one."""
+        self.peer_nodes = list(addresses)
+        for address in self.peer_nodes:
+            if address not in self.stubs:
+                self.stubs[address] = self._open_stub(address)
+        self.read_stubs = [self.stubs[address] for address in self.peer_nodes]
 
     def find_leader_address(self):
-        """Ask any peer for the current leader's address using Raft's GetLeader RPC."""
-        self.leader_address = None
-        backoff = 1  # Start with a 1 second backoff
-        max_backoff = 32  # Maximum backoff time
-
-        while self.leader_address is None:
-            logger.info("Searching for leader...")
-            for peer in self.peer_nodes:
-                try:
-                    channel = grpc.insecure_channel(peer)
-                    raft_stub = RaftServiceStub(channel)
-                    response = raft_stub.GetLeader(Empty())
-                    if response.leader_address:
-                        logger.info(f"Current leader found: {response.leader_address}")
-                        self.leader_address = response.leader_address
-                        return True
-                    else:
-                        logger.info(f"{peer} is not the leader.")
-                except grpc.RpcError as e:
-                    logger.warning(f"Failed to contact peer {peer}: {e}")
-                    continue  # Try the next peer
-
-            logger.error("Leader not found. Retrying with backoff...")
-            time.sleep(backoff)
-            backoff = min(max_backoff, backoff * 1.3)  # Exponential backoff
+        """Ask the nodes for the cluster members and the current leader using Raft's GetMembers RPC. Returns True if a leader is known."""
+        logger.info("Searching for leader...")
+        self.members_refreshed = time.monotonic()
+        for peer in self.peer_nodes + [seed for seed in SEED_NODES if seed not in self.peer_nodes]:
+            try:
+                with grpc.insecure_channel(peer) as channel:
+                    response = RaftServiceStub(channel).GetMembers(Empty(), timeout=1)
+            except grpc.RpcError as e:
+                logger.warning(f"Failed to contact peer {peer}: {e}")
+                continue  # Try the next peer
+            if not response.members:
+                continue  # A node that has not been added to the cluster yet
+            members = [member.address for member in response.members]
+            if members != self.peer_nodes:
+                logger.info(f"Cluster members: {members}")
+                self.set_members(members)
+            if response.leader_address:
+                logger.info(f"Current leader found: {response.leader_address}")
+                self.leader_address = response.leader_address
+                return True
+            logger.info(f"{peer} does not know the leader.")
+        logger.error("Leader not found.")
+        return False
+
+    def next_node(self):
+        """Send writes to the node after the cached one; it forwards them to whichever node leads."""
+        index = self.peer_nodes.index(self.leader_address) if self.leader_address in self.peer_nodes else -1
+        self.leader_address = self.peer_nodes[(index + 1) % len(self.peer_nodes)]
+        logger.info(f"Sending writes to {self.leader_address}")
 
     def handle_grpc_error(self,e):
         """Handles leader redirection when a gRPC error indicates the node is not the leader."""
@@ -59,13 +137,12 @@ class GRPCClient:
         if e.code() == grpc.StatusCode.UNAVAILABLE:
             # This could indicate that the node is down or unavailable
             logger.error(f"gRPC error: {e.code()} - {e.details()}. The node might be down.")
-            if self.find_leader_address():
-                self.setup_grpc_client()
+            self.next_node()
         elif e.code() == grpc.StatusCode.FAILED_PRECONDITION:
             # Custom error for a node indicating it's not the leader
             logger.info(f"Node is not the leader. Re-fetching the current leader.")
-            if self.find_leader_address():
-                self.setup_grpc_client()
+            if not self.find_leader_address():
+                self.next_node()
         else:
             # Other gRPC errors
             logger.error(f"Unhandled gRPC error: {e.code()} - {e.details()}")
@@ -73,11 +150,65 @@ class GRPCClient:
 
 
 
+    def submit_file(self, token, filename, file, **record):
+        """Upload a seekable file in a resumable session, and record it as the assignment or course material given.
+
+        record is assignment=AssignmentData or content=CourseMaterial; the server fills in the file.
+        Content the server already stores is not sent. If the connection drops, the upload resumes
+        with only the chunks the server is missing, up to UPLOAD_RETRIES times; if the session is
+        gone because another node now leads, a new session starts there. Returns the response
+        of the step that failed, or of recording the file.
+        """
+        digest = hashlib.sha256()
+        for data in iter(lambda: file.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(data)
+        start = lms_pb2.StartUploadRequest(
+            token=token,
+            filename=filename,
+            size=file.tell(),
+            sha256=digest.hexdigest(),
+            teacher_name=next(iter(record.values())).teacher_name
+        )
+        upload = self.stub.StartUpload(start)
+        for attempt in range(UPLOAD_RETRIES + 1):
+            try:
+                if attempt:
+                    upload = self.stub.GetUpload(lms_pb2.UploadSessionRequest(token=token, upload_id=upload.upload_id))
+                    if upload.status == "Upload not found":
+                        # The session lived on a leader that has since handed over; start another on the new one
+                        upload = self.stub.StartUpload(start)
+                missing = missing_ranges(upload) if upload.status == "success" else []
+                if missing:
+                    upload = self.stub.UploadChunks(self._upload_chunks(token, upload, file, missing))
+                break
+            except grpc.RpcError as e:
+                if attempt == UPLOAD_RETRIES or e.code() not in RESUMABLE_ERRORS:
+                    raise
+                logger.warning(f"Upload {upload.upload_id} interrupted: {e.code()}. Resuming with the missing chunks.")
+                if e.code() == grpc.StatusCode.UNAVAILABLE:
+                    self.next_node()
+                time.sleep(UPLOAD_RETRY_DELAY * 2 ** attempt)
+        if upload.status != "success":
+            return upload
+        return self.stub.FinalizeUpload(lms_pb2.FinalizeUploadRequest(token=token, upload_id=upload.upload_id, **record))
+
+    @staticmethod
+    def _upload_chunks(token, upload, file, missing):
+        """Chunks of the given byte ranges of a file, each with its own CRC32."""
+        chunk = lms_pb2.UploadSessionChunk(token=token, upload_id=upload.upload_id)  # Only the first chunk names the upload
+        for start, end in missing:
+            for offset in range(start, end, upload.chunk_size):
+                file.seek(offset)
+                data = file.read(min(upload.chunk_size, end - offset))
+                chunk.offset, chunk.data, chunk.checksum = offset, data, zlib.crc32(data)
+                yield chunk
+                chunk = lms_pb2.UploadSessionChunk()
+
     def fetch_teachers_via_grpc(self):
         """Fetches a list of teachers from the gRPC service."""
         try:
             # Send a request to the gRPC server to get the list of teachers
-            teacher_response = self.stub.GetTeachers(lms_pb2.GetTeachersRequest(token=session['token']))
+            teacher_response = self.read_stub.GetTeachers(lms_pb2.GetTeachersRequest(token=session['token']))
 
             teachers = [{'username': teacher.username, 'name': teacher.name} for teacher in teacher_response.teachers]
             
@@ -97,7 +228,7 @@ class GRPCClient:
         """Fetches a list of students from the gRPC service."""
         try:
             # Send a request to the gRPC server to get the list of students
-            student_response = self.stub.GetStudents(lms_pb2.GetStudentsRequest(token=session['token']))
+            student_response = self.read_stub.GetStudents(lms_pb2.GetStudentsRequest(token=session['token']))
 
             students = [{'username': student.username, 'name': student.name} for student in student_response.students]
             
@@ -58,37 +58,23 @@ def handle_assignments_post():
         selected_teacher = request.form.get('teacher')  # Fetch the selected teacher from the dropdown
         if 'assignment' in request.files:
             uploaded_file = request.files['assignment']
-            file_content = uploaded_file.read()
 
             if uploaded_file.filename != '':
-                # Upload the assignment file to the server
-                file_save_response = grpc_client.stub.Upload(lms_pb2.UploadFileRequest(
-                    token=session['token'],
-                    filename=secure_filename(uploaded_file.filename),
-                    data=file_content
-                ))
-
-                if file_save_response.status == "success":
-                    # Submit the assignment with the associated teacher
-                    response = grpc_client.stub.Post(lms_pb2.PostRequest(
-                        token=session['token'],
-                        assignment=lms_pb2.AssignmentData(
-                            student_name=session['username'],
-                            teacher_name=selected_teacher,  # Assign the selected teacher
-                            filename=secure_filename(uploaded_file.filename),
-                            file_path=file_save_response.file_path,
-                            file_id=str(file_save_response.file_id)
-                        )
-                    ))
-                    if response.status == "Assignment submitted successfully":
-                        logger.info(f"Assignment data uploaded successfully: {uploaded_file.filename}")
-                        return jsonify({"message": "Assignment submitted successfully"}), 200
-                    else:
-                        logger.error(f"Failed to submit assignment: {response.status}")
-                        return jsonify({"error": response.status}), 400
+                # Upload the assignment file in a resumable session, which submits it to the selected teacher
+                response = grpc_client.submit_file(
+                    session['token'], secure_filename(uploaded_file.filename), uploaded_file.stream,
+                    assignment=lms_pb2.AssignmentData(
+                        student_name=session['username'],
+                        teacher_name=selected_teacher,  # Assign the selected teacher
+                        filename=secure_filename(uploaded_file.filename)
+                    )
+                )
+                if response.status == "Assignment submitted successfully":
+                    logger.info(f"Assignment data uploaded successfully: {uploaded_file.filename}")
+                    return jsonify({"message": "Assignment submitted successfully"}), 200
                 else:
-                    logger.error(f"File could not be uploaded: {file_save_response.status}")
-                    return jsonify({"error": file_save_response.status}), 400
+                    logger.error(f"Failed to submit assignment: {response.status}")
+                    return jsonify({"error": response.status}), 400
             else:
                 logger.warning("No file uploaded.")
                 return jsonify({"error": "No file uploaded."}), 400
@@ -109,7 +95,7 @@ def render_assignments_get():
             return jsonify({"error": "Unknown role"}), 400
 
         # Fetch assignments
-        response = grpc_client.stub.Get(lms_pb2.GetRequest(
+        response = grpc_client.read_stub.Get(lms_pb2.GetRequest(
             token=session['token'],
             assignment=request_data
         ))
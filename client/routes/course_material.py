@@ -27,46 +27,29 @@ def handle_course_material_post():
         logger.info(f"POST request received for course material upload by teacher: {session['username']}")
         if 'course_material' in request.files:
             uploaded_file = request.files['course_material']
-            file_content = uploaded_file.read()
 
-            logger.debug(f"Uploaded file: {uploaded_file.filename}, size: {len(file_content)} bytes")
+            logger.debug(f"Uploaded file: {uploaded_file.filename}, type: {uploaded_file.mimetype}")
 
             if uploaded_file.filename != '':
                 try:
-                    # Upload the course_material file to the server
+                    # Upload the course_material file in a resumable session, which records it for the teacher
                     logger.info(f"Uploading file: {uploaded_file.filename} to the server.")
-                    file_save_response = grpc_client.stub.Upload(lms_pb2.UploadFileRequest(
-                        token=session['token'],
-                        filename=secure_filename(uploaded_file.filename),
-                        data=file_content
-                    ))
-
-                    logger.debug(f"File upload response: {file_save_response.status}")
-
-                    if file_save_response.status == "success":
-                        # Submit the course_material with the associated teacher
-                        logger.info(f"Submitting course material for teacher: {session['username']}")
-                        response = grpc_client.stub.Post(lms_pb2.PostRequest(
-                            token=session['token'],
-                            content=lms_pb2.CourseMaterial(
-                                teacher_name=session['username'],
-                                filename=secure_filename(uploaded_file.filename),
-                                file_path=file_save_response.file_path,
-                                file_id=str(file_save_response.file_id)
-                            )
-                        ))
-
-                        logger.debug(f"Course material submission response: {response.status}")
-
-                        if response.status == "course_materials submitted successfully":
-                            logger.info(f"Course material data uploaded successfully: {uploaded_file.filename}")
-                            return jsonify({"message": "Course material submitted successfully"}), 200
-                        else:
-                            logger.error(f"Failed to submit course material: {response.status}")
-                            return jsonify({"error": response.status}), 400
+                    response = grpc_client.submit_file(
+                        session['token'], secure_filename(uploaded_file.filename), uploaded_file.stream,
+                        content=lms_pb2.CourseMaterial(
+                            teacher_name=session['username'],
+                            filename=secure_filename(uploaded_file.filename)
+                        )
+                    )
+
+                    logger.debug(f"Course material submission response: {response.status}")
+
+                    if response.status == "course_materials submitted successfully":
+                        logger.info(f"Course material data uploaded successfully: {uploaded_file.filename}")
+                        return jsonify({"message": "Course material submitted successfully"}), 200
                     else:
-                        logger.error(f"File could not be uploaded: {file_save_response.status}")
-                        return jsonify({"error": file_save_response.status}), 400
+                        logger.error(f"Failed to submit course material: {response.status}")
+                        return jsonify({"error": response.status}), 400
                 
                 except grpc.RpcError as e:
                     logger.error(f"gRPC error during file upload: {e.code()} - {e.details()}")
@@ -94,7 +77,7 @@ def render_course_material_get():
             return jsonify({"error": "Unknown role"}), 400
 
         # Send the gRPC request to get course_materials
-        response = grpc_client.stub.Get(lms_pb2.GetRequest(
+        response = grpc_client.read_stub.Get(lms_pb2.GetRequest(
             token=session['token'],
             content=request_data
         ))
@@ -58,7 +58,7 @@ def render_feedback_get():
             return "Unknown role", 400
 
         # Send the gRPC request to get feedback
-        response = grpc_client.stub.Get(lms_pb2.GetRequest(
+        response = grpc_client.read_stub.Get(lms_pb2.GetRequest(
             token=session['token'],
             feedback=request_data
         ))
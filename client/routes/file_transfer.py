@@ -1,11 +1,11 @@
 from config import logger, FILE_STORAGE_DIR
-from flask import  session, send_file, Blueprint
+from flask import  session, request, redirect, Response, Blueprint
 from grpc_client import grpc_client
 from urllib.parse import quote, unquote
 from werkzeug.utils import secure_filename
 import grpc
-import io
 import lms_pb2
+import mimetypes
 import os
 
 bp = Blueprint('file_transfer', __name__)
@@ -14,26 +14,62 @@ bp = Blueprint('file_transfer', __name__)
 
 @bp.route('/download/<path:file_path>')
 def download_file(file_path):
+    # Decode the file path to handle special characters and slashes
+    file_path = unquote(file_path)
+    # Stored files are named by their content hash, so the link carries the name to save the file as
+    filename = request.args.get('name') or os.path.basename(file_path)
+
+    # Any node holding the file can sign a link to its file server, which sends the file itself
     try:
-        # Decode the file path to handle special characters and slashes
-        file_path = unquote(file_path)
-        
-        response = grpc_client.stub.Download(lms_pb2.DownloadFileRequest(
+        signed = grpc_client.read_stub.Download(lms_pb2.DownloadFileRequest(
             token=session['token'],
-            file_path=file_path
+            file_path=file_path,
+            signed_url=True,
+            name=filename
         ))
+        if signed.url:
+            return redirect(signed.url)
+    except grpc.RpcError as e:
+        logger.warning(f"No signed URL for {file_path}, streaming it instead: {e.code()}")
 
-        if response.status == "success":
-            return send_file(
-                io.BytesIO(response.data),
-                download_name =os.path.basename(file_path),
-                as_attachment=True
-            )
-        else:
-            return "File not found", 404
-
+    # A single byte range is served as 206 Partial Content; anything else gets the whole file
+    byte_range = request.range if request.range and request.range.units == 'bytes' and len(request.range.ranges) == 1 else None
+    start, stop = byte_range.ranges[0] if byte_range else (0, None)
+    try:
+        chunks = grpc_client.stub.DownloadStream(lms_pb2.DownloadStreamRequest(
+            token=session['token'],
+            file_path=file_path,
+            offset=start,
+            length=stop - start if stop is not None else 0
+        ))
+        first = next(chunks)  # Waits for the first chunk only, which also carries the file size
     except grpc.RpcError as e:
+        if e.code() == grpc.StatusCode.NOT_FOUND:
+            return "File not found", 404
+        if e.code() == grpc.StatusCode.OUT_OF_RANGE:
+            return "Requested range not satisfiable", 416
         return grpc_client.handle_grpc_error(e)
+
+    start = first.offset
+    end = first.file_size if stop is None else min(stop, first.file_size)
+    if byte_range and start >= end:
+        chunks.cancel()
+        return Response("Requested range not satisfiable", 416, {"Content-Range": f"bytes */{first.file_size}"})
+
+    def stream():
+        yield first.data
+        for chunk in chunks:
+            yield chunk.data
+
+    headers = {
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+        "Content-Length": str(end - start),
+        "Accept-Ranges": "bytes",
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{first.file_size}"
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return Response(stream(), 206 if byte_range else 200, headers, mimetype=mimetype)
     
 
 def save_assignment(file):
@@ -107,14 +107,14 @@ def render_queries_get():
         if role == 'teacher':
             teachers = []  # No teachers list needed if the user is a teacher
             request_data = lms_pb2.Query()
-            query_response = grpc_client.stub.Get(lms_pb2.GetRequest(
+            query_response = grpc_client.read_stub.Get(lms_pb2.GetRequest(
                 token=session['token'],
                 query_teacher=request_data
             ))
         elif role == 'student':
             teachers = grpc_client.fetch_teachers_via_grpc()  # Fetch teachers for the student to select from
             request_data = lms_pb2.Query()
-            query_response = grpc_client.stub.Get(lms_pb2.GetRequest(
+            query_response = grpc_client.read_stub.Get(lms_pb2.GetRequest(
                 token=session['token'],
                 query_last=request_data
             ))
@@ -149,7 +149,7 @@ def render_queries_get():
 
         # Send the gRPC request to get course_materials
         request_data = lms_pb2.CourseMaterial()
-        response = grpc_client.stub.Get(lms_pb2.GetRequest(
+        response = grpc_client.read_stub.Get(lms_pb2.GetRequest(
             token=session['token'],
             content=request_data
         ))
@@ -0,0 +1,128 @@
+import asyncio
+import grpc
+import logging
+import os
+from conts import ANTI_ENTROPY_INTERVAL, FILE_STORAGE_DIR
+from file_catalog import HEX_DIGITS, TREE_DEPTH, FileCatalog, file_catalog
+from file_transfer import ChecksumMismatch, write_chunks
+from lms_pb2 import CatalogTreeRequest, FetchFileRequest
+from raft import RaftNode, raft_service
+from typing import List, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Anti-entropy: every node periodically compares its file catalog with each peer's and fetches the
+# files it is missing, so a node that was down or cut off when a file was copied still gets it.
+# Catalogs are compared top-down by their Merkle trees, one tree level per round trip, descending
+# only into subtrees whose hashes differ; matching catalogs cost a single round trip. A differing
+# subtree small enough on the peer is listed whole rather than descended into.
+LISTING_LIMIT = 256  # Most files on the peer under a differing subtree that is listed without descending
+MAX_LISTING = 10000  # Most entries asked for in one listing, keeping replies well under the message size limit
+FETCH_CONCURRENCY = 8  # Files fetched from a peer at once
+
+
+class FileAntiEntropy:
+    """Pulls the files a node is missing from its peers, from the Raft node's event loop."""
+
+    def __init__(self, raft_node: RaftNode, catalog: FileCatalog, interval: float = ANTI_ENTROPY_INTERVAL):
+        self.raft = raft_node
+        self.catalog = catalog
+        self.interval = interval
+        self.raft._call(self._start())
+
+    async def _start(self):
+        self.raft._spawn(self._run())
+
+    async def _run(self):
+        """Background task that syncs with every peer in turn, once per interval."""
+        while True:
+            await asyncio.sleep(self.interval)
+            for peer in list(self.raft.peers):
+                try:
+                    await self.sync_with(peer)
+                except grpc.RpcError as e:
+                    logger.info(f"Anti-entropy with {peer} skipped: {e.code()}")
+
+    async def _differing_subtrees(self, peer: str) -> List[Tuple[str, int]]:
+        """Subtrees under which the peer has files this node lacks or holds differently, with the peer's file count."""
+        stub = self.raft._get_stub(peer)
+        prefixes = [""]
+        differing = []
+        while prefixes:
+            response = await stub.GetCatalogTree(CatalogTreeRequest(prefixes=prefixes), timeout=self.raft.rpc_timeout)
+            local = await self.raft.loop.run_in_executor(None, self.catalog.tree_nodes, prefixes)
+            descend = []
+            for prefix, remote, count, (mine, _) in zip(prefixes, response.hashes, response.counts, local):
+                if not remote or remote == mine:
+                    continue
+                if len(prefix) == TREE_DEPTH or count <= LISTING_LIMIT:
+                    differing.append((prefix, count))
+                else:
+                    descend.append(prefix)
+            prefixes = [prefix + digit for prefix in descend for digit in HEX_DIGITS]
+        return differing
+
+    async def sync_with(self, peer: str):
+        """Fetch every file the peer has and this node does not."""
+        subtrees = await self._differing_subtrees(peer)
+        # List the differing subtrees in batches of at most MAX_LISTING entries
+        batches = [[]]
+        listed = 0
+        for prefix, count in subtrees:
+            if batches[-1] and listed + count > MAX_LISTING:
+                batches.append([])
+                listed = 0
+            batches[-1].append(prefix)
+            listed += count
+        fetching = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def fetch(entry) -> bool:
+            async with fetching:
+                return await self._fetch(peer, entry)
+
+        fetched = 0
+        for batch in batches:
+            if not batch:
+                continue
+            response = await self.raft._get_stub(peer).GetCatalogEntries(
+                CatalogTreeRequest(prefixes=batch), timeout=self.raft.rpc_timeout
+            )
+            missing = []
+            for entry in response.entries:
+                local = self.catalog.get(entry.filename)
+                if local is None:
+                    missing.append(entry)
+                elif local != (entry.size, entry.sha256):
+                    # File names are unique, so this is damage on one side; keep the local copy and report it
+                    logger.warning(f"{entry.filename} differs from the copy on {peer}: local {local}, peer {(entry.size, entry.sha256)}")
+            fetched += sum(await asyncio.gather(*(fetch(entry) for entry in missing)))
+        if fetched:
+            logger.info(f"Anti-entropy fetched {fetched} missing files from {peer}")
+
+    async def _fetch(self, peer: str, entry) -> bool:
+        """Stream one file from a peer into the storage directory and add it to the catalog."""
+        call = self.raft._get_stub(peer).FetchFile(FetchFileRequest(filename=entry.filename), timeout=self.raft.upload_timeout)
+
+        def receive():
+            # Runs off the event loop, pulling each chunk from the stream on the loop
+            def chunks():
+                while True:
+                    response = asyncio.run_coroutine_threadsafe(call.read(), self.raft.loop).result()
+                    if response is grpc.aio.EOF:
+                        return
+                    yield response.data, response.checksum
+            return write_chunks(chunks(), os.path.join(FILE_STORAGE_DIR, entry.filename))
+
+        try:
+            size, digest = await self.raft.loop.run_in_executor(None, receive)
+        except (grpc.RpcError, ChecksumMismatch) as e:
+            logger.warning(f"Failed to fetch {entry.filename} from {peer}: {e}")
+            return False
+        if (size, digest) != (entry.size, entry.sha256):
+            logger.warning(f"Fetched {entry.filename} from {peer} but it does not match the peer's catalog")
+        self.catalog.add(entry.filename, size, digest)
+        return True
+
+
+anti_entropy = FileAntiEntropy(raft_service, file_catalog)
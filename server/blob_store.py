@@ -0,0 +1,82 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import uuid
+import zlib
+from conts import FILE_CHUNK_SIZE, FILE_STORAGE_DIR
+from file_catalog import FileCatalog, file_catalog
+from file_transfer import ChecksumMismatch, write_chunks
+from typing import Iterable, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Uploaded files are content-addressed: each is stored once, named by the SHA-256 hex digest of its
+# bytes, however many assignments and course materials point at it. Uploading content that is already
+# stored writes and replicates nothing. Blobs live at the top level of the storage directory like any
+# other stored file, so the catalog, replication and anti-entropy treat them the same way.
+
+
+class BlobStore:
+    """Files in the storage directory named by the SHA-256 of their content."""
+
+    def __init__(self, storage_dir: str, catalog: FileCatalog, node_name: str):
+        self.storage_dir = storage_dir
+        self.catalog = catalog
+        # Uploads are received here until their digest is known; the catalog ignores subdirectories.
+        # Each node has its own, so clearing it never touches uploads another node is receiving
+        self.incoming_dir = os.path.join(storage_dir, ".incoming", node_name)
+        self.lock = threading.Lock()  # Makes the check for a blob and its creation one step
+        shutil.rmtree(self.incoming_dir, ignore_errors=True)  # This node's uploads cut short by a restart
+        os.makedirs(self.incoming_dir, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.storage_dir, digest)
+
+    def exists(self, digest: str) -> bool:
+        return self.catalog.get(digest) is not None
+
+    def put(self, data: bytes) -> Tuple[str, bool]:
+        """Store a file held in memory. Returns its SHA-256 and whether it was new; known content is not written."""
+        digest = hashlib.sha256(data).hexdigest()
+        if self.exists(digest):
+            return digest, False
+        return self.put_chunks([(data, zlib.crc32(data))])
+
+    def put_chunks(self, chunks: Iterable[Tuple[bytes, int]]) -> Tuple[str, bool]:
+        """Store a file from (data, running CRC32) chunks as they arrive. Raises ChecksumMismatch.
+
+        Returns its SHA-256 and whether it was new. Known content is received, then dropped.
+        """
+        incoming_path = os.path.join(self.incoming_dir, uuid.uuid4().hex)
+        size, digest = write_chunks(chunks, incoming_path)
+        return self._publish(incoming_path, size, digest)
+
+    def put_file(self, file_path: str, sha256: Optional[str] = None) -> Tuple[str, bool]:
+        """Move a complete file on the same filesystem into the store. Returns its SHA-256 and whether it was new.
+
+        Known content is deleted instead. If sha256 is given and the file does not match it,
+        ChecksumMismatch is raised and the file is left where it is.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for data in iter(lambda: f.read(FILE_CHUNK_SIZE), b''):
+                digest.update(data)
+            os.fsync(f.fileno())
+        if sha256 is not None and digest.hexdigest() != sha256:
+            raise ChecksumMismatch(f"{os.path.basename(file_path)} does not match its SHA-256")
+        return self._publish(file_path, os.path.getsize(file_path), digest.hexdigest())
+
+    def _publish(self, file_path: str, size: int, digest: str) -> Tuple[str, bool]:
+        with self.lock:
+            if self.exists(digest):
+                os.remove(file_path)
+                return digest, False
+            os.replace(file_path, self.path(digest))
+            self.catalog.add(digest, size, digest)
+        return digest, True
+
+
+blob_store = BlobStore(str(FILE_STORAGE_DIR), file_catalog, os.getenv("SERVER_NAME", "local"))
@@ -0,0 +1,202 @@
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from typing import Optional
+from bson.objectid import ObjectId
+from database import (
+    register_user, add_assignment, update_assignment, add_student_feedback,
+    add_course_material, create_query, update_query, create_session, delete_session
+)
+
+import hashlib
+import json
+
+# Every database mutation is replicated through the Raft log as one of these commands and applied
+# on each node in log order. Ids and timestamps are fixed when the leader creates the command, so
+# every replica writes identical documents and re-applying a command after a restart is harmless.
+# Commands on course data define shard_key(), the teacher whose Raft group replicates them.
+
+def _new_id() -> str:
+    return str(ObjectId())
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+def _id_for_upload(upload_id: str) -> str:
+    """Id of the record a resumable upload is finalized into: the same each time the finalize is retried."""
+    return hashlib.sha256(upload_id.encode()).hexdigest()[:24]
+
+@dataclass
+class RegisterUser:
+    username: str
+    password: str
+    role: str
+    name: str
+
+    def apply(self) -> bool:
+        return register_user(self.username, self.password, self.role, self.name)
+
+@dataclass
+class AddAssignment:
+    student_name: str
+    teacher_name: str
+    filename: str
+    file_path: str
+    file_id: str
+    grade: Optional[str] = None
+    feedback_text: Optional[str] = None
+    assignment_id: str = field(default_factory=_new_id)
+    submission_date: str = field(default_factory=_now)
+    upload_id: Optional[str] = None  # Resumable upload the file came from, which fixes assignment_id
+
+    def __post_init__(self):
+        if self.upload_id:
+            self.assignment_id = _id_for_upload(self.upload_id)
+
+    def shard_key(self) -> str:
+        return self.teacher_name
+
+    def apply(self) -> str:
+        return add_assignment(
+            student_name=self.student_name,
+            teacher_name=self.teacher_name,
+            filename=self.filename,
+            file_path=self.file_path,
+            file_id=self.file_id,
+            grade=self.grade,
+            feedback_text=self.feedback_text,
+            assignment_id=self.assignment_id,
+            submission_date=datetime.fromisoformat(self.submission_date)
+        )
+
+@dataclass
+class UpdateAssignment:
+    assignment_id: str
+    grade: Optional[str] = None
+    feedback_text: Optional[str] = None
+    teacher_name: Optional[str] = None  # Teacher of the assignment, which routes the update to the group holding it
+
+    def shard_key(self) -> str:
+        return self.teacher_name
+
+    def apply(self) -> int:
+        result = update_assignment(self.assignment_id, grade=self.grade, feedback_text=self.feedback_text)
+        return result.matched_count
+
+@dataclass
+class AddStudentFeedback:
+    feedback_text: str
+    student_name: Optional[str] = None
+    teacher_name: Optional[str] = None
+    feedback_id: str = field(default_factory=_new_id)
+    submission_date: str = field(default_factory=_now)
+
+    def shard_key(self) -> str:
+        return self.teacher_name
+
+    def apply(self) -> Optional[str]:
+        return add_student_feedback(
+            student_name=self.student_name,
+            teacher_name=self.teacher_name,
+            feedback_text=self.feedback_text,
+            feedback_id=self.feedback_id,
+            submission_date=datetime.fromisoformat(self.submission_date)
+        )
+
+@dataclass
+class AddCourseMaterial:
+    filename: str
+    file_path: str
+    file_id: str
+    teacher_name: str
+    course_name: Optional[str] = None
+    material_id: str = field(default_factory=_new_id)
+    upload_date: str = field(default_factory=_now)
+    upload_id: Optional[str] = None  # Resumable upload the file came from, which fixes material_id
+
+    def __post_init__(self):
+        if self.upload_id:
+            self.material_id = _id_for_upload(self.upload_id)
+
+    def shard_key(self) -> str:
+        return self.teacher_name
+
+    def apply(self) -> str:
+        return add_course_material(
+            filename=self.filename,
+            file_path=self.file_path,
+            file_id=self.file_id,
+            teacher_name=self.teacher_name,
+            course_name=self.course_name,
+            material_id=self.material_id,
+            upload_date=datetime.fromisoformat(self.upload_date)
+        )
+
+@dataclass
+class CreateQuery:
+    student_name: str
+    teacher_name: str
+    query_text: str
+    query_type: str
+    context_file_path: str
+    query_id: str = field(default_factory=_new_id)
+    date: str = field(default_factory=_now)
+
+    def shard_key(self) -> str:
+        return self.teacher_name
+
+    def apply(self) -> str:
+        return create_query(
+            student_name=self.student_name,
+            teacher_name=self.teacher_name,
+            query_text=self.query_text,
+            query_type=self.query_type,
+            context_file_path=self.context_file_path,
+            query_id=self.query_id,
+            date=datetime.fromisoformat(self.date)
+        )
+
+@dataclass
+class UpdateQuery:
+    query_id: str
+    answer_text: str
+    teacher_name: Optional[str] = None  # Teacher the query was addressed to, which routes the update to the group holding it
+
+    def shard_key(self) -> str:
+        return self.teacher_name
+
+    def apply(self) -> int:
+        result = update_query(self.query_id, self.answer_text)
+        return result.matched_count
+
+@dataclass
+class CreateSession:
+    token: str
+    username: str
+    role: str
+
+    def apply(self):
+        create_session(self.token, self.username, self.role)
+
+@dataclass
+class DeleteSession:
+    token: str
+
+    def apply(self) -> bool:
+        return delete_session(self.token)
+
+COMMAND_TYPES = {command.__name__: command for command in (
+    RegisterUser, AddAssignment, UpdateAssignment, AddStudentFeedback,
+    AddCourseMaterial, CreateQuery, UpdateQuery, CreateSession, DeleteSession
+)}
+
+def encode_command(command) -> str:
+    """Serialize a command into the data of a Raft log entry."""
+    return json.dumps({"type": type(command).__name__, "args": asdict(command)})
+
+def decode_command(data: str):
+    """Rebuild the command stored in a Raft log entry. Raises ValueError if the entry is not a command."""
+    try:
+        payload = json.loads(data)
+        return COMMAND_TYPES[payload["type"]](**payload["args"])
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"Not a command: {data[:80]!r}") from e
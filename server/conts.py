@@ -2,5 +2,27 @@ import os
 from pathlib import Path
 FILE_STORAGE_DIR =  Path("documents")
 FILE_STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+RAFT_LOG_DIR = os.getenv("RAFT_LOG_DIR", "/app/logs")
+RAFT_HEARTBEAT_INTERVAL = float(os.getenv("RAFT_HEARTBEAT_INTERVAL", "0.1"))  # Seconds between leader heartbeats
+RAFT_ELECTION_TIMEOUT_MIN = float(os.getenv("RAFT_ELECTION_TIMEOUT_MIN", "0.3"))  # Election timeout is drawn from [min, max] seconds
+RAFT_ELECTION_TIMEOUT_MAX = float(os.getenv("RAFT_ELECTION_TIMEOUT_MAX", "0.6"))
+RAFT_LEADER_LEASE = os.getenv("RAFT_LEADER_LEASE", "false").lower() == "true"  # Serve reads on the leader lease instead of a heartbeat round
+RAFT_INITIAL_MEMBERS = os.getenv("RAFT_INITIAL_MEMBERS", "lms_server_1:5000,lms_server_2:5000,lms_server_3:5000").split(",")  # Voters of a brand-new cluster
+RAFT_COURSE_GROUPS = int(os.getenv("RAFT_COURSE_GROUPS", "0"))  # Raft groups that course data is sharded across, besides the meta group
+RAFT_APPEND_WINDOW = int(os.getenv("RAFT_APPEND_WINDOW", "8"))  # AppendEntries frames a leader may have in flight to one peer
+FILE_CHUNK_SIZE = int(os.getenv("FILE_CHUNK_SIZE", str(64 * 1024)))  # Bytes per chunk when a node streams a file
+FILE_SYNC_REPLICAS = int(os.getenv("FILE_SYNC_REPLICAS", "1"))  # Peers that must hold an uploaded file before the upload succeeds
+DOCUMENT_CACHE_BYTES = int(os.getenv("DOCUMENT_CACHE_BYTES", str(256 << 20)))  # Memory for caching downloaded files; 0 turns the cache off
+DOCUMENT_CACHE_MAX_FILE_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_FILE_BYTES", str(16 << 20)))  # Larger files are always streamed from disk
+STORAGE_COLD_AFTER_DAYS = float(os.getenv("STORAGE_COLD_AFTER_DAYS", "30"))  # Days without a download before a stored file is compressed; 0 keeps every file raw
+STORAGE_TIER_INTERVAL = float(os.getenv("STORAGE_TIER_INTERVAL", "3600"))  # Seconds between sweeps that move files between storage tiers
+FILE_SERVER_PORT = int(os.getenv("FILE_SERVER_PORT", "8080"))  # Port of the HTTP server that sends stored files to signed URLs
+FILE_SERVER_URL = os.getenv("FILE_SERVER_URL", f"http://{os.getenv('SERVER_NAME', 'localhost')}:{FILE_SERVER_PORT}")  # Base of the signed URLs this node issues, as browsers reach it
+FILE_SERVER_THREADS = int(os.getenv("FILE_SERVER_THREADS", "16"))  # Downloads the file server sends at once
+FILE_URL_SECRET = os.getenv("FILE_URL_SECRET", "")  # Key every node signs download URLs with; empty turns signed URLs and the file server off
+FILE_URL_TTL = int(os.getenv("FILE_URL_TTL", "300"))  # Seconds a signed download URL stays valid
+UPLOAD_SESSION_EXPIRY_HOURS = float(os.getenv("UPLOAD_SESSION_EXPIRY_HOURS", "24"))  # Hours without a chunk before an unfinished upload is deleted
+UPLOAD_SESSION_GC_INTERVAL = float(os.getenv("UPLOAD_SESSION_GC_INTERVAL", "600"))  # Seconds between sweeps for abandoned uploads
+ANTI_ENTROPY_INTERVAL = float(os.getenv("ANTI_ENTROPY_INTERVAL", "30"))  # Seconds between file catalog comparisons with the peers
 LLM_URL = os.getenv("OLLAMA_URI", "http://localhost:11434")
 LLM_ENDPOINT =LLM_URL + "/api/generate"
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pymongo import MongoClient
 from bson.objectid import ObjectId
+import bson
 import os
 import logging
 from datetime import datetime
@@ -12,15 +13,20 @@ logger = logging.getLogger(__name__)
 
 # Establish connection to MongoDB
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongo:27017/lms_db")
+# Each Raft node applies the replicated log to its own database, so replicas never share state
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", f"lms_db_{os.getenv('SERVER_NAME', 'local')}")
 client = MongoClient(MONGO_URI)
 
 # Select database and collections
-db = client.lms_db
+db = client[MONGO_DB_NAME]
 users_collection = db.users
 assignments_collection = db.assignments
 course_materials_collection = db.course_materials
 feedback_collection = db.feedback
 queries_collection = db.queries
+sessions_collection = db.sessions
+COLLECTIONS = [users_collection, assignments_collection, course_materials_collection, feedback_collection, queries_collection,
+               sessions_collection]
 
 def save_file(file_data, filename):
     """Save the file data to a specified directory."""
@@ -31,12 +37,12 @@ def save_file(file_data, filename):
     return file_path
 
 def register_user(username, password, role, name):
-    existing_user = users_collection.find_one({"username": username})
-    if existing_user:
+    user = User(username=username, password=password, role=role, name=name)
+    # Insert only if the username is free, as one atomic step
+    result = users_collection.update_one({"username": username}, {"$setOnInsert": user.to_dict()}, upsert=True)
+    if result.upserted_id is None:
         logger.info(f"User already exists: {username}")
         return False
-    user = User(username=username, password=password, role=role, name=name)
-    users_collection.insert_one(user.to_dict())
     logger.info(f"User registered successfully: {username}")
     return True
 
@@ -44,20 +50,42 @@ def find_user(username):
     logger.info(f"Finding user for username: {username}")
     return users_collection.find_one({"username": username})
 
+# Sessions are replicated like any other data, so every node can authenticate the reads it serves
+def create_session(token, username, role):
+    sessions_collection.update_one({"token": token}, {"$set": {"username": username, "role": role}}, upsert=True)
+    logger.info(f"Session created for user: {username}")
+
+def find_session(token):
+    if not token:
+        return None
+    return sessions_collection.find_one({"token": token}, {"_id": 0, "username": 1, "role": 1})
+
+def delete_session(token):
+    return sessions_collection.delete_one({"token": token}).deleted_count > 0
+
 # Assignments
-def add_assignment(student_name, teacher_name, filename, file_path, file_id, grade=None, feedback_text=None):
+def _upsert(collection, document_id, document):
+    """Write a document under a fixed id unless one is already there, so applying the same command twice,
+    or a retry of it, leaves the first copy and any later updates to it."""
+    document_id = ObjectId(document_id) if document_id else ObjectId()
+    collection.update_one({"_id": document_id}, {"$setOnInsert": document}, upsert=True)
+    return document_id
+
+def add_assignment(student_name, teacher_name, filename, file_path, file_id, grade=None, feedback_text=None,
+                   assignment_id=None, submission_date=None):
     assignment = Assignment(
         student_name=student_name,
         teacher_name=teacher_name,
         filename=filename,
         file_path=file_path,
         file_id=file_id,
-        submission_date=datetime.now(),
+        submission_date=submission_date or datetime.now(),
         grade=grade,
         feedback_text=feedback_text,
     )
-    assignments_collection.insert_one(assignment.to_dict())
+    assignment_id = _upsert(assignments_collection, assignment_id, assignment.to_dict())
     logger.info(f"Assignment added for student: {student_name}")
+    return str(assignment_id)
 
 def get_assignments(student_name=None, teacher_name=None):
     query = {}
@@ -82,6 +110,13 @@ def get_assignments(student_name=None, teacher_name=None):
                                     }))
 
 
+def find_assignment_teacher(assignment_id):
+    """Teacher of an assignment, or None if this node has no such assignment."""
+    if not ObjectId.is_valid(assignment_id):
+        return None
+    assignment = assignments_collection.find_one({"_id": ObjectId(assignment_id)}, {"teacher_name": 1})
+    return assignment.get("teacher_name") if assignment else None
+
 def update_assignment(assignment_id, grade=None, feedback_text=None):
     update_fields = {}
     
@@ -101,7 +136,7 @@ def update_assignment(assignment_id, grade=None, feedback_text=None):
     
     return result
 
-def add_student_feedback(student_name=None, teacher_name=None, feedback_text=None):
+def add_student_feedback(student_name=None, teacher_name=None, feedback_text=None, feedback_id=None, submission_date=None):
     if not student_name and not teacher_name:
         logger.warning("Feedback must be associated with either a student or a teacher.")
         return None
@@ -110,9 +145,9 @@ def add_student_feedback(student_name=None, teacher_name=None, feedback_text=Non
         student_name=student_name,
         teacher_name=teacher_name,
         feedback_text=feedback_text,
-        submission_date=datetime.now()
+        submission_date=submission_date or datetime.now()
     )
-    feedback_doc_id = feedback_collection.insert_one(feedback.to_dict()).inserted_id
+    feedback_doc_id = _upsert(feedback_collection, feedback_id, feedback.to_dict())
     logger.info(f"Feedback added: {feedback_text}")
     return feedback_doc_id
 
@@ -135,17 +170,23 @@ def get_student_feedback(student_name=None, teacher_name=None):
                                                  "teacher_name": 1
                                                  }))
 
-def add_course_material(filename, file_path, file_id, teacher_name, course_name=None):
+def add_course_material(filename, file_path, file_id, teacher_name, course_name=None, material_id=None, upload_date=None):
     course_material = CourseMaterial(
         course_name=course_name,
         filename=filename,
         file_path=file_path,
         file_id = file_id,
         teacher_name=teacher_name,
-        upload_date=datetime.now()
+        upload_date=upload_date or datetime.now()
     )
-    course_materials_collection.insert_one(course_material.to_dict())
+    material_id = _upsert(course_materials_collection, material_id, course_material.to_dict())
     logger.info(f"Course material added by teacher: {teacher_name}")
+    return str(material_id)
+
+def count_file_references(file_path):
+    """Number of assignments and course materials that point at a stored file."""
+    return sum(collection.count_documents({"file_path": file_path})
+               for collection in (assignments_collection, course_materials_collection))
 
 # def get_course_materials_by_teacher(teacher_name):
 #     logger.info(f"Fetching course materials for teacher: {teacher_name}")
@@ -171,14 +212,12 @@ def get_course_materials():
                                     }))
 
 def get_student_name_from_token(token):
-    # Assuming you have a way to map token to the student's username
-    user = users_collection.find_one({"token": token})
-    return user["username"] if user else None
+    session = find_session(token)
+    return session["username"] if session else None
 
 def get_teacher_name_from_token(token):
-    # Assuming you have a way to map token to the student's username
-    user = users_collection.find_one({"token": token})
-    return user["username"] if user else None
+    session = find_session(token)
+    return session["username"] if session else None
 
 def get_all_students():
     """
@@ -264,7 +303,7 @@ def get_queries_by_teacher():
         logger.info(f"Error fetching queries from MongoDB: {e}")
         return []
 
-def create_query(student_name, teacher_name, query_text, query_type, context_file_path)->str:
+def create_query(student_name, teacher_name, query_text, query_type, context_file_path, query_id=None, date=None)->str:
     """
     Creates a new query in the MongoDB collection.
     Returns the ID of the inserted document.
@@ -275,15 +314,24 @@ def create_query(student_name, teacher_name, query_text, query_type, context_fil
             teacher_name=teacher_name,
             query_text=query_text,
             query_type=query_type,
-            date=datetime.now(),
+            date=date or datetime.now(),
             context_file_path=context_file_path
         )
-        query_doc_id = queries_collection.insert_one(query.to_dict()).inserted_id
+        query_doc_id = _upsert(queries_collection, query_id, query.to_dict())
         logger.info(f"Query created: {query_text}")
         return str(query_doc_id)
 
     except Exception as e:
-        logger.info(f"Error creating query in MongoDB: {e}")
+        # Raise so the Raft applier retries the command instead of skipping it on this replica
+        logger.error(f"Error creating query in MongoDB: {e}")
+        raise
+
+def find_query_teacher(query_id):
+    """Teacher a query was addressed to, or None if this node has no such query."""
+    if not ObjectId.is_valid(query_id):
+        return None
+    query = queries_collection.find_one({"_id": ObjectId(query_id)}, {"teacher_name": 1})
+    return query.get("teacher_name") if query else None
 
 def update_query(query_id, answer_text):
     update_fields = {}
@@ -303,3 +351,32 @@ def update_query(query_id, answer_text):
     )
     
     return result
+
+def dump_database(owns=None) -> bytes:
+    """Serialize every collection as a sequence of BSON documents, for a Raft snapshot.
+
+    owns(collection_name, document), if given, selects the documents to include.
+    """
+    return b"".join(
+        bson.encode({"collection": collection.name, "document": document})
+        for collection in COLLECTIONS for document in collection.find()
+        if owns is None or owns(collection.name, document)
+    )
+
+def load_database(data: bytes, owns=None):
+    """Replace the contents of every collection with a snapshot taken by dump_database.
+
+    With owns, only the documents it selects are replaced; the others belong to other Raft groups.
+    """
+    documents = {collection.name: [] for collection in COLLECTIONS}
+    for record in bson.decode_all(data):
+        documents[record["collection"]].append(record["document"])
+    for collection in COLLECTIONS:
+        if owns is None:
+            collection.delete_many({})
+        else:
+            owned = [document["_id"] for document in collection.find({}, {"teacher_name": 1}) if owns(collection.name, document)]
+            collection.delete_many({"_id": {"$in": owned}})
+        if documents[collection.name]:
+            collection.insert_many(documents[collection.name])
+    logger.info(f"Database restored from snapshot: {sum(len(d) for d in documents.values())} documents")
@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from conts import DOCUMENT_CACHE_BYTES, DOCUMENT_CACHE_MAX_FILE_BYTES, FILE_CHUNK_SIZE, FILE_STORAGE_DIR
+from file_catalog import file_catalog
+from file_transfer import stored_size
+from lms_pb2 import DocumentCacheResponse
+from storage_tiers import storage_tiers
+from typing import Dict, Iterator, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Downloaded files are kept in memory, up to a byte budget, so a document the whole class downloads
+# during a lecture is read from disk once. A file is cached on its second download: a file fetched
+# only once, like most submissions, is streamed from disk and never displaces a hot one. Concurrent
+# misses on the same file share a single read. An entry is dropped as soon as the catalog records a
+# new version of its file.
+SEEN_LIMIT = 10000  # Files remembered as downloaded once, waiting for a second download to be cached
+
+
+class DocumentCache:
+    """Byte-budgeted LRU cache of whole stored files, for the download path."""
+
+    def __init__(self, budget: int = DOCUMENT_CACHE_BYTES, max_file_size: int = DOCUMENT_CACHE_MAX_FILE_BYTES):
+        self.budget = budget
+        self.max_file_size = max_file_size
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, bytes] = OrderedDict()  # By file path, least recently used first
+        self.size = 0  # Bytes in entries
+        self.seen: OrderedDict[str, None] = OrderedDict()  # Files downloaded once and not cached
+        self.loading: Dict[str, Future] = {}  # Reads in progress, shared by every miss on the same file
+        self.version = 0  # Bumped on every invalidation, so a read that raced with one is not cached
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0  # Bytes of downloads served from memory
+        self.evictions = 0
+
+    def get(self, file_path: str) -> Optional[bytes]:
+        """Contents of a stored file, or None if the caller should stream it from disk.
+
+        A miss returns None the first time a file is asked for. After that, it reads the whole
+        file into the cache, unless it is larger than max_file_size or not stored.
+        """
+        if self.budget <= 0:
+            return None
+        key = os.path.normpath(file_path)
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                self.bytes_served += len(data)
+            else:
+                self.misses += 1
+                loading = self.loading.get(key)
+                if loading is None and key not in self.seen:
+                    self.seen[key] = None
+                    if len(self.seen) > SEEN_LIMIT:
+                        self.seen.popitem(last=False)
+                    return None
+                reading = loading is None  # This miss reads the file; any other waits for it
+                if reading:
+                    loading = self.loading[key] = Future()
+                    version = self.version
+        if data is not None:
+            storage_tiers.touch(file_path)
+            return data
+        if not reading:
+            return loading.result()
+
+        try:
+            data = self._load(file_path)
+            with self.lock:
+                if data is not None and version == self.version:
+                    self._admit(key, data)
+            loading.set_result(data)
+            return data
+        except BaseException as e:
+            loading.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.loading[key]
+
+    def _load(self, file_path: str) -> Optional[bytes]:
+        try:
+            size = stored_size(file_path)
+        except FileNotFoundError:
+            return None
+        if size > self.max_file_size:
+            return None
+        return b"".join(data for _, data in storage_tiers.read_range(file_path, 0, size))
+
+    def _admit(self, key: str, data: bytes):
+        """Add an entry, evicting the least recently used ones to stay within the budget."""
+        self.seen.pop(key, None)
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.budget:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def invalidate(self, filename: str):
+        """Drop the cached copy of a stored file that has just been written."""
+        key = os.path.normpath(os.path.join(FILE_STORAGE_DIR, filename))
+        with self.lock:
+            self.version += 1
+            data = self.entries.pop(key, None)
+            if data is not None:
+                self.size -= len(data)
+
+    def stats(self) -> DocumentCacheResponse:
+        with self.lock:
+            requests = self.hits + self.misses
+            return DocumentCacheResponse(
+                hits=self.hits,
+                misses=self.misses,
+                hit_ratio=self.hits / requests if requests else 0.0,
+                bytes_served=self.bytes_served,
+                files=len(self.entries),
+                cached_bytes=self.size,
+                budget_bytes=self.budget,
+                evictions=self.evictions,
+            )
+
+
+def slice_chunks(data: bytes, offset: int, end: int, chunk_size: int = FILE_CHUNK_SIZE) -> Iterator[Tuple[int, bytes]]:
+    """Like file_transfer.read_range, over a file held in memory."""
+    yield offset, data[offset:min(end, offset + chunk_size)]
+    for chunk_offset in range(offset + chunk_size, end, chunk_size):
+        yield chunk_offset, data[chunk_offset:min(end, chunk_offset + chunk_size)]
+
+
+document_cache = DocumentCache()
+file_catalog.listeners.append(document_cache.invalidate)
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from conts import FILE_STORAGE_DIR, RAFT_LOG_DIR
+from file_transfer import COLD_DIR, open_stored, stored_size
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# The catalog lists every file stored on this node with its size and SHA-256, and arranges the
+# entries in a Merkle tree so two nodes can find the files they differ in without listing them all.
+# A file is placed by the hex digest of its name: the tree has 16 children per node, and the entries
+# sit in the leaves at depth TREE_DEPTH. Two catalogs agree on a subtree exactly when its hashes match.
+TREE_DEPTH = 4
+HEX_DIGITS = "0123456789abcdef"
+
+
+def tree_key(filename: str) -> str:
+    """Leaf of the Merkle tree a file belongs to."""
+    return hashlib.sha256(filename.encode()).hexdigest()[:TREE_DEPTH]
+
+
+def file_digest(file_path: str, chunk_size: int = 1 << 20) -> Tuple[int, str]:
+    """Size and SHA-256 hex digest of the raw bytes of a stored file."""
+    digest = hashlib.sha256()
+    size = 0
+    with open_stored(file_path) as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return size, digest.hexdigest()
+            digest.update(data)
+            size += len(data)
+
+
+class FileCatalog:
+    """Names, sizes and hashes of the files in a storage directory, with a Merkle tree over them.
+
+    Entries are added as files are written and appended to a journal, so a restart only hashes
+    files the journal does not know. Files are never deleted, so the journal only grows; it is
+    rewritten compactly on startup.
+    """
+
+    def __init__(self, storage_dir: str, journal_path: str):
+        self.storage_dir = storage_dir
+        self.journal_path = journal_path
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Tuple[int, str]] = {}  # Filename to (size, SHA-256)
+        self.leaves: Dict[str, Dict[str, Tuple[int, str]]] = {}  # Leaf prefix to the entries under it
+        self.children: Dict[str, Set[str]] = {}  # Prefix to the hex digits of its non-empty children
+        self.subtrees: Dict[str, Tuple[bytes, int]] = {}  # Cached hash and file count per subtree, dropped along the path of each change
+        self.listeners: List[Callable[[str], None]] = []  # Called with the name of every file added or changed
+        os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the catalog from the journal, hashing only files that changed or are not in it."""
+        known: Dict[str, Tuple[int, str]] = {}
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        name, size, digest = json.loads(line)
+                    except ValueError:
+                        break  # A torn last line
+                    known[name] = (size, digest)
+
+        hashed = 0
+        # Raw files first, then cold ones; a file briefly in both tiers is listed once
+        for directory in (self.storage_dir, os.path.join(self.storage_dir, COLD_DIR)):
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as files:
+                for entry in files:
+                    if not entry.is_file() or entry.name.endswith(".part") or entry.name in self.entries:
+                        continue
+                    file_path = os.path.join(self.storage_dir, entry.name)
+                    if known.get(entry.name, (None,))[0] != stored_size(file_path):
+                        known[entry.name] = file_digest(file_path)
+                        hashed += 1
+                    self._insert(entry.name, *known[entry.name])
+
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            for name, (size, digest) in self.entries.items():
+                f.write(json.dumps([name, size, digest]) + "\n")
+        os.replace(tmp_path, self.journal_path)
+        self.journal = open(self.journal_path, 'a')
+        logger.info(f"File catalog loaded: {len(self.entries)} files, {hashed} hashed")
+
+    def _insert(self, name: str, size: int, digest: str):
+        key = tree_key(name)
+        self.entries[name] = (size, digest)
+        self.leaves.setdefault(key, {})[name] = (size, digest)
+        for depth in range(TREE_DEPTH):
+            self.children.setdefault(key[:depth], set()).add(key[depth])
+        for depth in range(TREE_DEPTH + 1):
+            self.subtrees.pop(key[:depth], None)
+
+    def add(self, name: str, size: int, digest: str):
+        """Record a file that has just been written to the storage directory."""
+        with self.lock:
+            if self.entries.get(name) == (size, digest):
+                return
+            self._insert(name, size, digest)
+            self.journal.write(json.dumps([name, size, digest]) + "\n")
+            self.journal.flush()
+        for listener in self.listeners:
+            listener(name)
+
+    def add_file(self, name: str):
+        """Hash a file that has just been written to the storage directory and record it."""
+        self.add(name, *file_digest(os.path.join(self.storage_dir, name)))
+
+    def get(self, name: str) -> Optional[Tuple[int, str]]:
+        with self.lock:
+            return self.entries.get(name)
+
+    def _subtree(self, prefix: str) -> Tuple[bytes, int]:
+        """Hash and number of files of the subtree under a prefix. The hash is empty if it holds no files."""
+        cached = self.subtrees.get(prefix)
+        if cached is None:
+            if len(prefix) == TREE_DEPTH:
+                entries = sorted(self.leaves.get(prefix, {}).items())
+                data = "".join(f"{name}\0{size}\0{digest}\n" for name, (size, digest) in entries).encode()
+                count = len(entries)
+            else:
+                children = [(digit, self._subtree(prefix + digit)) for digit in sorted(self.children.get(prefix, ()))]
+                data = b"".join(digit.encode() + child_hash for digit, (child_hash, _) in children)
+                count = sum(child_count for _, (_, child_count) in children)
+            cached = (hashlib.sha256(data).digest() if data else b"", count)
+            self.subtrees[prefix] = cached
+        return cached
+
+    def tree_nodes(self, prefixes: List[str]) -> List[Tuple[bytes, int]]:
+        """Hash and number of files under each prefix."""
+        with self.lock:
+            return [self._subtree(prefix) for prefix in prefixes]
+
+    def entries_under(self, prefixes: List[str]) -> List[Tuple[str, int, str]]:
+        """(name, size, SHA-256) of every file under the given prefixes."""
+        with self.lock:
+            entries = []
+            pending = list(prefixes)
+            while pending:
+                prefix = pending.pop()
+                if len(prefix) == TREE_DEPTH:
+                    entries.extend((name, size, digest) for name, (size, digest) in self.leaves.get(prefix, {}).items())
+                else:
+                    pending.extend(prefix + digit for digit in self.children.get(prefix, ()))
+            return entries
+
+
+file_catalog = FileCatalog(str(FILE_STORAGE_DIR), os.path.join(RAFT_LOG_DIR, "file_catalog.jsonl"))
@@ -0,0 +1,204 @@
+import asyncio
+import grpc
+import logging
+import os
+import time
+from conts import FILE_STORAGE_DIR, FILE_SYNC_REPLICAS, RAFT_LOG_DIR
+from file_transfer import is_stored, read_chunks, stored_size
+from lms_pb2 import FileReplicationLag, FileReplicationResponse, UploadFileAllRequest
+from raft import RaftNode, raft_service
+from typing import Dict, List, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Uploaded files are not in the Raft log; the node that stores an upload copies it to every peer.
+# The upload is acknowledged once FILE_SYNC_REPLICAS peers hold the file durably. The other copies
+# finish in the background, and any copy that fails is retried until it succeeds, across restarts.
+
+
+class FileReplicationQueue:
+    """Durable record of the file copies still owed to each peer.
+
+    Every pending copy is an empty marker file named after the stored file, in a directory
+    per peer. The marker's modification time is when the copy was queued.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _peer_dir(self, peer: str) -> str:
+        return os.path.join(self.directory, peer)
+
+    def add(self, peers: List[str], filename: str):
+        """Queue a copy of a file for each peer, durably, before any copy is attempted."""
+        for peer in peers:
+            peer_dir = self._peer_dir(peer)
+            os.makedirs(peer_dir, exist_ok=True)
+            open(os.path.join(peer_dir, filename), 'w').close()
+            fd = os.open(peer_dir, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def remove(self, peer: str, filename: str):
+        try:
+            os.remove(os.path.join(self._peer_dir(peer), filename))
+        except FileNotFoundError:
+            pass
+
+    def peers(self) -> List[str]:
+        return os.listdir(self.directory)
+
+    def pending(self, peer: str) -> List[str]:
+        """Files still to be copied to a peer, oldest first."""
+        with os.scandir(self._peer_dir(peer)) as entries:
+            return [entry.name for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime)]
+
+    def drop_peer(self, peer: str):
+        """Forget every copy owed to a peer that left the cluster."""
+        for filename in self.pending(peer):
+            self.remove(peer, filename)
+        os.rmdir(self._peer_dir(peer))
+
+    def lag(self, peer: str) -> FileReplicationLag:
+        """Files and bytes a peer is missing, and how long the oldest of them has waited."""
+        now = time.time()
+        lag = FileReplicationLag(peer=peer)
+        if not os.path.isdir(self._peer_dir(peer)):
+            return lag
+        with os.scandir(self._peer_dir(peer)) as entries:
+            for entry in entries:
+                lag.pending_files += 1
+                lag.oldest_pending_seconds = max(lag.oldest_pending_seconds, now - entry.stat().st_mtime)
+                try:
+                    lag.pending_bytes += stored_size(os.path.join(FILE_STORAGE_DIR, entry.name))
+                except FileNotFoundError:
+                    pass
+        return lag
+
+
+class FileReplicator:
+    """Copies stored files to the peers over the Raft node's channels, from the node's event loop."""
+
+    def __init__(self, raft_node: RaftNode, sync_replicas: int = FILE_SYNC_REPLICAS):
+        self.raft = raft_node
+        self.sync_replicas = sync_replicas  # Peers that must hold a file before its upload is acknowledged
+        self.queue = FileReplicationQueue(os.path.join(RAFT_LOG_DIR, "file_replication"))
+        self.retry_interval = 1.0  # Seconds between retries to a peer, doubled after each failure
+        self.max_retry_interval = 60.0
+        self.copying: Dict[Tuple[str, str], asyncio.Task] = {}  # Copies in progress, by (peer, filename)
+        self.retrying = set()  # Peers whose queue is being worked through
+        self.failures: Dict[str, int] = {}  # Consecutive failed copies per peer
+        self.retry_at: Dict[str, float] = {}  # Loop time before which a failing peer is not retried
+        self.raft._call(self._start())
+
+    async def _start(self):
+        self.raft._spawn(self._run_retries())
+
+    def replicate(self, filename: str) -> bool:
+        """Copy a stored file to every peer, in parallel.
+
+        Returns once sync_replicas peers have it, or False if too few could be reached in time.
+        The remaining copies carry on in the background.
+        """
+        peers = list(self.raft.peers)
+        self.queue.add(peers, filename)
+        required = min(self.sync_replicas, len(peers))
+        copied = self.raft._call(self._replicate(peers, filename, required))
+        if copied < required:
+            logger.warning(f"{filename} reached {copied} of the {required} replicas required; retrying in the background")
+        return copied >= required
+
+    async def _replicate(self, peers: List[str], filename: str, required: int) -> int:
+        pending = {self.raft._spawn(self._copy(peer, filename)) for peer in peers}
+        copied = 0
+        deadline = self.raft.loop.time() + self.raft.upload_timeout
+        while copied < required and pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=deadline - self.raft.loop.time(), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            copied += sum(task.result() for task in done)
+        return copied
+
+    async def _copy(self, peer: str, filename: str) -> bool:
+        """Copy one file to one peer, or wait for the copy already under way. Returns whether the peer stored it."""
+        key = (peer, filename)
+        if key not in self.copying:
+            self.copying[key] = self.raft._spawn(self._transfer(peer, filename))
+            self.copying[key].add_done_callback(lambda task: self.copying.pop(key, None))
+        return await asyncio.shield(self.copying[key])
+
+    async def _transfer(self, peer: str, filename: str) -> bool:
+        """Stream a file to a peer and clear its queue entry once the peer has stored it."""
+        file_path = os.path.join(FILE_STORAGE_DIR, filename)
+        loop = self.raft.loop
+        if not await loop.run_in_executor(None, is_stored, file_path):
+            logger.warning(f"{filename} no longer exists; not copying it to {peer}")
+            await loop.run_in_executor(None, self.queue.remove, peer, filename)
+            return False
+
+        # Disk reads, and inflating a cold file, run off the event loop so the group's heartbeats keep going
+        chunks = read_chunks(file_path)
+
+        async def requests():
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    return
+                data, checksum = chunk
+                yield UploadFileAllRequest(filename=filename, data=data, checksum=checksum)
+
+        try:
+            await self.raft._get_stub(peer).UploadFileAllStream(requests(), timeout=self.raft.upload_timeout)
+        except grpc.RpcError as e:
+            self.failures[peer] = self.failures.get(peer, 0) + 1
+            delay = min(self.max_retry_interval, self.retry_interval * 2 ** self.failures[peer])
+            self.retry_at[peer] = self.raft.loop.time() + delay
+            logger.warning(f"Failed to copy {filename} to {peer}: {e.code()}. Retrying in {delay:.0f}s")
+            return False
+        finally:
+            try:
+                chunks.close()
+            except ValueError:
+                pass  # A read is still running in the executor; the file closes once that read lets go of it
+        await self.raft.loop.run_in_executor(None, self.queue.remove, peer, filename)
+        self.failures.pop(peer, None)
+        self.retry_at.pop(peer, None)
+        return True
+
+    async def _run_retries(self):
+        """Background task that works through the copies still owed to each peer, with backoff per peer."""
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            for peer in await self.raft.loop.run_in_executor(None, self.queue.peers):
+                if self.raft.members and peer not in self.raft.members:
+                    logger.info(f"{peer} left the cluster; dropping the file copies queued for it")
+                    await self.raft.loop.run_in_executor(None, self.queue.drop_peer, peer)
+                elif peer not in self.retrying and self.raft.loop.time() >= self.retry_at.get(peer, 0):
+                    self.raft._spawn(self._retry_peer(peer))
+
+    async def _retry_peer(self, peer: str):
+        self.retrying.add(peer)
+        try:
+            for filename in await self.raft.loop.run_in_executor(None, self.queue.pending, peer):
+                if not await self._copy(peer, filename) and peer in self.retry_at:
+                    break  # The peer is failing; wait for its backoff before trying the rest
+        finally:
+            self.retrying.discard(peer)
+
+    def lag(self) -> FileReplicationResponse:
+        """Replication lag of every peer, and of any former peer still owed files."""
+        lags = []
+        for peer in sorted(set(self.raft.peers) | set(self.queue.peers())):
+            lag = self.queue.lag(peer)
+            lag.consecutive_failures = self.failures.get(peer, 0)
+            lags.append(lag)
+        return FileReplicationResponse(peers=lags)
+
+
+file_replicator = FileReplicator(raft_service)
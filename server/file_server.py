@@ -1,29 +1,109 @@
-from flask import Flask, send_from_directory, abort, request, jsonify
+from conts import FILE_SERVER_URL, FILE_STORAGE_DIR, FILE_URL_SECRET, FILE_URL_TTL
+from file_transfer import TOUCH_INTERVAL, is_stored, read_range, stored_size, touch_stored
+from flask import Flask, abort, request
+from typing import Dict
+from urllib.parse import quote, urlencode
+from werkzeug.datastructures import ContentRange
+from werkzeug.wsgi import wrap_file
+import hashlib
+import hmac
+import mimetypes
 import os
 import logging
+import time
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Every node runs this HTTP server beside its gRPC server, and sends the stored files it holds to
+# browsers. A URL to it is signed by the LMS Download RPC, which checks the user's session; the
+# signature covers the file, the name to save it as and an expiry, so the URL cannot be reused for
+# another file or after it expires. Downloads to the end of a raw file are handed to the WSGI server
+# as an open file, which gunicorn sends with sendfile, without the bytes passing through Python.
+# Cold files and ranges that stop short of the end are streamed in chunks. Stored files never change
+# under their name, so the name is the ETag.
+
 app = Flask(__name__)
+touched: Dict[str, float] = {}  # When each file's last download was last written down
+
+
+def sign_download(filename: str, name: str, expires: int) -> str:
+    message = f"{filename}\0{name}\0{expires}".encode()
+    return hmac.new(FILE_URL_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def signed_url(filename: str, name: str) -> str:
+    """URL that lets its holder download a stored file, saved as name, for FILE_URL_TTL to 2 * FILE_URL_TTL seconds.
+
+    The expiry is rounded up to a multiple of FILE_URL_TTL, so every download of a file within that
+    window gets the same URL, and the browser can revalidate its cached copy instead of fetching it again.
+    """
+    expires = (int(time.time()) // FILE_URL_TTL + 2) * FILE_URL_TTL
+    query = urlencode({"name": name, "expires": expires, "signature": sign_download(filename, name, expires)})
+    return f"{FILE_SERVER_URL}/files/{quote(filename)}?{query}"
 
-# Directory where files are stored
-FILE_STORAGE_DIR = os.getenv("FILE_STORAGE_DIR", "/path/to/storage")
 
-# Ensure the file storage directory exists
-os.makedirs(FILE_STORAGE_DIR, exist_ok=True)
+def touch(file_path: str):
+    """Record a download, as StorageTiers.touch does for downloads over gRPC."""
+    now = time.monotonic()
+    if now - touched.get(file_path, -TOUCH_INTERVAL) >= TOUCH_INTERVAL:
+        touched[file_path] = now
+        touch_stored(file_path)
+
 
 @app.route('/files/<filename>', methods=['GET'])
 def serve_file(filename):
-    logger.debug(f"Request to download file: {filename}")
+    """Send a stored file to the holder of a signed URL, with ETag and single byte range support."""
+    name = request.args.get('name', filename)
+    expires = request.args.get('expires', type=int)
+    signature = request.args.get('signature', '')
+    if not FILE_URL_SECRET or expires is None or not hmac.compare_digest(signature, sign_download(filename, name, expires)):
+        abort(403)
+    if expires < time.time():
+        abort(410)  # The link expired; the LMS issues a new one on the next download
+
     # Sanitize filename to prevent directory traversal
     safe_filename = os.path.basename(filename)
     file_path = os.path.join(FILE_STORAGE_DIR, safe_filename)
-    
-    # Check if file exists
-    if not os.path.isfile(file_path):
-        abort(404)  # File not found
-
-    return send_from_directory(directory=FILE_STORAGE_DIR, filename=safe_filename)
-if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    if safe_filename.startswith('.') or not is_stored(file_path):
+        abort(404)
+    logger.debug(f"Sending file {safe_filename}")
+
+    response = app.response_class(mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream")
+    response.set_etag(safe_filename)
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(name)}"
+    response.headers["Accept-Ranges"] = "bytes"
+    response.cache_control.private = True
+    response.cache_control.max_age = max(0, expires - int(time.time()))
+    if request.if_none_match.contains_weak(safe_filename):
+        response.status_code = 304
+        return response
+
+    file_size = stored_size(file_path)
+    start, end = 0, file_size
+    # Several ranges, or a Range whose If-Range names another version of the file, get the whole file
+    byte_range = request.range
+    if byte_range and byte_range.units == "bytes" and len(byte_range.ranges) == 1 \
+            and request.if_range.etag in (None, safe_filename):
+        byte_range = byte_range.range_for_length(file_size)
+        if byte_range is None:
+            response.status_code = 416
+            response.headers["Content-Range"] = f"bytes */{file_size}"
+            return response
+        start, end = byte_range
+        response.status_code = 206
+        response.content_range = ContentRange("bytes", start, end, file_size)
+
+    touch(file_path)
+    try:
+        f = open(file_path, 'rb') if end == file_size else None
+    except FileNotFoundError:
+        f = None  # The file is cold
+    if f:
+        f.seek(start)
+        response.response = wrap_file(request.environ, f)  # The WSGI server's file wrapper, which uses sendfile
+        response.direct_passthrough = True
+    else:
+        response.response = (data for _, data in read_range(file_path, start, end))
+    response.content_length = end - start
+    return response
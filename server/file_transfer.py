@@ -0,0 +1,221 @@
+import hashlib
+import io
+import logging
+import os
+import struct
+import uuid
+import zlib
+from conts import FILE_CHUNK_SIZE
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Files travel between clients and nodes as a stream of chunks. Each chunk carries the CRC32 of the
+# file up to and including it, so a lost, repeated or corrupted chunk is caught where it happens.
+# Only one chunk is held in memory at a time, whatever the size of the file.
+
+# A stored file is either raw, or cold: compressed with zlib into COLD_DIR beside where the raw file
+# would be. A cold file starts with the size of the raw file, so its size is known without inflating it.
+# Readers open stored files with open_stored and get the raw bytes from either tier.
+COLD_DIR = ".cold"
+COLD_HEADER = struct.Struct("<Q")
+TOUCH_INTERVAL = 3600  # Seconds between updates of a file's last download, which only needs to be right to the day
+
+
+class ChecksumMismatch(Exception):
+    """A received chunk does not match the running checksum the sender computed."""
+
+
+class ColdReader:
+    """Reads the raw bytes of a cold file, inflating only as much as is asked for. Seeks forward only."""
+
+    def __init__(self, path: str, chunk_size: int = FILE_CHUNK_SIZE):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.size, = COLD_HEADER.unpack(self.file.read(COLD_HEADER.size))
+        self.chunk_size = chunk_size
+        self.decompressor = zlib.decompressobj()
+        self.buffer = b""
+        self.position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self.size - self.position
+        while len(self.buffer) < size and not self.decompressor.eof:
+            data = self.decompressor.unconsumed_tail or self.file.read(self.chunk_size)
+            if not data:
+                raise EOFError(f"{self.path} is truncated")
+            self.buffer += self.decompressor.decompress(data, size - len(self.buffer))
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.position += len(data)
+        return data
+
+    def seek(self, offset: int):
+        if offset < self.position:
+            raise io.UnsupportedOperation("Cold files can only be read forward")
+        while self.position < offset and self.read(min(self.chunk_size, offset - self.position)):
+            pass
+
+    def seekable(self) -> bool:
+        return False
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def cold_path(file_path: str) -> str:
+    """Where a stored file lives once it is cold."""
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, COLD_DIR, name)
+
+
+def open_stored(file_path: str) -> BinaryIO:
+    """Open a stored file to read its raw bytes, whichever tier it is in. Raises FileNotFoundError."""
+    try:
+        return open(file_path, 'rb')
+    except FileNotFoundError:
+        return ColdReader(cold_path(file_path))
+
+
+def stored_size(file_path: str) -> int:
+    """Raw size of a stored file, whichever tier it is in. Raises FileNotFoundError."""
+    try:
+        return os.path.getsize(file_path)
+    except FileNotFoundError:
+        with open(cold_path(file_path), 'rb') as f:
+            return COLD_HEADER.unpack(f.read(COLD_HEADER.size))[0]
+
+
+def is_stored(file_path: str) -> bool:
+    return os.path.isfile(file_path) or os.path.isfile(cold_path(file_path))
+
+
+def part_path_for(file_path: str) -> str:
+    """A temporary path, unique to the caller, to write file_path to. The catalog and the tiers skip .part files."""
+    return f"{file_path}.{uuid.uuid4().hex}.part"
+
+
+def touch_stored(file_path: str):
+    """Set the modification time of a stored file, which records its last download, whichever tier it is in."""
+    for path in (file_path, cold_path(file_path)):
+        try:
+            os.utime(path)
+            return
+        except FileNotFoundError:
+            pass  # Not in this tier, or moved between tiers in the meantime
+
+
+def compress_file(file_path: str, max_ratio: float, chunk_size: int = FILE_CHUNK_SIZE) -> Optional[int]:
+    """Move a raw file to the cold tier, keeping its modification time. Returns the compressed size.
+
+    The raw file is removed only once its compressed copy is durable. A file that does not
+    compress below max_ratio of its size stays raw, and None is returned.
+    """
+    path = cold_path(file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    stat = os.stat(file_path)
+    part_path = part_path_for(path)
+    compressor = zlib.compressobj()
+    try:
+        with open(file_path, 'rb') as src, open(part_path, 'wb') as dst:
+            dst.write(COLD_HEADER.pack(stat.st_size))
+            for data in iter(lambda: src.read(chunk_size), b''):
+                dst.write(compressor.compress(data))
+            dst.write(compressor.flush())
+            compressed_size = dst.tell()
+            if compressed_size > max_ratio * stat.st_size:
+                os.remove(part_path)
+                return None
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.utime(part_path, (stat.st_atime, stat.st_mtime))
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    os.remove(file_path)
+    return compressed_size
+
+
+def decompress_file(file_path: str, chunk_size: int = FILE_CHUNK_SIZE):
+    """Move a cold file back to raw, keeping its modification time."""
+    path = cold_path(file_path)
+    stat = os.stat(path)
+    part_path = part_path_for(file_path)
+    try:
+        with ColdReader(path, chunk_size) as src, open(part_path, 'wb') as dst:
+            for data in iter(lambda: src.read(chunk_size), b''):
+                dst.write(data)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.utime(part_path, (stat.st_atime, stat.st_mtime))
+        os.replace(part_path, file_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    os.remove(path)
+
+
+def read_chunks(file_path: str, chunk_size: int = FILE_CHUNK_SIZE) -> Iterator[Tuple[bytes, int]]:
+    """Yield (data, running CRC32) for each chunk of a stored file. An empty file yields one empty chunk."""
+    checksum = 0
+    with open_stored(file_path) as f:
+        data = f.read(chunk_size)
+        while True:
+            checksum = zlib.crc32(data, checksum)
+            yield data, checksum
+            data = f.read(chunk_size)
+            if not data:
+                return
+
+
+def read_range(file_path: str, offset: int, end: int, chunk_size: int = FILE_CHUNK_SIZE) -> Iterator[Tuple[int, bytes]]:
+    """Yield (offset, data) for each chunk of the bytes [offset, end) of a stored file. An empty range yields one empty chunk."""
+    with open_stored(file_path) as f:
+        f.seek(offset)
+        while True:
+            data = f.read(min(chunk_size, end - offset))
+            yield offset, data
+            offset += len(data)
+            if offset >= end or not data:
+                return
+
+
+def write_chunks(chunks: Iterable[Tuple[bytes, int]], file_path: str) -> Tuple[int, str]:
+    """Write (data, running CRC32) chunks to a file as they arrive. Returns its size and SHA-256 hex digest.
+
+    The data goes to a temporary file that replaces file_path only once every chunk has
+    arrived and checked out, so a failed transfer never leaves a partial file behind.
+    Each transfer has its own temporary file, so two copies of the same file arriving at
+    once do not write into each other. Raises ChecksumMismatch if a chunk is corrupt.
+    """
+    part_path = part_path_for(file_path)
+    checksum = 0
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with open(part_path, 'wb') as f:
+            for data, expected in chunks:
+                checksum = zlib.crc32(data, checksum)
+                if checksum != expected:
+                    raise ChecksumMismatch(f"Checksum mismatch at byte {size} of {os.path.basename(file_path)}")
+                f.write(data)
+                digest.update(data)
+                size += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(part_path, file_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return size, digest.hexdigest()
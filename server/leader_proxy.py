@@ -0,0 +1,73 @@
+import grpc
+import lms_pb2_grpc
+import logging
+import threading
+import time
+from peer_channels import CHANNEL_OPTIONS
+from typing import Dict
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+FORWARDED_BY = "x-forwarded-by"  # Set on a forwarded request so it is never forwarded a second time
+LEADER_HINT = "x-leader-address"  # Returned with a forwarded response so the client can go to the leader directly
+
+
+class LeaderProxy:
+    """Forwards client RPCs that only the leader can serve from a follower to the current leader.
+
+    One long-lived channel is kept per leader address and shared by every forwarded call,
+    whichever Raft group the node leads.
+    """
+
+    def __init__(self, raft_node, default_timeout: float = 60):
+        self.raft = raft_node
+        self.default_timeout = default_timeout  # Used when the client set no deadline; uploads can be slow
+        self.leader_wait = raft_node.election_timeout_max * 2  # Long enough to ride out one election
+        self.stubs: Dict[str, lms_pb2_grpc.LMSStub] = {}
+        self.lock = threading.Lock()
+
+    def stub(self, address: str) -> lms_pb2_grpc.LMSStub:
+        """Return the stub for a leader address, opening its channel on first use."""
+        with self.lock:
+            if address not in self.stubs:
+                self.stubs[address] = lms_pb2_grpc.LMSStub(grpc.insecure_channel(address, options=CHANNEL_OPTIONS))
+            return self.stubs[address]
+
+    def forward(self, method: str, request, context, raft_node=None, retry: bool = True):
+        """Send the request to the leader and return its response, or abort the call if that is not possible.
+
+        raft_node is the group whose leader must handle the request; by default the proxy's own group.
+        For a client-streaming method, request is the iterator of incoming messages. It is relayed
+        as it is read and cannot be replayed, so such calls pass retry=False.
+        """
+        raft_node = raft_node or self.raft
+        if any(key == FORWARDED_BY for key, _ in context.invocation_metadata()):
+            context.abort(grpc.StatusCode.UNAVAILABLE, 'Forwarded request reached a node that is not the leader.')
+
+        deadline = time.monotonic() + min(context.time_remaining(), self.default_timeout)
+        unreachable = raft_node.node_address  # While this node is handing over leadership, wait for its successor
+        retried = False
+        while True:
+            leader = raft_node.leader_address(timeout=self.leader_wait, unreachable=unreachable)
+            if leader is None:
+                context.abort(grpc.StatusCode.UNAVAILABLE, 'No leader is available.')
+            try:
+                response = getattr(self.stub(leader), method)(
+                    request,
+                    timeout=max(0, deadline - time.monotonic()),
+                    metadata=((FORWARDED_BY, raft_node.node_id),)
+                )
+                break
+            except grpc.RpcError as e:
+                logger.warning(f"Forwarding {method} to {leader} failed: {e.code()}")
+                if e.code() != grpc.StatusCode.UNAVAILABLE or retried or not retry:
+                    context.abort(e.code(), e.details() or f'Forwarding to the leader {leader} failed.')
+                # The request never reached a working leader; retry once with its successor
+                unreachable = leader
+                retried = True
+
+        if raft_node is self.raft:
+            # The client tracks a single leader, the one of the proxy's own group
+            context.set_trailing_metadata(((LEADER_HINT, leader),))
+        return response
@@ -1,8 +1,9 @@
+import io
 import requests
 import logging
 from PyPDF2 import PdfReader
 from conts import LLM_ENDPOINT
-from pathlib import Path
+from file_transfer import is_stored, open_stored
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -12,10 +13,11 @@ def read_pdf(file_path):
     """Reads text from a PDF file."""
     try:
         text = ""
-        if not Path(file_path).exists():
+        if not is_stored(file_path):
             logger.error(f"File not found: {file_path}")
-        with open(file_path, "rb") as file:
-            reader = PdfReader(file)
+        with open_stored(file_path) as file:
+            # A compressed file can only be read forward, and PdfReader seeks
+            reader = PdfReader(file if file.seekable() else io.BytesIO(file.read()))
             for page in reader.pages:
                 text += page.extract_text() or ""
         return text
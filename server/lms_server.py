@@ -1,23 +1,34 @@
 from authentication import authenticate, generate_token, invalidate_token
 from collection_formats import User, Assignment, Feedback, CourseMaterial  # Import dataclasses
-from conts import FILE_STORAGE_DIR
+from commands import (
+    RegisterUser, AddAssignment, UpdateAssignment, AddStudentFeedback,
+    AddCourseMaterial, CreateQuery, UpdateQuery, CreateSession, DeleteSession, encode_command
+)
+from blob_store import blob_store
+from conts import FILE_URL_SECRET
+from document_cache import document_cache, slice_chunks
+from file_replication import file_replicator
+from file_server import signed_url
+from file_transfer import ChecksumMismatch, is_stored, stored_size
 from database import (
-    register_user, add_assignment, update_assignment,
-     add_student_feedback,
-    get_assignments, get_student_feedback,
-    get_course_materials, add_course_material,
+    get_assignments, get_student_feedback, get_course_materials,
     get_student_name_from_token,get_teacher_name_from_token, get_all_students, get_all_teachers, 
-    get_last_10_queries,get_queries_by_teacher,create_query,update_query
+    get_last_10_queries,get_queries_by_teacher, find_session, find_assignment_teacher, find_query_teacher,
+    count_file_references
 )
+from leader_proxy import LeaderProxy
 from llm_requests import get_llm_answer
-from pathlib import Path
 from raft import raft_service
+from raft_groups import META_GROUP, group_for_key, raft_groups
+from storage_tiers import storage_tiers
+from upload_sessions import upload_sessions
 
+import itertools
 import lms_pb2
 import lms_pb2_grpc
 import logging
 import os
-import uuid
+import re
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -26,47 +37,140 @@ logger = logging.getLogger(__name__)
 from functools import wraps
 import grpc
 
+leader_proxy = LeaderProxy(raft_service)
+
+def group_leader_only(route):
+    """Decorator to ensure only the leader of the Raft group that route(request) names handles the request.
+
+    Any other node, or a leader that is handing over leadership, forwards the request to
+    that leader and relays its response.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, request, context, *args, **kwargs):
+            node = raft_groups.node(route(request))
+            if not node.is_leader() or node.transfer_target is not None:
+                return leader_proxy.forward(func.__name__, request, context, node)
+            return func(self, request, context, *args, **kwargs)
+        return wrapper
+    return decorator
+
 def leader_only(func):
-    """Decorator to ensure only the leader node handles the request."""
+    """Decorator to ensure only the leader of the meta group handles the request."""
+    return group_leader_only(lambda request: META_GROUP)(func)
+
+def post_group(request) -> int:
+    """Raft group of the data a Post writes: course data goes to the group of its teacher."""
+    data_type = request.WhichOneof('data_type')
+    if data_type == 'assignment':
+        return group_for_key(request.assignment.teacher_name)
+    if data_type == 'assignment_update':
+        return group_for_key(find_teacher_consistent(find_assignment_teacher, request.assignment_update.assignment_id))
+    if data_type == 'student_feedback':
+        user_session = find_session_consistent(request.token)
+        # An unknown token goes to the meta group's leader, which has every session
+        return group_for_key(user_session['username']) if user_session else META_GROUP
+    if data_type == 'content':
+        return group_for_key(request.content.teacher_name)
+    if data_type == 'query':
+        if request.query.query_id:
+            return group_for_key(find_teacher_consistent(find_query_teacher, request.query.query_id))
+        return group_for_key(request.query.teacher_name)
+    return META_GROUP
+
+def upload_group(request) -> int:
+    """Raft group of a resumable upload, whose upload ID starts with it."""
+    group = request.upload_id.partition('-')[0]
+    return int(group) if group.isdigit() and int(group) in raft_groups.nodes else META_GROUP
+
+def find_session_consistent(token):
+    """Look up a session, checking with the meta group before reporting a token as unknown.
+
+    The leader of a course group may follow the meta group and not yet have applied a login.
+    """
+    user_session = find_session(token)
+    if user_session is None and not raft_service.is_leader() and raft_service.wait_for_read():
+        user_session = find_session(token)
+    return user_session
+
+def find_teacher_consistent(find, document_id):
+    """Teacher of an assignment or query, looked up with find_assignment_teacher or find_query_teacher.
+
+    A document's teacher never changes, so a copy this node has applied is right. One it has
+    not applied yet is looked up again once the node has caught up with every group, so a
+    lagging node does not route the write to the wrong group.
+    """
+    teacher = find(document_id)
+    if teacher is None and raft_groups.wait_for_read():
+        teacher = find(document_id)
+    return teacher
+
+def consistent_read(func):
+    """Decorator to let any node serve a read once it has caught up far enough for the request.
+
+    A request with max_staleness_ms unset is linearizable. Otherwise it accepts state up to
+    that many milliseconds old, which a follower can usually serve without asking the leader.
+    """
     @wraps(func)
     def wrapper(self, request, context, *args, **kwargs):
-        if not raft_service.is_leader():
-            context.set_code(grpc.StatusCode.UNAVAILABLE)
-            context.set_details('This node is not the leader.')
-            return grpc.unary_unary_rpc_method_handler(wrapper)
+        max_staleness = request.max_staleness_ms / 1000 if request.max_staleness_ms > 0 else None
+        if not raft_groups.wait_for_read(max_staleness):
+            context.abort(grpc.StatusCode.UNAVAILABLE, 'This node could not confirm it is up to date.')
         return func(self, request, context, *args, **kwargs)
     return wrapper
 
 class LMSServer(lms_pb2_grpc.LMSServicer):
     def __init__(self):
-        self.sessions = {}
         logger.info("LMS Server initialized")
     
-    def save_file_on_all_nodes(self, file_data, filename):
-        """Save the file data to a specified directory on all nodes."""
-        raft_service.upload_to_all_nodes(filename, file_data)
+    def execute(self, command):
+        """Replicate a database command through the log of its Raft group. Returns (committed, result of applying it)."""
+        return raft_groups.node_for_command(command).execute(encode_command(command))
+
+    def save_file_on_all_nodes(self, filename):
+        """Copy a saved file to the other nodes. Returns whether FILE_SYNC_REPLICAS of them have it; the rest follow in the background."""
+        return file_replicator.replicate(filename)
     
-    def save_file(self, file_data, filename):
-        """Save the file data to a specified directory."""
-        file_path = os.path.join(FILE_STORAGE_DIR, filename)
-        with open(file_path, 'wb') as f:
-            f.write(file_data)
-        self.save_file_on_all_nodes(file_data, filename)
-        return file_path
+    def save_file(self, file_data):
+        """Store the file data under its SHA-256, unless that content is already stored.
+
+        Returns the SHA-256, or None if too few nodes stored a new file.
+        """
+        digest, created = blob_store.put(file_data)
+        return digest if not created or self.save_file_on_all_nodes(digest) else None
+
+    def save_file_chunks(self, chunks):
+        """Store a file from (data, running CRC32) chunks, writing each to disk as it arrives. Raises ChecksumMismatch.
+
+        Returns the SHA-256, or None if too few nodes stored a new file.
+        """
+        digest, created = blob_store.put_chunks(chunks)
+        return digest if not created or self.save_file_on_all_nodes(digest) else None
+
+    @staticmethod
+    def _stored_file_response(digest):
+        """Response naming a stored file; records point at it by its path, and its SHA-256 is its id."""
+        return lms_pb2.UploadFileResponse(
+            status="success", file_path=blob_store.path(digest), file_id=digest, references=count_file_references(blob_store.path(digest))
+        )
 
     # --- Helper Functions ---
     # Post functions
-    def _handle_post_assignment(self, request, user_session):
+    def _handle_post_assignment(self, request, user_session, upload_id=None):
         """Handles student assignment submission."""
         assignment_data = request.assignment
-        assignment = add_assignment(
+        committed, _ = self.execute(AddAssignment(
             student_name=user_session['username'],
             teacher_name=assignment_data.teacher_name,
             filename=assignment_data.filename,
             file_path = assignment_data.file_path,
-            file_id = assignment_data.file_id
-        )
-        
+            file_id = assignment_data.file_id,
+            upload_id=upload_id
+        ))
+        if not committed:
+            logger.info("Raft log entry rejected")
+            return lms_pb2.StatusResponse(status="Raft log entry rejected")
+
         logger.info("Assignment submitted successfully to database")
         return lms_pb2.StatusResponse(status="Assignment submitted successfully")
 
@@ -74,16 +178,13 @@ class LMSServer(lms_pb2_grpc.LMSServicer):
     def _handle_update_assignment(self, request, user_session):
         """Handles updating an assignment grade for a student."""
         assignment_update = request.assignment_update
-        if assignment_update.feedback_text:
-            log_entry = f"Update Grade:: Assignment: {assignment_update.assignment_id} Feedback: {assignment_update.feedback_text}"
-        elif assignment_update.grade:
-            log_entry = f"Update Grade:: Assignment: {assignment_update.assignment_id} Grade: {assignment_update.grade}"
-        if raft_service.propose_log_entry(log_entry):
-            update_assignment(  
-                    assignment_id=assignment_update.assignment_id,
-                    grade=assignment_update.grade,
-                    feedback_text=assignment_update.feedback_text
-                )
+        committed, _ = self.execute(UpdateAssignment(
+            assignment_id=assignment_update.assignment_id,
+            grade=assignment_update.grade,
+            feedback_text=assignment_update.feedback_text,
+            teacher_name=find_teacher_consistent(find_assignment_teacher, assignment_update.assignment_id)
+        ))
+        if committed:
             logger.info("Assignment grade updated successfully")
             return lms_pb2.StatusResponse(status="Assignment grade updated successfully")
         else:
@@ -95,46 +196,181 @@ class LMSServer(lms_pb2_grpc.LMSServicer):
     def _handle_post_student_feedback(self, request, user_session):
         """Handles teacher student feedback submission."""
         feedback_data = request.student_feedback
-        add_student_feedback(
+        committed, _ = self.execute(AddStudentFeedback(
             student_name=feedback_data.student_name,
             teacher_name=user_session['username'],
             feedback_text=feedback_data.feedback_text
-        )
+        ))
+        if not committed:
+            logger.info("Raft log entry rejected")
+            return lms_pb2.StatusResponse(status="Raft log entry rejected")
         logger.info("Student feedback submitted successfully")
         return lms_pb2.StatusResponse(status="Student feedback submitted successfully")
 
-    def _handle_post_course_material(self, request, user_session):
+    def _handle_post_course_material(self, request, user_session, upload_id=None):
         """Handles student assignment submission."""
         course_materials_data = request.content
-        content = add_course_material(
+        committed, _ = self.execute(AddCourseMaterial(
             teacher_name=course_materials_data.teacher_name,
             filename=course_materials_data.filename,
             file_path = course_materials_data.file_path,
-            file_id = course_materials_data.file_id
-        )
-        
+            file_id = course_materials_data.file_id,
+            upload_id=upload_id
+        ))
+        if not committed:
+            logger.info("Raft log entry rejected")
+            return lms_pb2.StatusResponse(status="Raft log entry rejected")
+
         logger.info("course_materials submitted successfully to database")
         return lms_pb2.StatusResponse(status="course_materials submitted successfully")
 
     def _handle_upload_file(self, request, user_session)-> lms_pb2.UploadFileResponse:
         """Handles file upload."""
-        file_data = request.data
-        file_id = uuid.uuid4()
-        filename  = Path(request.filename).stem+ "_" + str(file_id) + Path(request.filename).suffix
-        file_path = self.save_file(file_data, filename)
-        logger.info(f"File uploaded successfully: {filename}")
-        return lms_pb2.UploadFileResponse(status="success", file_path=file_path, file_id=str(file_id))
+        digest = self.save_file(request.data)
+        if digest is None:
+            return lms_pb2.UploadFileResponse(status="File could not be replicated to enough nodes")
+        logger.info(f"File uploaded successfully: {request.filename} stored as {digest}")
+        return self._stored_file_response(digest)
+
+    def _handle_upload_stream(self, first_chunk, request_iterator, context) -> lms_pb2.UploadFileResponse:
+        """Handles a chunked file upload."""
+        chunks = ((chunk.data, chunk.checksum) for chunk in itertools.chain([first_chunk], request_iterator))
+        try:
+            digest = self.save_file_chunks(chunks)
+        except ChecksumMismatch as e:
+            logger.warning(f"Upload of {first_chunk.filename} rejected: {e}")
+            context.abort(grpc.StatusCode.DATA_LOSS, str(e))
+        if digest is None:
+            return lms_pb2.UploadFileResponse(status="File could not be replicated to enough nodes")
+        logger.info(f"File uploaded successfully: {first_chunk.filename} stored as {digest}")
+        return self._stored_file_response(digest)
+
+    def _handle_check_file(self, request):
+        """Handles a lookup of stored content by SHA-256."""
+        digest = request.sha256.lower()
+        if not blob_store.exists(digest):
+            return lms_pb2.UploadFileResponse(status="File not found")
+        logger.info(f"Upload of {digest} skipped: the content is already stored")
+        return self._stored_file_response(digest)
     
+    def _upload_session_response(self, upload):
+        """Response describing a resumable upload; content the store already has counts as fully received."""
+        received = [lms_pb2.ByteRange(start=0, end=upload.size)] if blob_store.exists(upload.sha256) else upload_sessions.received_ranges(upload)
+        return lms_pb2.UploadSessionResponse(
+            status="success", upload_id=upload.upload_id, size=upload.size, chunk_size=upload.chunk_size, received=received
+        )
+
+    @staticmethod
+    def _find_upload(upload_id, user_session):
+        """A user's own upload session, or None."""
+        upload = upload_sessions.get(upload_id)
+        return upload if upload is not None and upload.username == user_session['username'] else None
+
+    def _handle_start_upload(self, request, user_session):
+        """Handles the start of a resumable upload."""
+        sha256 = request.sha256.lower()
+        if request.size < 0 or not re.fullmatch(r"[0-9a-f]{64}", sha256):
+            return lms_pb2.UploadSessionResponse(status="Invalid size or SHA-256")
+        upload = upload_sessions.start(
+            group_for_key(request.teacher_name), user_session['username'], request.filename, request.size, sha256, request.teacher_name
+        )
+        logger.info(f"Upload {upload.upload_id} of {request.filename} started: {request.size} bytes")
+        return self._upload_session_response(upload)
+
+    def _handle_upload_chunks(self, first_chunk, request_iterator, user_session, context):
+        """Handles chunks of a resumable upload, which may come in any order and repeat earlier ones."""
+        upload = self._find_upload(first_chunk.upload_id, user_session)
+        if upload is None:
+            return lms_pb2.UploadSessionResponse(status="Upload not found")
+        if blob_store.exists(upload.sha256):
+            return self._upload_session_response(upload)  # Nothing left to send
+        chunks = ((chunk.offset, chunk.data, chunk.checksum) for chunk in itertools.chain([first_chunk], request_iterator))
+        try:
+            upload_sessions.receive(upload, chunks)
+        except ChecksumMismatch as e:
+            logger.warning(f"Chunk of upload {upload.upload_id} rejected: {e}")
+            context.abort(grpc.StatusCode.DATA_LOSS, str(e))
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        return self._upload_session_response(upload)
+
+    def _handle_finalize_upload(self, request, user_session):
+        """Handles the end of a resumable upload: publishes the file, then records what it is for."""
+        record = request.WhichOneof('record')
+        if not (record == 'assignment' and user_session['role'] == "student" or record == 'content'):
+            return lms_pb2.StatusResponse(status="Invalid type or permission denied")
+        upload = self._find_upload(request.upload_id, user_session)
+        if upload is None:
+            return lms_pb2.StatusResponse(status="Upload not found")
+        record_data = getattr(request, record)
+        if record_data.teacher_name != upload.teacher_name:
+            return lms_pb2.StatusResponse(status="The upload was started for another teacher")
+
+        with upload.lock:  # A retried finalize waits for the first one, then finds the session gone
+            if upload_sessions.get(upload.upload_id) is not upload:
+                return lms_pb2.StatusResponse(status="Upload not found")
+            if not blob_store.exists(upload.sha256):
+                if not upload_sessions.is_complete(upload):
+                    return lms_pb2.StatusResponse(status="Upload incomplete")
+                try:
+                    created = upload_sessions.publish(upload)
+                except ChecksumMismatch as e:
+                    logger.warning(f"Upload {upload.upload_id} rejected: {e}")
+                    return lms_pb2.StatusResponse(status="Uploaded file does not match its SHA-256")
+                if created and not self.save_file_on_all_nodes(upload.sha256):
+                    return lms_pb2.StatusResponse(status="File could not be replicated to enough nodes")
+            record_data.file_path = blob_store.path(upload.sha256)
+            record_data.file_id = upload.sha256
+            # The record's id comes from the upload ID, so when a finalize whose entry committed after
+            # its proposer gave up is retried, the record is written once
+            if record == 'assignment':
+                response = self._handle_post_assignment(request, user_session, upload.upload_id)
+            else:
+                response = self._handle_post_course_material(request, user_session, upload.upload_id)
+            if response.status != "Raft log entry rejected":
+                upload_sessions.remove(upload)
+                logger.info(f"Upload {upload.upload_id} finalized as {upload.sha256}")
+            return response
+
     def _handle_download_file(self, request):
         """Handles file download."""
         logger.info(f"File download requested: {request.file_path}")
-        if not os.path.exists(request.file_path):
-            logger.info(f"File not found: {request.file_path}")
-            return lms_pb2.DownloadFileResponse(status="File not found on server")
-        with open(request.file_path, 'rb') as f:
-            data = f.read()
+        data = document_cache.get(request.file_path)
+        if data is None:
+            if not is_stored(request.file_path):
+                logger.info(f"File not found: {request.file_path}")
+                return lms_pb2.DownloadFileResponse(status="File not found on server")
+            data = b"".join(data for _, data in storage_tiers.read_range(request.file_path, 0, stored_size(request.file_path)))
         logger.info(f"File downloaded successfully")
         return lms_pb2.DownloadFileResponse(status="success", data=data)
+
+    def _handle_signed_download(self, request):
+        """Handles a download through the file server, returning a signed URL to the file on this node."""
+        if not FILE_URL_SECRET:
+            return lms_pb2.DownloadFileResponse(status="Signed URLs are not enabled")
+        if not is_stored(request.file_path):
+            logger.info(f"File not found: {request.file_path}")
+            return lms_pb2.DownloadFileResponse(status="File not found on server")
+        filename = os.path.basename(request.file_path)
+        return lms_pb2.DownloadFileResponse(status="success", url=signed_url(filename, request.name or filename))
+
+    def _handle_download_stream(self, request, context):
+        """Handles a chunked download of length bytes from offset, or of the rest of the file if length is 0."""
+        logger.info(f"File download requested: {request.file_path} from byte {request.offset}")
+        cached = document_cache.get(request.file_path)
+        if cached is None and not is_stored(request.file_path):
+            logger.info(f"File not found: {request.file_path}")
+            context.abort(grpc.StatusCode.NOT_FOUND, 'File not found on server')
+        file_size = len(cached) if cached is not None else stored_size(request.file_path)
+        offset = request.offset if request.offset >= 0 else max(0, file_size + request.offset)
+        if offset > file_size or request.length < 0:
+            context.abort(grpc.StatusCode.OUT_OF_RANGE, f'Requested range is outside the file ({file_size} bytes)')
+        end = file_size if request.length == 0 else min(file_size, offset + request.length)
+        if cached is not None:
+            chunks = slice_chunks(cached, offset, end)
+        else:
+            chunks = storage_tiers.read_range(request.file_path, offset, end)
+        return (lms_pb2.DownloadChunk(data=data, offset=chunk_offset, file_size=file_size) for chunk_offset, data in chunks)
     
     def _handle_post_query(self, request, user_session):
         """Handles query submission."""
@@ -144,34 +380,41 @@ class LMSServer(lms_pb2_grpc.LMSServicer):
 
         if query_data.query_id:  # Ensure query_id is not empty
             logger.info(f"Updating query: {query_data.query_id} with answer_text: {query_data.answer_text}")
-            update_response = update_query(
+            committed, _ = self.execute(UpdateQuery(
                 query_id=query_data.query_id,
-                answer_text=query_data.answer_text
-            )
-            logger.info(f"Query updated successfully with ID: {query_data.query_id}")
-            if update_response is None:
-                logger.error("Update query returned None!")
+                answer_text=query_data.answer_text,
+                teacher_name=find_teacher_consistent(find_query_teacher, query_data.query_id)
+            ))
+            if not committed:
+                logger.error("Update query was not committed")
                 return lms_pb2.StatusResponse(status="error", id=str(query_data.query_id))
             else:
+                logger.info(f"Query updated successfully with ID: {query_data.query_id}")
                 return lms_pb2.StatusResponse(status="success", id=str(query_data.query_id))
 
             
         else:
-            query_id = create_query(
+            command = CreateQuery(
                 student_name=user_session['username'],
                 teacher_name=query_data.teacher_name,
                 query_text=query_data.query_text,
                 query_type=query_data.query_type,
                 context_file_path=query_data.context_file_path
             )
+            committed, _ = self.execute(command)
+            if not committed:
+                logger.error("Create query was not committed")
+                return lms_pb2.StatusResponse(status="error")
+            query_id = command.query_id
             logger.info(f"Query submitted successfully with ID: {query_id}")
 
             if query_data.query_type.lower() == "llm":
                 ans = get_llm_answer(query_data.query_text, query_data.context_file_path)
-                update_query(
+                self.execute(UpdateQuery(
                     query_id=query_id,
-                    answer_text=ans
-                )
+                    answer_text=ans,
+                    teacher_name=query_data.teacher_name
+                ))
                 logger.info(f"LLM answered successfully")
 
             return lms_pb2.StatusResponse(status="success", id=str(query_id))
@@ -234,7 +477,7 @@ class LMSServer(lms_pb2_grpc.LMSServicer):
             ) for i, material in enumerate(course_materials)]
         return lms_pb2.GetResponse(status="Success", course_items=course_items)
     
-    @leader_only
+    @consistent_read
     def GetStudents(self, request, context):
 
         # Fetch students from MongoDB (using the get_all_students() function)
@@ -250,7 +493,7 @@ class LMSServer(lms_pb2_grpc.LMSServicer):
         # Return the student list in the response
         return lms_pb2.GetStudentsResponse(students=student_list)
     
-    @leader_only
+    @consistent_read
     def GetTeachers(self, request, context):
 
         # Fetch teachers from MongoDB (using the get_all_teachers() function)
@@ -309,7 +552,11 @@ class LMSServer(lms_pb2_grpc.LMSServicer):
     def Register(self, request, context):
         logger.info(f"Received registration request for user: {request.username} as {request.role}")
         try:
-            if register_user(request.username, request.password, request.role, request.name):
+            committed, registered = self.execute(RegisterUser(request.username, request.password, request.role, request.name))
+            if not committed:
+                logger.warning(f"Registration failed for user: {request.username} - Raft log entry rejected")
+                return lms_pb2.StatusResponse(status="Registration failed due to server error")
+            if registered:
                 logger.info(f"Registration successful for user: {request.username}")
                 return lms_pb2.StatusResponse(status="Registration successful")
             else:
@@ -326,7 +573,10 @@ class LMSServer(lms_pb2_grpc.LMSServicer):
             user = authenticate(request.username, request.password)
             if user:
                 token = generate_token(user['username'])
-                self.sessions[token] = {'username': user['username'], 'role': user['role']}
+                committed, _ = self.execute(CreateSession(token=token, username=user['username'], role=user['role']))
+                if not committed:
+                    logger.warning(f"Login failed for user: {request.username} - Raft log entry rejected")
+                    return lms_pb2.LoginResponse(status="Failed due to server error", token="", role="")
                 logger.info(f"Login successful for user: {request.username}, Token: {token}")
                 return lms_pb2.LoginResponse(status="Success", token=token, role=user['role'])
             else:
@@ -340,7 +590,8 @@ class LMSServer(lms_pb2_grpc.LMSServicer):
     def Logout(self, request, context):
         token = request.token
         logger.info(f"Logout request with token: {token}")
-        if token in self.sessions:
+        if find_session(token):
+            self.execute(DeleteSession(token=token))
             invalidate_token(token)
             logger.info(f"Logout successful for token: {token}")
             return lms_pb2.StatusResponse(status="Logged out successfully")
@@ -351,27 +602,112 @@ class LMSServer(lms_pb2_grpc.LMSServicer):
     @leader_only
     def Upload(self, request, context):
         logger.info(f"Received upload request by token: {request.token}")
-        user_session = self.sessions.get(request.token)
+        user_session = find_session(request.token)
         if not user_session:
             logger.warning("Unauthorized access attempt")
             return lms_pb2.StatusResponse(status="Unauthorized")
         else:
             return self._handle_upload_file(request, user_session)
         
+    def UploadStream(self, request_iterator, context):
+        first_chunk = next(request_iterator, None)
+        if first_chunk is None:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, 'Empty upload.')
+        if not raft_service.is_leader() or raft_service.transfer_target is not None:
+            # Like leader_only, but the chunks are relayed to the leader as they arrive
+            chunks = itertools.chain([first_chunk], request_iterator)
+            return leader_proxy.forward('UploadStream', chunks, context, retry=False)
+        logger.info(f"Received upload stream by token: {first_chunk.token}")
+        user_session = find_session(first_chunk.token)
+        if not user_session:
+            logger.warning("Unauthorized access attempt")
+            return lms_pb2.UploadFileResponse(status="Unauthorized")
+        return self._handle_upload_stream(first_chunk, request_iterator, context)
+        
+    @group_leader_only(lambda request: group_for_key(request.teacher_name))
+    def StartUpload(self, request, context):
+        logger.info(f"Received upload start by token: {request.token}")
+        user_session = find_session_consistent(request.token)
+        if not user_session:
+            logger.warning("Unauthorized access attempt")
+            return lms_pb2.UploadSessionResponse(status="Unauthorized")
+        return self._handle_start_upload(request, user_session)
+
+    def UploadChunks(self, request_iterator, context):
+        first_chunk = next(request_iterator, None)
+        if first_chunk is None:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, 'Empty upload.')
+        node = raft_groups.node(upload_group(first_chunk))
+        if not node.is_leader() or node.transfer_target is not None:
+            # Like group_leader_only, but the chunks are relayed to the leader as they arrive
+            chunks = itertools.chain([first_chunk], request_iterator)
+            return leader_proxy.forward('UploadChunks', chunks, context, node, retry=False)
+        logger.info(f"Received upload chunks by token: {first_chunk.token}")
+        user_session = find_session_consistent(first_chunk.token)
+        if not user_session:
+            logger.warning("Unauthorized access attempt")
+            return lms_pb2.UploadSessionResponse(status="Unauthorized")
+        return self._handle_upload_chunks(first_chunk, request_iterator, user_session, context)
+
+    @group_leader_only(upload_group)
+    def GetUpload(self, request, context):
+        logger.info(f"Received upload status request by token: {request.token}")
+        user_session = find_session_consistent(request.token)
+        if not user_session:
+            logger.warning("Unauthorized access attempt")
+            return lms_pb2.UploadSessionResponse(status="Unauthorized")
+        upload = self._find_upload(request.upload_id, user_session)
+        if upload is None:
+            return lms_pb2.UploadSessionResponse(status="Upload not found")
+        return self._upload_session_response(upload)
+
+    @group_leader_only(upload_group)
+    def FinalizeUpload(self, request, context):
+        logger.info(f"Received upload finalize by token: {request.token}")
+        user_session = find_session_consistent(request.token)
+        if not user_session:
+            logger.warning("Unauthorized access attempt")
+            return lms_pb2.StatusResponse(status="Unauthorized")
+        return self._handle_finalize_upload(request, user_session)
+
     @leader_only
+    def CheckFile(self, request, context):
+        logger.info(f"Received file check by token: {request.token}")
+        user_session = find_session(request.token)
+        if not user_session:
+            logger.warning("Unauthorized access attempt")
+            return lms_pb2.UploadFileResponse(status="Unauthorized")
+        return self._handle_check_file(request)
+
     def Download(self, request, context):
+        # Any node holding the file signs a URL to its own file server, spreading downloads over the replicas
+        if not (request.signed_url and FILE_URL_SECRET and is_stored(request.file_path)):
+            node = raft_groups.node(META_GROUP)
+            if not node.is_leader() or node.transfer_target is not None:
+                return leader_proxy.forward('Download', request, context, node)
         logger.info(f"Received download request by token: {request.token}")
-        user_session = self.sessions.get(request.token)
+        user_session = find_session_consistent(request.token)
         if not user_session:
             logger.warning("Unauthorized access attempt")
             return lms_pb2.StatusResponse(status="Unauthorized")
+        elif request.signed_url:
+            return self._handle_signed_download(request)
         else:
             return self._handle_download_file(request)
     
     @leader_only
+    def DownloadStream(self, request, context):
+        logger.info(f"Received download stream request by token: {request.token}")
+        user_session = find_session(request.token)
+        if not user_session:
+            logger.warning("Unauthorized access attempt")
+            context.abort(grpc.StatusCode.UNAUTHENTICATED, 'Unauthorized')
+        return self._handle_download_stream(request, context)
+    
+    @group_leader_only(post_group)
     def Post(self, request, context):
         logger.info(f"Received post request by token: {request.token}")
-        user_session = self.sessions.get(request.token)
+        user_session = find_session_consistent(request.token)
         if not user_session:
             logger.warning("Unauthorized access attempt")
             return lms_pb2.StatusResponse(status="Unauthorized")
@@ -397,10 +733,10 @@ class LMSServer(lms_pb2_grpc.LMSServicer):
         #     logger.error(f"Error during post operation: {str(e)}")
         #     return lms_pb2.StatusResponse(status="Failed due to server error")
 
-    @leader_only
+    @consistent_read
     def Get(self, request, context):
         logger.info(f"Received get request by token: {request.token}")
-        user_session = self.sessions.get(request.token)
+        user_session = find_session(request.token)
         
         if not user_session:
             logger.warning("Unauthorized access attempt")
@@ -0,0 +1,168 @@
+import asyncio
+import collections
+import grpc
+import logging
+import os
+from typing import Dict, List
+from lms_pb2_grpc import RaftServiceStub
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Client side: keep idle connections alive and reconnect with exponential backoff after a failure
+CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 10000),  # Ping an idle connection every 10s
+    ("grpc.keepalive_timeout_ms", 5000),  # Consider the connection dead if a ping is not answered in 5s
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.initial_reconnect_backoff_ms", 100),
+    ("grpc.min_reconnect_backoff_ms", 100),
+    ("grpc.max_reconnect_backoff_ms", 5000),
+]
+
+# Server side: accept the keepalive pings sent by peers instead of closing their connections
+SERVER_OPTIONS = [
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.min_recv_ping_interval_without_data_ms", 5000),
+    ("grpc.http2.max_ping_strikes", 0),
+]
+
+
+def open_file_descriptors() -> int:
+    """Number of file descriptors the process holds open, sockets included, or 0 where /proc is not available."""
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return 0
+
+
+class PeerConnection:
+    """A persistent asyncio channel to one peer that tracks the channel's connectivity state.
+
+    Must be created on the event loop that will use it.
+    """
+
+    def __init__(self, address: str, options: List[tuple]):
+        self.address = address
+        self.channel = grpc.aio.insecure_channel(address, options=options)
+        self.stub = RaftServiceStub(self.channel)
+        self.state = self.channel.get_state(try_to_connect=True)
+        self.watcher = asyncio.ensure_future(self._watch_state())
+
+    async def _watch_state(self):
+        """Follow connectivity changes, asking the channel to reconnect whenever it goes idle."""
+        while True:
+            await self.channel.wait_for_state_change(self.state)
+            state = self.channel.get_state(try_to_connect=True)
+            if state != self.state:
+                logger.info(f"Connection to {self.address}: {self.state.name} -> {state.name}")
+            self.state = state
+
+    def is_healthy(self) -> bool:
+        return self.state in (grpc.ChannelConnectivity.READY, grpc.ChannelConnectivity.IDLE)
+
+    async def close(self):
+        self.watcher.cancel()
+        await self.channel.close()
+
+
+class AppendEntriesStream:
+    """A long-lived bidirectional AppendEntries stream to one follower.
+
+    Frames are queued without waiting for earlier replies. The follower answers them in
+    order, so each reply resolves the oldest outstanding frame. If the stream breaks, every
+    outstanding frame fails and the next send should open a new stream.
+    """
+
+    def __init__(self, stub: RaftServiceStub):
+        self.outgoing: asyncio.Queue = asyncio.Queue()  # Frames waiting to be written, None to finish the stream
+        self.pending: collections.deque = collections.deque()  # Futures of frames awaiting their reply, oldest first
+        self.closed = False
+        self.call = stub.AppendEntriesStream()
+        self.writer = asyncio.ensure_future(self._write_frames())
+        self.reader = asyncio.ensure_future(self._read_replies())
+
+    async def _write_frames(self):
+        try:
+            while True:
+                request = await self.outgoing.get()
+                if request is None:
+                    return
+                await self.call.write(request)
+        except (grpc.RpcError, asyncio.InvalidStateError):
+            self.call.cancel()  # The reader reports the failure to the waiting frames
+
+    def send(self, request) -> asyncio.Future:
+        """Queue a frame. The returned future resolves to the follower's reply, or fails if the stream breaks."""
+        future = asyncio.get_event_loop().create_future()
+        if self.closed:
+            future.set_exception(ConnectionError("AppendEntries stream is closed"))
+            return future
+        self.pending.append(future)
+        self.outgoing.put_nowait(request)
+        return future
+
+    async def _read_replies(self):
+        error: BaseException = ConnectionError("AppendEntries stream ended")
+        try:
+            while True:
+                response = await self.call.read()
+                if response is grpc.aio.EOF:
+                    break
+                future = self.pending.popleft()
+                if not future.done():  # The sender may have given up waiting
+                    future.set_result(response)
+        except grpc.RpcError as e:
+            error = e
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.closed = True
+            self.outgoing.put_nowait(None)
+            while self.pending:
+                future = self.pending.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.outgoing.put_nowait(None)
+            self.call.cancel()
+
+
+class PeerConnectionManager:
+    """Keeps one long-lived channel per peer, shared by every RPC sent to that peer.
+
+    Owned by the Raft event loop: connections are opened and used only from that loop.
+    """
+
+    def __init__(self, peers: List[str], options: List[tuple] = CHANNEL_OPTIONS):
+        self.options = options
+        self.connections: Dict[str, PeerConnection] = {}
+        for peer in peers:
+            self.connection(peer)
+
+    def connection(self, peer: str) -> PeerConnection:
+        """Return the connection to a peer, opening it on first use."""
+        if peer not in self.connections:
+            self.connections[peer] = PeerConnection(peer, self.options)
+        return self.connections[peer]
+
+    def stub(self, peer: str) -> RaftServiceStub:
+        return self.connection(peer).stub
+
+    async def remove(self, peer: str):
+        """Close the connection to a peer that left the cluster."""
+        connection = self.connections.pop(peer, None)
+        if connection is not None:
+            await connection.close()
+
+    def health(self) -> Dict[str, str]:
+        """Connectivity state of every peer, e.g. READY or TRANSIENT_FAILURE."""
+        return {peer: connection.state.name for peer, connection in list(self.connections.items())}
+
+    async def close(self):
+        for connection in self.connections.values():
+            await connection.close()
+        self.connections.clear()
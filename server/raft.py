@@ -1,139 +1,437 @@
+import asyncio
 import grpc
+import itertools
+import json
 import time
 import random
 import os
-import json
 import threading
 import logging
-from conts import FILE_STORAGE_DIR
+from conts import (
+    FILE_STORAGE_DIR, RAFT_LOG_DIR,
+    RAFT_HEARTBEAT_INTERVAL, RAFT_ELECTION_TIMEOUT_MIN, RAFT_ELECTION_TIMEOUT_MAX, RAFT_LEADER_LEASE,
+    RAFT_INITIAL_MEMBERS, RAFT_APPEND_WINDOW
+)
 from concurrent import futures
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 from lms_pb2 import (
     VoteRequest, VoteResponse,
     AppendEntriesRequest, AppendEntriesResponse,
-    LogEntry, LeaderInfo, UploadFileAllResponse, UploadFileAllRequest
+    LogEntry, LeaderInfo, UploadFileAllResponse, UploadFileAllRequest,
+    InstallSnapshotRequest, InstallSnapshotResponse, ReadIndexRequest, ReadIndexResponse,
+    TimeoutNowRequest, TimeoutNowResponse, TransferLeadershipResponse,
+    MembershipChangeResponse, Member, MembersResponse, PeerHealth, PeerHealthResponse
 )
 
-from lms_pb2_grpc import RaftServiceServicer, add_RaftServiceServicer_to_server, RaftServiceStub
+from lms_pb2_grpc import RaftServiceServicer
+from raft_log import RaftLog, load_metadata, save_metadata
+from raft_snapshot import SnapshotStore
+from file_catalog import file_catalog
+from file_transfer import ChecksumMismatch, read_chunks, write_chunks
+from peer_channels import AppendEntriesStream, PeerConnectionManager, open_file_descriptors
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-PEER_NODES = [
-    "lms_server_1:5000",  # Example: First node
-    "lms_server_2:5000",  # Example: Second node
-    "lms_server_3:5000"   # Example: Third node
-]
-PEER_NODES.remove(f"{os.getenv('SERVER_NAME', None)}:5000")
+class Proposal:
+    """A log entry proposed by a caller, waiting to be committed as part of a batch."""
+    def __init__(self, data, future: asyncio.Future, applied: Optional[asyncio.Future] = None, config: str = ""):
+        self.data = data
+        self.config = config  # Set instead of data for a configuration entry
+        self.future = future
+        self.applied = applied  # Set to the state machine's result once this node applies the entry
+        self.index = None  # Log index, assigned when the batch is appended
+
+    def resolve(self, committed: bool):
+        """Hand the commit result back to the waiting caller."""
+        if not self.future.done():
+            self.future.set_result(committed)
+
+class StateMachine:
+    """Application state built by applying committed log entries in order. The default keeps no state."""
+    def apply(self, index: int, entry: LogEntry):
+        """Apply one committed entry and return a result for the node that proposed it."""
+        return None
+
+    def snapshot(self) -> bytes:
+        """Serialize the applied state for a snapshot."""
+        return b""
+
+    def restore(self, data: bytes):
+        """Replace the applied state with the contents of a snapshot."""
+        pass
+
 class RaftNode(RaftServiceServicer):
-    def __init__(self):
+    """A Raft node whose consensus state is owned by a single asyncio event loop.
+
+    Timers, elections, heartbeats, replication and group commit all run as callbacks and
+    tasks on that loop, so they never race each other. gRPC handlers and LMS callers hand
+    their work to the loop with _call(). Blocking work goes to two single-thread executors:
+    one for log and snapshot I/O, one that applies entries to the state machine.
+    """
+    def __init__(self, group: int = 0):
+        self.group = group  # Raft group this node belongs to; group 0 is the meta group and keeps the original log directory
         self.role = "Follower"  # Role: Follower, Candidate, or Leader
         self.node_id = os.getenv('SERVER_NAME', None)
         self.node_address = f"{os.getenv('SERVER_NAME', None)}:5000"
-        self.peers = PEER_NODES # List of peer addresses (host:port) of other nodes
-        self.current_term = 0  # Current term of the node
-        self.voted_for = None  # Node that this node voted for in the current term
-        self.log_storage_path = "/app/logs/raft.log"
-        self.log = self.load_log()  # Log entries for consistency
-        self.commit_index = 0  # Index of the last committed log entry
-        self.last_applied = 0  # Index of the last applied log entry
-        logger.info(f"PEERS: - {os.getenv('SERVER_NAME', None)}:5000 =  {self.peers}")
-        self.next_index = {peer: 0 for peer in self.peers}  # Next log index to send to each peer
-        self.match_index = {peer: 0 for peer in self.peers}  # Highest log index known to be replicated on each peer
+        log_dir = RAFT_LOG_DIR if group == 0 else os.path.join(RAFT_LOG_DIR, f"group-{group}")
+        os.makedirs(log_dir, exist_ok=True)
+        self.metadata_path = os.path.join(log_dir, "raft_meta.json")
+        metadata = load_metadata(self.metadata_path)
+        self.current_term = metadata["current_term"]  # Current term of the node
+        self.voted_for = metadata["voted_for"]  # Node that this node voted for in the current term
+        self.log = RaftLog(os.path.join(log_dir, "wal"))  # Segmented write-ahead log of entries
+        self.snapshots = SnapshotStore(os.path.join(log_dir, "snapshot"))
+        snapshot = self.snapshots.load_meta()
+        self.snapshot_index = snapshot.last_included_index  # Last log index covered by the latest snapshot
+        self.snapshot_term = snapshot.last_included_term  # Term of that entry
+        self.commit_index = self.snapshot_index  # Index of the last committed log entry
+        self.last_applied = self.snapshot_index  # Index of the last applied log entry, written only by the apply thread
+        self.state_machine = StateMachine()
+
+        # Membership: the latest configuration in the log, committed or not, decides who votes and who is replicated to
+        self.members: Dict[str, str] = {}  # Address of every node, this one included, to "voter" or "learner"
+        self.peers: List[str] = []  # Addresses of the other members, which all receive the log
+        self.voters: List[str] = []  # Addresses of the other members that vote and count towards a majority
+        self.config_history = self._load_configuration(snapshot.config)  # (index, members) of each configuration still in use
+        self.replicators: Dict[str, asyncio.Task] = {}
+        self.catch_up_timeout = 60  # Seconds a new member may take to catch up before it becomes a voter
+        self.next_index = {}  # Next log index to send to each peer
+        self.match_index = {}  # Highest log index known to be replicated on each peer
+        self.in_flight: Dict[str, int] = {}  # Number of AppendEntries frames or InstallSnapshot RPCs outstanding per peer
+        self.last_ack = {}  # Loop time at which the last RPC acknowledged by each peer in this term was sent
+        self.leader_id = None  # Node id of the leader of the current term, once known
+        self.leader_commit_seen = -1  # Leader's commit index as of the last AppendEntries received from it
         self.votes_received = 0  # Votes received during election
+        self.pre_votes_received = 0  # Votes received during the pre-vote that precedes an election
+        self.pre_vote_round = 0  # Incremented for each pre-vote, so late replies from an earlier one are ignored
         self.heartbeat_count = 0
+        self.heartbeat_rtt = {}  # Round-trip time in ms of the last acknowledged heartbeat to each peer
+
+        # Group commit: concurrent proposals are gathered and replicated as one batch
+        self.max_batch_size = 100  # Maximum number of entries in one batch
+        self.batch_window = 0.01  # Seconds to wait for more proposals before flushing a batch
+        self.pending_proposals: List[Proposal] = []
+        self.apply_waiters: Dict[int, asyncio.Future] = {}  # Log indexes whose proposer waits for the apply result
+
+        # Replication: one long-lived replicator task per peer ships new entries as soon as they are appended,
+        # so a slow or dead peer only delays itself and proposals return once a majority acknowledges
+        self.rpc_timeout = 1.0  # Per-peer deadline in seconds for a single RPC
+        self.replication_timeout = 3.0  # Seconds a proposal waits for a majority before giving up
+        self.replication_retry_interval = 0.5  # Seconds before retrying a peer that did not respond
+        self.max_append_entries = 1000  # Maximum entries per AppendEntries, so lagging peers catch up in chunks
+        self.max_append_bytes = 1024 * 1024  # ...and maximum size, well under gRPC's 4 MB message limit
+        self.upload_timeout = 60  # Deadline in seconds for pushing an uploaded file to a peer
 
+        # Pipelining: AppendEntries frames go over one long-lived stream per peer, and up to append_window of
+        # them may await their reply; next_index moves past entries once they are sent and rewinds on a failure
+        self.append_window = RAFT_APPEND_WINDOW
+        self.append_streams: Dict[str, AppendEntriesStream] = {}
+        self.unary_peers = set()  # Peers without the stream, e.g. older versions; sent one unary RPC at a time
+        self.unreachable_peers = set()  # Peers whose last AppendEntries got no reply; probed one frame at a time
+        self.rewinds: Dict[str, int] = {}  # Times next_index was moved back per peer; replies to frames sent before are stale
+
+        # Snapshots: the applied state is saved periodically and the log prefix it covers is compacted
+        self.snapshot_threshold = 10000  # Applied entries beyond the last snapshot before a new one is taken
+        self.snapshot_interval = 30  # Seconds between snapshot checks
+        self.snapshot_chunk_size = 1024 * 1024  # Bytes per InstallSnapshot message
+        self.snapshot_timeout = 60  # Deadline in seconds for streaming a whole snapshot to a peer
 
         # Set up election timeout and heartbeat timer
-        self.heartbeat_interval = 5  # Send heartbeats every second as leader
-        self.election_timeout = self._random_timeout()
-        self.election_timer = threading.Timer(self.election_timeout, self.start_election)
+        self.heartbeat_interval = RAFT_HEARTBEAT_INTERVAL  # Seconds between heartbeats as leader
+        self.election_timeout_min = RAFT_ELECTION_TIMEOUT_MIN
+        self.election_timeout_max = RAFT_ELECTION_TIMEOUT_MAX
+        self.election_timer = None  # asyncio.TimerHandle of the pending election timeout
+        self.last_leader_contact = float("-inf")  # Loop time of the last valid RPC from a leader
+
+        # Reads: any node may serve one once it has applied the leader's confirmed commit index
+        self.lease_reads = RAFT_LEADER_LEASE  # Skip the confirmation round while a majority acknowledged recently
+        self.lease_duration = self.election_timeout_min * 0.8  # Shorter than the pre-vote lockout, leaving room for clock drift
+        self.read_round_requested = float("-inf")  # Start of the newest leadership confirmation still waiting for acks
+        self.lease_revoked_term = -1  # Term in which this leader sent TimeoutNow; its lease no longer rules out a new leader
+
+        # Leadership transfer
+        self.transfer_target: Optional[str] = None  # Peer leadership is being handed to; new proposals are refused meanwhile
+        self.transfer_timeout = self.election_timeout_max * 4
+        self.preferred_leader_rank: Optional[int] = None  # Position among the sorted voters of the node that should lead; None to not balance
+        self.balance_interval = 5  # Seconds between checks that leadership sits on the preferred node
+        self.stopping = False  # Set on shutdown; the node then refuses to take over leadership
+
+        # The event loop runs in one thread; the thread count does not grow with peers or heartbeats
+        self.loop = asyncio.new_event_loop()
+        self.io_executor = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="raft-io")
+        self.apply_executor = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="raft-apply")
+        self.tasks = set()  # Strong references to running tasks, which asyncio only holds weakly
+        self.calls_lock = threading.Lock()  # Makes handing a call to the loop and stopping the node exclusive
+        self.stopped = False  # Set by stop(); calls from other threads are refused from then on
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name="raft-loop", daemon=True)
+        self.loop_thread.start()
+        self._call(self._start())
+        logger.info(f"Node {self.node_id} initialized as Follower of group {self.group}")
+
+    async def _start(self):
+        """Create the loop-bound primitives, the peer channels and the background tasks."""
+        self.connections = PeerConnectionManager([])  # One persistent channel per peer
+        self.proposals_pending = asyncio.Event()
+        self.batch_full = asyncio.Event()
+        self.batch_slots = asyncio.Semaphore(self.append_window)  # Batches that may await a majority at once
+        self.replication_changed = asyncio.Condition()  # Log appended, peer acknowledged or role changed
+        self.commit_changed = asyncio.Condition()
+        self.applied_changed = asyncio.Condition()
+        self.leader_changed = asyncio.Condition()
+        self.snapshot_lock = asyncio.Lock()  # Serializes taking and installing snapshots
+        self.membership_lock = asyncio.Lock()  # One membership change at a time
+        self._spawn(self._run_group_commit())
+        self._spawn(self._run_applier())
+        self._spawn(self._run_snapshotter())
+        self._spawn(self._run_leader_balancer())
+        self._use_configuration()  # Opens the peer channels and starts one replicator per peer
 
         # Start the election timer for the follower
-        self.election_timer.start()
-        logger.info(f"Node {self.node_id} initialized as Follower")
-    
+        self._reset_election_timer()
+
+    def _submit(self, coroutine) -> futures.Future:
+        """Hand a coroutine to the event loop from another thread. Raises RuntimeError once the node has stopped."""
+        with self.calls_lock:
+            if self.stopped:
+                coroutine.close()
+                raise RuntimeError(f"Node {self.node_id} of group {self.group} has stopped")
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def _call(self, coroutine):
+        """Run a coroutine on the event loop from another thread and wait for its result."""
+        return self._submit(coroutine).result()
+
+    def stop(self):
+        """Stop the node: refuse further calls, cancel and await every task, and close the event loop.
+
+        Calls other threads handed over just before are cancelled too, so none is left waiting.
+        """
+        with self.calls_lock:
+            if self.stopped:
+                return
+            self.stopped = True
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._cancel_tasks(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+        self.loop.run_until_complete(self._cancel_tasks())  # Tasks the queued calls started before the loop stopped
+        self.loop.close()
+        logger.info(f"Node {self.node_id} of group {self.group} stopped")
+
+    async def _cancel_tasks(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=1)
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        """Start a background task on the event loop."""
+        task = self.loop.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _run_io(self, function, *args):
+        """Run blocking disk I/O on the I/O thread without stalling the event loop."""
+        return await self.loop.run_in_executor(self.io_executor, function, *args)
+
+    async def _notify(self, condition: asyncio.Condition):
+        """Wake every task waiting on a condition."""
+        async with condition:
+            condition.notify_all()
+
     def update_role(self, role: str):
         """Update the role of the node."""
+        if self.role == "Leader" and role != "Leader":
+            # Only a leader sends AppendEntries; free the followers' stream handlers
+            for stream in self.append_streams.values():
+                stream.close()
+            self.append_streams.clear()
         self.role = role
-        os.environ['ROLE'] = role
+        if self.group == 0:
+            os.environ['ROLE'] = role
 
     def is_leader(self) -> bool:
         """Check if the node is the leader."""
         return self.role == "Leader"
 
-    def load_log(self) -> List[LogEntry]:
-        """Load the log from disk."""
-        if os.path.exists(self.log_storage_path):
-            with open(self.log_storage_path, "r") as f:
-                log_entries = []
-                for line in f:
-                    data = json.loads(line)
-                    log_entry = LogEntry(term=data['term'], data=data['data'])  # Adjust if data type differs
-                    log_entries.append(log_entry)
-                return log_entries
-        return []
-
-
-    def log_entry_to_dict(self,log_entry: LogEntry) -> dict:
-        return {
-            'term': log_entry.term,
-            'data': log_entry.data
-        }
-
-    def save_log(self):
-        """Save the log to disk."""
-        with open(self.log_storage_path, "w") as f:
-            for entry in self.log:
-                f.write(json.dumps(self.log_entry_to_dict(entry)) + "\n")
+    def save_term(self):
+        """Persist current_term and voted_for before acting on them."""
+        save_metadata(self.metadata_path, self.current_term, self.voted_for)
+
+    def set_state_machine(self, state_machine: StateMachine):
+        """Attach the application state machine that committed entries are applied to."""
+        self.apply_executor.submit(setattr, self, "state_machine", state_machine).result()
+
+    def _term_at(self, index: int) -> int:
+        """Term of the entry at index, including the last entry covered by the snapshot."""
+        if index < 0:
+            return 0
+        if index == self.snapshot_index:
+            return self.snapshot_term
+        return self.log.entry(index).term
+
+    def _step_down(self, term: int):
+        """Adopt a higher term seen from a peer and return to the follower role."""
+        logger.info(f"[{self.role}] Term out of date. Stepping down. Peer term: {term}, current term: {self.current_term}")
+        self.current_term = term
+        self.voted_for = None
+        self._set_leader(None)
+        self.update_role("Follower")
+        self.save_term()
+        self._reset_election_timer()
+
+    def _accept_leader(self, term: int, leader_id: str) -> bool:
+        """Validate the term of a leader's RPC, follow that leader and restart the election timeout."""
+        if term < self.current_term:
+            return False
+        if term > self.current_term:
+            logger.info(f"[{self.role}] Term updated: {self.current_term} -> {term}. Becoming follower.")
+            self.current_term = term
+            self.voted_for = None
+            self.save_term()
+        if self.role != "Follower":
+            # A candidate that hears from the leader of its own term has lost the election
+            self.update_role("Follower")
+        self._set_leader(leader_id)
+        self.last_leader_contact = self.loop.time()
+        self._reset_election_timer()
+        return True
+
+    def _set_leader(self, leader_id: Optional[str]):
+        """Record the leader of the current term, or None while it is unknown."""
+        if leader_id != self.leader_id:
+            self.leader_id = leader_id
+            self._spawn(self._notify(self.leader_changed))
+
+    def leader_address(self, timeout: float = 0, unreachable: Optional[str] = None) -> Optional[str]:
+        """Address of the current leader, waiting up to timeout seconds for one to be known.
+
+        A leader address passed as unreachable is not returned; the wait is for its successor.
+        """
+        return self._call(self._leader_address(timeout, unreachable))
+
+    async def _leader_address(self, timeout: float, unreachable: Optional[str] = None) -> Optional[str]:
+        def address():
+            return f"{self.leader_id}:5000" if self.leader_id is not None else None
+
+        if address() in (None, unreachable) and timeout > 0:
+            try:
+                async with self.leader_changed:
+                    await asyncio.wait_for(self.leader_changed.wait_for(
+                        lambda: address() not in (None, unreachable)
+                    ), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return address() if address() != unreachable else None
+
+    def _leader_recently_seen(self) -> bool:
+        """Whether a live leader is known, in which case pre-votes are refused."""
+        return self.role == "Leader" or self.loop.time() - self.last_leader_contact < self.election_timeout_min
+
+    def _reset_election_timer(self):
+        """Restart the election timeout. Must be called on the event loop."""
+        if self.election_timer is not None:
+            self.election_timer.cancel()
+        self.election_timer = self.loop.call_later(self._random_timeout(), self.start_pre_vote)
 
     def _random_timeout(self):
         """Generate a random election timeout to avoid split votes."""
-        return random.uniform(self.heartbeat_interval + 1, 10)
+        return random.uniform(self.election_timeout_min, self.election_timeout_max)
+
+    def start_pre_vote(self):
+        """Check that a majority would grant a vote before starting a real election.
+
+        A node that was only cut off briefly, or whose log is behind, fails the pre-vote
+        and does not bump the term, so it cannot depose a healthy leader when it returns.
+        """
+        if self.role == "Leader":
+            return
+        if not self._is_voter():
+            # Learners and nodes not yet added never campaign; check again in case this node is promoted
+            self._reset_election_timer()
+            return
+        self.pre_vote_round += 1
+        self.pre_votes_received = 1  # Vote for self
+        logger.info(f"[{self.role}] Node {self.node_id} started a pre-vote for term {self.current_term + 1}")
+
+        for peer in self.voters:
+            self._spawn(self.request_vote(peer, self.current_term + 1, pre_vote_round=self.pre_vote_round))
+
+        # Try again after another timeout if the pre-vote does not reach a majority
+        self._reset_election_timer()
 
     def start_election(self):
         """Start a new election if no leader heartbeat received."""
-        if self.role != "Leader":
-            self.update_role("Candidate")
-            self.current_term += 1
-            self.voted_for = self.node_id
-            self.votes_received = 1  # Vote for self
-            logger.info("----------------------Election Started----------------------")
-            logger.info(f"[{self.role}] Node {self.node_id} started an election for term {self.current_term}")
-
-            # Send RequestVote RPCs to all peers
-            for peer in self.peers:
-                threading.Thread(target=self.request_vote, args=(peer,)).start()
-            
-            # Start a new election timer
-            self.election_timer.cancel()
-            self.election_timer = threading.Timer(self.election_timeout, self.start_election)
-            self.election_timer.start()
+        if self.role == "Leader":
+            return
+        self.update_role("Candidate")
+        self.current_term += 1
+        self.voted_for = self.node_id
+        self._set_leader(None)
+        self.votes_received = 1  # Vote for self
+        self.save_term()
+        logger.info("----------------------Election Started----------------------")
+        logger.info(f"[{self.role}] Node {self.node_id} started an election for term {self.current_term}")
+
+        # Send RequestVote RPCs to all voters
+        for peer in self.voters:
+            self._spawn(self.request_vote(peer, self.current_term))
+
+        # Start a new election timer in case this one splits the vote
+        self._reset_election_timer()
 
-    def request_vote(self, peer: str):
-        """Send RequestVote RPC to a peer."""
+    async def request_vote(self, peer: str, term: int, pre_vote_round: Optional[int] = None):
+        """Send RequestVote RPC to a peer, as a pre-vote when pre_vote_round is given."""
         stub = self._get_stub(peer)
         request = VoteRequest(
-            term=self.current_term,
+            term=term,
             candidate_id=self.node_id,
             last_log_index=len(self.log) - 1,
-            last_log_term=self.log[-1].term if self.log else 0
+            last_log_term=self._term_at(len(self.log) - 1),
+            pre_vote=pre_vote_round is not None,
+            group=self.group
         )
         try:
-            response = stub.RequestVote(request)
-            self.handle_vote_response(response)
+            response = await stub.RequestVote(request, timeout=self.rpc_timeout)
         except grpc.RpcError as e:
             logger.info(f"[{self.role}] Failed to request vote from {peer}: Server did not respond")
+            return
+        if pre_vote_round is not None:
+            self.handle_pre_vote_response(response, pre_vote_round)
+        else:
+            self.handle_vote_response(response, term)
+
+    def handle_pre_vote_response(self, response: VoteResponse, pre_vote_round: int):
+        """Count a pre-vote and start the real election once a majority would vote for this node."""
+        if response.term > self.current_term:
+            self._step_down(response.term)
+            return
+        if self.role == "Leader" or pre_vote_round != self.pre_vote_round:
+            return  # A late reply from an earlier pre-vote
+
+        if response.vote_granted:
+            self.pre_votes_received += 1
+            if self.pre_votes_received == self._quorum_size():
+                self.start_election()
+
+    def handle_vote_response(self, response: VoteResponse, term: int):
+        """Handle the response of a vote request sent for the given term."""
+        if response.term > self.current_term:
+            self._step_down(response.term)
+            return
+        if self.role != "Candidate" or term != self.current_term:
+            return  # A late reply from an election that is already decided
 
-    def handle_vote_response(self, response: VoteResponse):
-        """Handle the response of a vote request."""
         if response.vote_granted:
             self.votes_received += 1
             logger.info(f"[{self.role}] Node {self.node_id} received a vote. Total votes: {self.votes_received}")
 
-            if self.votes_received > len(self.peers) // 2:
+            if self.votes_received >= self._quorum_size():
                 self.become_leader()
-        
+
         logger.info("----------------------Election Ended----------------------")
 
     def become_leader(self):
@@ -141,28 +439,53 @@ class RaftNode(RaftServiceServicer):
         self.update_role("Leader")
         logger.info(f"[{self.role}] Node {self.node_id} became the Leader for term {self.current_term}")
 
-        # Initialize nextIndex for all peers
+        # A leader does not time out; the timer restarts when it steps down
+        if self.election_timer is not None:
+            self.election_timer.cancel()
+            self.election_timer = None
+
+        # Initialize nextIndex and matchIndex for all peers
+        self._set_leader(self.node_id)
+        self.last_ack = {}
         for peer in self.peers:
             self.next_index[peer] = len(self.log)
+            self.match_index[peer] = -1
 
         # Start sending heartbeats
-        threading.Thread(target=self.send_heartbeats).start()
+        self._spawn(self.send_heartbeats(self.current_term))
 
-    def send_heartbeats(self):
-        """Send periodic heartbeats to followers."""
-        while self.role == "Leader":
+        # Commit an empty entry of the new term; until one does, this leader cannot tell which
+        # earlier entries are committed and read_index() has no commit index to offer
+        self._spawn(self.propose(""))
+
+    async def send_heartbeats(self, term: int):
+        """Send periodic heartbeats to followers while leading the given term."""
+        while self.role == "Leader" and self.current_term == term:
             for peer in self.peers:
-                entries = []  # Heartbeats do not contain entries
-                threading.Thread(target=self.append_entries, args=(peer, entries)).start()
-            time.sleep(self.heartbeat_interval)
+                # An in-flight replication or snapshot already acts as a heartbeat
+                if not self.in_flight.get(peer) and not self._needs_snapshot(peer):
+                    self._spawn(self._send_heartbeat(peer))
+            await asyncio.sleep(self.heartbeat_interval)
 
-    def append_entries(self, peer: str, entries: List[LogEntry]):
-        """Send AppendEntries RPC to a peer based on proto definition."""
-        stub = self._get_stub(peer)
+    async def _send_heartbeat(self, peer: str):
+        """Send an empty AppendEntries to a peer."""
+        await self.append_entries(peer, [])  # Heartbeats do not contain entries
+        # A rejected heartbeat moves next_index back; let the replicator send what the peer is missing
+        await self._notify(self.replication_changed)
 
+    async def append_entries(self, peer: str, entries: List[LogEntry]):
+        """Send one AppendEntries to a peer and update its next_index and match_index from the reply."""
+        return await self._finish_append(peer, *self._start_append(peer, entries))
+
+    def _start_append(self, peer: str, entries: List[LogEntry]):
+        """Send an AppendEntries with the entries that follow next_index, without waiting for the reply.
+
+        next_index moves past the entries right away, so the next frame can follow before this
+        one is acknowledged. Returns what _finish_append needs to process the reply.
+        """
         # Determine the prev_log_index and prev_log_term to send in the request
         prev_log_index = self.next_index[peer] - 1
-        prev_log_term = self.log[prev_log_index].term if prev_log_index >= 0 else 0
+        prev_log_term = self._term_at(prev_log_index)
 
         request = AppendEntriesRequest(
             term=self.current_term,
@@ -170,195 +493,970 @@ class RaftNode(RaftServiceServicer):
             prev_log_index=prev_log_index,
             prev_log_term=prev_log_term,
             entries=entries,
-            commit_index=self.commit_index
+            commit_index=self.commit_index,
+            group=self.group
         )
+        self.in_flight[peer] = self.in_flight.get(peer, 0) + 1
+        self.next_index[peer] += len(entries)
+        sent_at = self.loop.time()
+        return request, sent_at, self.rewinds.get(peer, 0), self._transmit(peer, request)
+
+    def _transmit(self, peer: str, request: AppendEntriesRequest):
+        """Queue a frame on the peer's AppendEntries stream, opening it if needed. Returns an awaitable reply."""
+        if peer in self.unary_peers:
+            return self._get_stub(peer).AppendEntries(request, timeout=self.rpc_timeout)
+        stream = self.append_streams.get(peer)
+        if stream is None or stream.closed:
+            stream = self.append_streams[peer] = AppendEntriesStream(self._get_stub(peer))
+        return asyncio.wait_for(stream.send(request), timeout=self.rpc_timeout)
+
+    async def _finish_append(self, peer: str, request: AppendEntriesRequest, sent_at: float, rewinds: int, reply):
+        """Wait for the reply to an AppendEntries and update next_index and match_index from it.
+
+        A rejection only moves next_index back using the follower's conflict hints; the
+        replicator loop then resends from there, so catching up never recurses. Frames sent
+        before the last rewind are already accounted for, so their rejections are ignored.
+        """
+        entries = request.entries
+        prev_log_index = request.prev_log_index
         try:
-            if len(entries) == 0:
-                logger.info(f"[{self.role}] Sending heartbeat {self.heartbeat_count} to {peer}")
-                self.heartbeat_count += 1
             # Send AppendEntries RPC to the follower
-            response = stub.AppendEntries(request)
+            response = await reply
+        except (grpc.RpcError, ConnectionError, asyncio.TimeoutError) as e:
+            if isinstance(e, grpc.RpcError) and e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                logger.info(f"[{self.role}] {peer} has no AppendEntries stream; sending it one RPC at a time")
+                self.unary_peers.add(peer)
+            self.unreachable_peers.add(peer)
+            if rewinds == self.rewinds.get(peer, 0):
+                # This frame and every later one may be lost; resend from the last acknowledged entry
+                logger.error(f"Failed to append entries to {peer}: Either server is down or there is an error ")
+                self._rewind(peer, self.match_index[peer] + 1)
+                if isinstance(e, asyncio.TimeoutError) and peer in self.append_streams:
+                    self.append_streams.pop(peer).close()  # Start over on a fresh stream rather than queue behind a stuck one
+            return None
+        finally:
+            self.in_flight[peer] -= 1
+
+        self.unreachable_peers.discard(peer)
+        if len(entries) == 0:
+            self.heartbeat_rtt[peer] = (self.loop.time() - sent_at) * 1000
+            logger.debug(f"[{self.role}] Heartbeat {self.heartbeat_count} to {peer} acknowledged in {self.heartbeat_rtt[peer]:.1f} ms")
+            self.heartbeat_count += 1
+        if response.term > self.current_term:
+            # Handle cases where the follower has a higher term (leader step down)
+            self._step_down(response.term)
+        elif self.role != "Leader" or request.term != self.current_term:
+            pass  # This node stepped down while the RPC was in flight; the reply is stale
+        else:
+            # Any reply in this term, even a rejection, shows the peer still follows this leader
+            self.last_ack[peer] = max(self.last_ack.get(peer, sent_at), sent_at)
             if response.success:
                 # Log replicated successfully, update next_index and match_index
-                self.match_index[peer] = prev_log_index + len(entries)
-                self.next_index[peer] = self.match_index[peer] + 1
-                # logger.info(f"[{self.role}] AppendEntries successful for {peer}. Updated next_index to {self.next_index[peer]}. {response.success}")
-            else:
-                # Log mismatch, decrement next_index and retry
-                self.next_index[peer] = max(0, self.next_index[peer] - 1)
+                self.match_index[peer] = max(self.match_index[peer], prev_log_index + len(entries))
+                self.next_index[peer] = max(self.next_index[peer], self.match_index[peer] + 1)
+            elif rewinds == self.rewinds.get(peer, 0):
+                # Log mismatch, jump back past the whole conflicting term instead of one entry at a time
+                self._rewind(peer, self._next_index_after_conflict(response))
                 logger.warning(f"AppendEntries failed for {peer}, retrying with next_index={self.next_index[peer]}")
-                
-                # Retry sending entries if there's still more log to send
-                if self.next_index[peer] >= 0:
-                    self.append_entries(peer, self.log[self.next_index[peer]:])
 
-            # Handle cases where the follower has a higher term (leader step down)
-            if response.term > self.current_term:
-                logger.info(f"[{self.role}] Term out of date. Stepping down. Peer term: {response.term}, current term: {self.current_term}")
-                self.current_term = response.term
-                self.update_role("Follower")
-                self.save_term()
+            if self.last_ack[peer] < self.read_round_requested:
+                # This RPC left before a pending read started; send another right away instead of at the next heartbeat
+                self._spawn(self._send_heartbeat(peer))
+
+        return response
+
+    def _rewind(self, peer: str, next_index: int):
+        """Move next_index back, making the replies to frames already in flight stale."""
+        self.next_index[peer] = next_index
+        self.rewinds[peer] = self.rewinds.get(peer, 0) + 1
+
+    def _next_index_after_conflict(self, response: AppendEntriesResponse) -> int:
+        """Pick the next index to try from a follower's conflict hints."""
+        if response.conflict_term > 0:
+            # If this log has entries from the conflicting term, resume right after the last of them
+            index = self.log.last_index_with_term_at_most(response.conflict_term)
+            if index is not None and self._term_at(index) == response.conflict_term:
+                return index + 1
+        return max(0, response.conflict_index)
+
+    def _quorum_size(self) -> int:
+        """Number of voters, including this one, that form a majority of the cluster."""
+        return (len(self.voters) + 1) // 2 + 1
+
+    def _replicated_count(self, index: int) -> int:
+        """Number of voters, including this one, whose log is known to contain the given index. Learners do not count."""
+        return 1 + sum(1 for peer in self.voters if self.match_index[peer] >= index)
+
+    def _needs_snapshot(self, peer: str) -> bool:
+        """Whether the entries a peer needs next have already been compacted out of the log."""
+        prev_log_index = self.next_index[peer] - 1
+        if self.next_index[peer] < self.log.first_index:
+            return True
+        return 0 <= prev_log_index < self.log.first_index and prev_log_index != self.snapshot_index
+
+    def _entries_for(self, peer: str) -> List[LogEntry]:
+        """Read the next chunk of entries a peer is missing from the log, at least one entry and at most max_append_bytes."""
+        start = self.next_index[peer]
+        entries = self.log.read(start, start + self.max_append_entries)
+        size = 0
+        for count, entry in enumerate(entries):
+            size += entry.ByteSize()
+            if size > self.max_append_bytes and count > 0:
+                return entries[:count]
+        return entries
+
+    def _can_send(self, peer: str) -> bool:
+        """Whether the replicator may send the peer more entries now: it is missing some and the window has room."""
+        if self.next_index[peer] >= len(self.log):
+            return False
+        outstanding = self.in_flight.get(peer, 0)
+        if self._needs_snapshot(peer):
+            return outstanding == 0  # A snapshot replaces the log prefix; let earlier frames settle first
+        if peer in self.unary_peers or peer in self.unreachable_peers:
+            return outstanding == 0
+        return outstanding < self.append_window
+
+    async def _run_replicator(self, peer: str):
+        """Background task that ships missing entries to one peer whenever this node is the leader.
+
+        Entries are sent in chunks without waiting for earlier chunks to be acknowledged, up to
+        the in-flight window. It ends when the peer leaves the cluster configuration.
+        """
+        while True:
+            async with self.replication_changed:
+                await self.replication_changed.wait_for(
+                    lambda: peer not in self.peers or (self.role == "Leader" and self._can_send(peer))
+                )
+            if peer not in self.peers:
+                self.replicators.pop(peer, None)
+                return
+
+            if self._needs_snapshot(peer):
+                # The peer is too far behind for the log alone; catch it up in one transfer
+                response = await self.send_snapshot(peer)
+                await self._notify(self.replication_changed)
+                if response is None:
+                    logger.error(f"No response received from peer {peer}. Retrying in {self.replication_retry_interval}s")
+                    await asyncio.sleep(self.replication_retry_interval)
+            else:
+                # Send the next chunk of entries the peer is missing, including any new batch
+                self._spawn(self._replicate(peer, self._start_append(peer, self._entries_for(peer))))
 
-            return response
+    async def _replicate(self, peer: str, started):
+        """Wait for the reply to a chunk sent by the replicator, backing off if the peer did not answer."""
+        response = await self._finish_append(peer, *started)
+        if response is None:
+            # Hold a window slot meanwhile, so a peer that is down is not sent frame after frame
+            self.in_flight[peer] += 1
+            try:
+                logger.error(f"No response received from peer {peer}. Retrying in {self.replication_retry_interval}s")
+                await asyncio.sleep(self.replication_retry_interval)
+            finally:
+                self.in_flight[peer] -= 1
+        await self._notify(self.replication_changed)
+
+    async def send_snapshot(self, peer: str):
+        """Stream the latest snapshot to a peer in chunks with the InstallSnapshot RPC."""
+        meta, snapshot_file = self.snapshots.open()
+        if snapshot_file is None:
+            logger.error(f"[{self.role}] No snapshot available to send to {peer}")
+            return None
+        term = self.current_term
+
+        async def chunks():
+            offset = 0
+            while True:
+                data = await self._run_io(snapshot_file.read, min(self.snapshot_chunk_size, meta.size - offset))
+                done = offset + len(data) >= meta.size
+                yield InstallSnapshotRequest(
+                    term=term,
+                    leader_id=self.node_id,
+                    last_included_index=meta.last_included_index,
+                    last_included_term=meta.last_included_term,
+                    offset=offset,
+                    data=data,
+                    done=done,
+                    config=meta.config,
+                    group=self.group
+                )
+                offset += len(data)
+                if done:
+                    break
 
+        stub = self._get_stub(peer)
+        self.in_flight[peer] = self.in_flight.get(peer, 0) + 1
+        try:
+            logger.info(f"[{self.role}] Sending snapshot up to index {meta.last_included_index} ({meta.size} bytes) to {peer}")
+            response = await stub.InstallSnapshot(chunks(), timeout=self.snapshot_timeout)
         except grpc.RpcError as e:
-            logger.error(f"Failed to append entries to {peer}: Either server is down or there is an error ")
+            logger.error(f"Failed to install snapshot on {peer}: Either server is down or there is an error")
             return None
+        finally:
+            self.in_flight[peer] -= 1
+            snapshot_file.close()
 
-    def handle_append_response(self, response: AppendEntriesResponse):
-        """Handle the response of an AppendEntries RPC."""
-        if response.success:
-            logger.info(f"[{self.role}] Log entry replicated on node {response.node_id}")
-        else:
-            logger.info(f"[{self.role}] AppendEntries failed on node {response.node_id}. Retrying...")
+        if response.term > self.current_term:
+            self._step_down(response.term)
+        elif response.success and self.role == "Leader" and term == self.current_term:
+            self.match_index[peer] = max(self.match_index[peer], meta.last_included_index)
+            self.next_index[peer] = meta.last_included_index + 1
+        return response
 
     def _get_stub(self, peer: str):
-        """Get the gRPC stub for a peer."""
-        channel = grpc.insecure_channel(peer)
-        return RaftServiceStub(channel)
+        """Get the gRPC stub for a peer from its pooled, long-lived channel."""
+        return self.connections.stub(peer)
 
     def propose_log_entry(self, data) -> bool:
-        """Propose a new log entry to be committed by the leader."""
-        logger.info("----------------------Propose Log Entry----------------------")
+        """Propose a new log entry and block until its batch is committed or rejected."""
+        committed, _ = self._call(self.propose(data))
+        return committed
+
+    def execute(self, data) -> Tuple[bool, Any]:
+        """Commit an entry and block until this node has applied it. Returns (committed, apply result)."""
+        return self._call(self.propose(data, wait_for_apply=True))
+
+    async def propose(self, data, wait_for_apply: bool = False, config: str = "") -> Tuple[bool, Any]:
+        """Queue a proposal for the next batch and wait for the batch's outcome, and optionally for its apply result.
+
+        A non-empty config proposes a configuration entry instead of a state machine command.
+        """
         if self.role != "Leader":
             logger.info(f"[{self.role}] Node {self.node_id} is not the leader and cannot propose log entry.")
-            return False
+            return False, None
+        if self.transfer_target is not None:
+            logger.info(f"[{self.role}] Leadership is being transferred to {self.transfer_target}. Rejecting proposal.")
+            return False, None
 
-        # Create a new log entry with the current term and data
-        new_log_entry = LogEntry(term=self.current_term, data=data)
-        self.log.append(new_log_entry)
-        self.save_log()  # Persist the updated log to disk or storage
+        proposal = Proposal(data, self.loop.create_future(), self.loop.create_future() if wait_for_apply else None, config)
+        self.pending_proposals.append(proposal)
+        self.proposals_pending.set()
+        if len(self.pending_proposals) >= self.max_batch_size:
+            self.batch_full.set()
+        if not await proposal.future:
+            return False, None
+        if proposal.applied is None:
+            return True, None
+        return True, await proposal.applied
 
-        # Send AppendEntries RPC to all peers
-        votes_received = 1  # Start with the leader's own vote
+    async def _next_batch(self) -> List[Proposal]:
+        """Wait for pending proposals and collect them for up to batch_window or max_batch_size."""
+        await self.proposals_pending.wait()
+        if len(self.pending_proposals) < self.max_batch_size:
+            try:
+                await asyncio.wait_for(self.batch_full.wait(), timeout=self.batch_window)
+            except asyncio.TimeoutError:
+                pass
 
-        for peer in self.peers:  # Assuming peers is a list of peer addresses (host:port)
-            if peer not in self.next_index:
-                logger.error(f"Peer {peer} has no next_index entry.")
-                continue
+        batch = self.pending_proposals[:self.max_batch_size]
+        self.pending_proposals = self.pending_proposals[self.max_batch_size:]
+        if len(self.pending_proposals) < self.max_batch_size:
+            self.batch_full.clear()
+        if not self.pending_proposals:
+            self.proposals_pending.clear()
+        return batch
+
+    async def _run_group_commit(self):
+        """Background task that commits pending proposals in batches.
 
-            # If the peer's log is shorter, send all missing entries
-            if self.next_index[peer] < len(self.log):
-                # Get the missing log entries for this peer
-                missing_entries = self.log[self.next_index[peer]:]  # Fetch missing entries starting from next_index
-                response = self.append_entries(peer, missing_entries)  # Send AppendEntries with missing entries
+        Batches reach the disk one after another, but up to append_window of them may wait for
+        a majority at the same time, so a burst is not limited to one batch per round trip.
+        """
+        while True:
+            await self.batch_slots.acquire()
+            batch = await self._next_batch()
+            try:
+                appended = await self._append_batch(batch)
+            except Exception as e:
+                logger.error(f"[{self.role}] Group commit of {len(batch)} entries failed: {e}")
+                appended = None
+            if appended is None:
+                self.batch_slots.release()
+                self._reject_batch(batch)
             else:
-                # Send only the new log entry if logs are consistent
-                response = self.append_entries(peer, [new_log_entry])
+                self._spawn(self._finish_batch(batch, *appended))
 
-            # Check if response is None or has a success attribute
-            if response is None:
-                logger.error(f"No response received from peer {peer}.")
-                continue  # Skip processing for this peer if no response
+    async def _finish_batch(self, batch: List[Proposal], term: int, last_index: int):
+        """Wait for a batch that is on disk to commit and report the outcome to its proposers."""
+        try:
+            committed = await self._commit_batch(batch, term, last_index)
+        except Exception as e:
+            logger.error(f"[{self.role}] Group commit of {len(batch)} entries failed: {e}")
+            committed = False
+        finally:
+            self.batch_slots.release()
+        if committed:
+            for proposal in batch:
+                proposal.resolve(True)
+        else:
+            self._reject_batch(batch)
 
-            # Process the response
-            if response.success:
-                votes_received += 1
-            elif response.term > self.current_term:
-                # If the peer's term is higher, the current leader must step down
-                logger.info(f"[{self.role}] Term out of date. Stepping down. Peer term: {response.term}, current term: {self.current_term}")
-                self.current_term = response.term
-                self.update_role("Follower")
-                self.save_term()
-                return False
-
-        # If a majority of votes are received, commit the log entry
-        if votes_received > len(self.peers) // 2:
-            self.commit_index += 1  # Increment commit index
-            self.save_log()  # Persist the log after committing
-            logger.info(f"[{self.role}] Log entry committed by majority. Data: {data}")
+    def _reject_batch(self, batch: List[Proposal]):
+        for proposal in batch:
+            if proposal.index is not None:
+                self.apply_waiters.pop(proposal.index, None)
+            proposal.resolve(False)
+
+    async def _append_batch(self, batch: List[Proposal]) -> Optional[Tuple[int, int]]:
+        """Append a batch of proposals and persist it once. Returns (term, last index), or None if this node no longer leads."""
+        logger.info("----------------------Propose Log Entry----------------------")
+        if self.role != "Leader":
+            logger.info(f"[{self.role}] Node {self.node_id} is no longer the leader. Rejecting {len(batch)} proposals.")
+            return None
+
+        # Create the new log entries with the current term and persist them with a single write
+        term = self.current_term
+        new_entries = [LogEntry(term=term, data=proposal.data, config=proposal.config) for proposal in batch]
+        self.log.append(new_entries)
+        for offset, proposal in enumerate(batch):
+            proposal.index = len(self.log) - len(batch) + offset
+            if proposal.applied is not None:
+                # Register before the commit index can move: a later batch may commit this one along with it
+                self.apply_waiters[proposal.index] = proposal.applied
+        self._record_configuration(len(self.log) - len(batch), new_entries)
+        last_index = len(self.log) - 1
+        await self._run_io(self.log.sync)
+        return term, last_index
+
+    async def _commit_batch(self, batch: List[Proposal], term: int, last_index: int) -> bool:
+        """Replicate a persisted batch and commit it once a majority has it."""
+        # Wake the replicators and wait until a majority has the batch; slower peers catch up in the background
+        try:
+            async with self.replication_changed:
+                self.replication_changed.notify_all()
+                await asyncio.wait_for(self.replication_changed.wait_for(
+                    lambda: self.role != "Leader" or self.current_term != term or
+                    self._replicated_count(last_index) >= self._quorum_size()
+                ), timeout=self.replication_timeout)
+        except asyncio.TimeoutError:
+            pass
+        votes_received = self._replicated_count(last_index)
+
+        if self.role != "Leader" or self.current_term != term:
+            # A peer reported a higher term while replicating and this node stepped down
+            logger.info(f"[{self.role}] Node {self.node_id} stepped down while replicating. Batch rejected.")
+            return False
+
+        # If a majority of votes are received, commit the whole batch
+        if votes_received >= self._quorum_size():
+            await self._advance_commit_index(last_index)
+            logger.info(f"[{self.role}] Batch of {len(batch)} entries committed by majority up to index {last_index}")
             logger.info("----------------------Propose Log Entry Concluded ----------------------")
             return True
         else:
-            logger.info(f"[{self.role}] Not enough votes to commit log entry. Votes received: {votes_received}")
+            logger.info(f"[{self.role}] Not enough votes to commit batch of {len(batch)} entries. Votes received: {votes_received}")
             logger.info("----------------------Propose Log Entry Concluded ----------------------")
             return False
-        
 
-    # RPC handlers for Raft protocol
+    async def _advance_commit_index(self, index: int):
+        """Move the commit index forward and wake the applier."""
+        if index > self.commit_index:
+            self.commit_index = index
+            await self._notify(self.commit_changed)
+
+    async def _run_applier(self):
+        """Background task that feeds committed entries to the apply thread in order."""
+        while True:
+            async with self.commit_changed:
+                await self.commit_changed.wait_for(lambda: self.commit_index > self.last_applied)
+
+            start = self.last_applied + 1
+            results = {}
+            try:
+                entries = self.log.read(start, min(self.commit_index + 1, start + self.max_append_entries))
+                await self.loop.run_in_executor(self.apply_executor, self._apply_entries, start, entries, results)
+            except Exception as e:
+                logger.error(f"[{self.role}] Failed to apply log entry {self.last_applied + 1}: {e}")
+                await asyncio.sleep(self.replication_retry_interval)
+            finally:
+                for index, result in results.items():
+                    waiter = self.apply_waiters.pop(index, None)
+                    if waiter is not None and not waiter.done():
+                        waiter.set_result(result)
+                await self._notify(self.applied_changed)
+
+    def _apply_entries(self, start: int, entries: List[LogEntry], results: Dict[int, Any]):
+        """Apply committed entries to the state machine, collecting each result. Runs on the apply thread."""
+        for offset, entry in enumerate(entries):
+            if start + offset <= self.last_applied:
+                results[start + offset] = None  # Already covered by a snapshot installed in the meantime
+                continue
+            if entry.data:  # Empty entries are the no-ops a new leader commits, not state machine commands
+                results[start + offset] = self.state_machine.apply(start + offset, entry)
+            self.last_applied = start + offset
+
+    def _capture_state(self):
+        """Serialize the state machine with the index it reflects. Runs on the apply thread."""
+        return self.last_applied, self.state_machine.snapshot()
+
+    def _restore_state(self, index: int, state: bytes):
+        """Replace the state machine with a snapshot's state. Runs on the apply thread."""
+        self.state_machine.restore(state)
+        self.last_applied = index
+
+    async def _run_snapshotter(self):
+        """Background task that takes a snapshot once enough entries have been applied since the last one."""
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if self.last_applied - self.snapshot_index >= self.snapshot_threshold:
+                try:
+                    await self.take_snapshot()
+                except Exception as e:
+                    logger.error(f"[{self.role}] Failed to take snapshot: {e}")
+
+    async def take_snapshot(self):
+        """Save the applied state and compact the log prefix it covers.
+
+        The state is captured on the apply thread between two batches of entries;
+        writing the snapshot and compacting the log happen while proposals and
+        replication carry on.
+        """
+        async with self.snapshot_lock:
+            index, state = await self.loop.run_in_executor(self.apply_executor, self._capture_state)
+            if index <= self.snapshot_index:
+                return
+            term = self._term_at(index)
+            members = self._configuration_at(index)
+
+            await self._run_io(self.snapshots.save, index, term, state, json.dumps(members))
+            self.snapshot_index, self.snapshot_term = index, term
+            self.log.compact(index)
+            self.config_history = [(index, members)] + [config for config in self.config_history if config[0] > index]
+            logger.info(f"[{self.role}] Log compacted up to index {index}. Log now starts at {self.log.first_index}")
+
+    def wait_for_read(self, max_staleness: Optional[float] = None) -> bool:
+        """Block until this node's state machine is current enough to serve a read.
+
+        With max_staleness=None the read is linearizable: the node applies everything the
+        leader had committed when the read arrived. Otherwise state that was current at
+        most max_staleness seconds ago is accepted without contacting the leader.
+        Returns False if the node cannot get there, e.g. while there is no leader.
+        """
+        return self.start_read(max_staleness).result()
+
+    def start_read(self, max_staleness: Optional[float] = None) -> futures.Future:
+        """Begin wait_for_read without blocking, so reads on several groups can wait in parallel."""
+        return self._submit(self._wait_for_read(max_staleness))
+
+    async def _wait_for_read(self, max_staleness: Optional[float]) -> bool:
+        if max_staleness is not None and self._fresh_within(max_staleness):
+            return True
+        if self.role == "Leader":
+            index = await self.read_index()
+        else:
+            index = await self._remote_read_index()
+        if index is None:
+            return False
+        return await self._wait_for_applied(index)
+
+    def _quorum_ack_time(self) -> float:
+        """Latest time at which a majority, counting this leader, was known to follow it."""
+        if self._quorum_size() == 1:
+            return self.loop.time()
+        acks = sorted((self.last_ack.get(peer, float("-inf")) for peer in self.voters), reverse=True)
+        return acks[self._quorum_size() - 2]
+
+    def _lease_valid(self) -> bool:
+        """Whether no other node can have become leader since the last majority acknowledgement.
+
+        Followers refuse pre-votes for election_timeout_min after hearing from the leader,
+        so a new leader cannot be elected within that time of a majority's last ack.
+        """
+        if self.current_term == self.lease_revoked_term:
+            return False  # A peer was told to start an election without waiting for the timeout
+        return self.loop.time() < self._quorum_ack_time() + self.lease_duration
+
+    def _fresh_within(self, max_staleness: float) -> bool:
+        """Whether this node has applied everything committed as of at most max_staleness seconds ago."""
+        if self.role == "Leader":
+            confirmed_at, index = self._quorum_ack_time(), self.commit_index
+        else:
+            confirmed_at, index = self.last_leader_contact, self.leader_commit_seen
+        return self.loop.time() - confirmed_at <= max_staleness and self.last_applied >= index
+
+    async def _confirm_leadership(self) -> bool:
+        """Send a round of heartbeats and check that a majority still follows this leader.
+
+        Concurrent reads share the round: peers that already have an RPC in flight are not sent another.
+        """
+        start = self.loop.time()
+        term = self.current_term
+        self.read_round_requested = start
+        for peer in self.voters:
+            if not self.in_flight.get(peer) and not self._needs_snapshot(peer):
+                self._spawn(self._send_heartbeat(peer))
+
+        def confirmed():
+            return 1 + sum(1 for peer in self.voters if self.last_ack.get(peer, float("-inf")) >= start) >= self._quorum_size()
+
+        try:
+            async with self.replication_changed:
+                await asyncio.wait_for(self.replication_changed.wait_for(
+                    lambda: self.role != "Leader" or self.current_term != term or confirmed()
+                ), timeout=self.rpc_timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.role == "Leader" and self.current_term == term and confirmed()
+
+    async def read_index(self) -> Optional[int]:
+        """Commit index that a linearizable read must wait for, or None if this node cannot confirm it leads."""
+        if self.role != "Leader":
+            return None
+        term = self.current_term
+        if self._term_at(self.commit_index) != term:
+            # Wait for the no-op of this term to commit, which also commits every earlier entry
+            try:
+                async with self.commit_changed:
+                    await asyncio.wait_for(self.commit_changed.wait_for(
+                        lambda: self.role != "Leader" or self.current_term != term or self._term_at(self.commit_index) == term
+                    ), timeout=self.replication_timeout)
+            except asyncio.TimeoutError:
+                return None
+            if self.role != "Leader" or self.current_term != term:
+                return None
+
+        index = self.commit_index
+        if self.lease_reads and self._lease_valid():
+            return index
+        return index if await self._confirm_leadership() else None
+
+    async def _remote_read_index(self) -> Optional[int]:
+        """Ask the current leader for a read index."""
+        leader = await self._leader_address(0)
+        if leader is None:
+            return None
+        try:
+            response = await self._get_stub(leader).ReadIndex(ReadIndexRequest(node_id=self.node_id, group=self.group), timeout=self.rpc_timeout)
+        except grpc.RpcError as e:
+            logger.info(f"[{self.role}] Failed to get a read index from {leader}: Server did not respond")
+            return None
+        return response.read_index if response.success else None
+
+    async def _wait_for_applied(self, index: int) -> bool:
+        """Wait until the state machine has applied the given index."""
+        try:
+            async with self.applied_changed:
+                await asyncio.wait_for(self.applied_changed.wait_for(
+                    lambda: self.last_applied >= index
+                ), timeout=self.replication_timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    # Membership changes add, promote, demote or remove one node at a time, so a majority of the old
+    # configuration always overlaps a majority of the new one and no joint configuration is needed
+    def _load_configuration(self, snapshot_config: str) -> List[Tuple[int, Dict[str, str]]]:
+        """Rebuild the configuration history from the snapshot and the configuration entries in the log."""
+        if snapshot_config:
+            members = json.loads(snapshot_config)
+        elif self.node_address in RAFT_INITIAL_MEMBERS:
+            members = {address: "voter" for address in RAFT_INITIAL_MEMBERS}
+        else:
+            members = {}  # A node outside the initial cluster waits for the leader to add it
+        history = [(self.snapshot_index, members)]
+        for offset, entry in enumerate(self.log.read(self.log.first_index)):
+            if entry.config:
+                history.append((self.log.first_index + offset, json.loads(entry.config)))
+        return history
+
+    def _use_configuration(self):
+        """Switch to the latest configuration in the history, starting and stopping peer replication to match."""
+        members = self.config_history[-1][1]
+        if members != self.members:
+            logger.info(f"[{self.role}] Cluster members: {members}")
+        for peer in self.peers:
+            if peer not in members:
+                if peer in self.append_streams:
+                    self.append_streams.pop(peer).close()
+                self._spawn(self.connections.remove(peer))
+                self._spawn(self._notify(self.replication_changed))  # Lets its replicator exit
+        self.members = members
+        self.peers = [address for address in members if address != self.node_address]
+        self.voters = [address for address in self.peers if members[address] == "voter"]
+        for peer in self.peers:
+            if peer not in self.replicators:
+                self.next_index[peer] = len(self.log)
+                self.match_index[peer] = -1
+                self.last_ack.pop(peer, None)
+                self.connections.connection(peer)
+                self.replicators[peer] = self._spawn(self._run_replicator(peer))
+
+    def _record_configuration(self, start: int, entries: List[LogEntry]):
+        """Adopt the configuration entries among entries just appended to the log at start."""
+        configs = [(start + offset, json.loads(entry.config)) for offset, entry in enumerate(entries) if entry.config]
+        if configs:
+            self.config_history.extend(configs)
+            self._use_configuration()
+
+    def _truncate_configuration(self, index: int):
+        """Fall back to the previous configuration when the log is truncated from index on."""
+        if self.config_history[-1][0] >= index:
+            # The first configuration comes from the snapshot, which a truncation never reaches
+            self.config_history = self.config_history[:1] + [config for config in self.config_history[1:] if config[0] < index]
+            self._use_configuration()
+
+    def _configuration_at(self, index: int) -> Dict[str, str]:
+        """Membership as of the given log index."""
+        return [members for config_index, members in self.config_history if config_index <= index][-1]
+
+    def _is_voter(self) -> bool:
+        return self.members.get(self.node_address) == "voter"
+
+    def change_membership(self, address: str, role: Optional[str]) -> Tuple[bool, str]:
+        """Make a node a voter or a learner, adding it if needed, or remove it when role is None. Returns (success, message)."""
+        return self._call(self._change_membership(address, role))
+
+    async def _change_membership(self, address: str, role: Optional[str]) -> Tuple[bool, str]:
+        if self.role != "Leader":
+            return False, "This node is not the leader."
+        if role not in ("voter", "learner", None):
+            return False, f"Unknown role {role}."
+        if address == self.node_address:
+            return False, "The leader cannot change its own membership; transfer leadership first."
+
+        async with self.membership_lock:
+            if self.members.get(address) == role:
+                return True, f"{address} is already {role or 'not a member'}."
+            if role == "voter":
+                if address not in self.members:
+                    # Start as a learner, so the new node catches up before it counts towards a majority
+                    success, message = await self._propose_configuration({**self.members, address: "learner"})
+                    if not success:
+                        return False, message
+                if not await self._wait_for_catch_up(address):
+                    return False, f"{address} did not catch up within {self.catch_up_timeout}s; it stays a learner."
+
+            members = dict(self.members)
+            if role is None:
+                members.pop(address, None)
+            else:
+                members[address] = role
+            return await self._propose_configuration(members)
+
+    async def _propose_configuration(self, members: Dict[str, str]) -> Tuple[bool, str]:
+        """Append a configuration entry and wait for it to commit."""
+        term = self.current_term
+        try:
+            # A leader may change the configuration only after committing an entry of its own term, and
+            # only once the previous change has committed
+            async with self.commit_changed:
+                await asyncio.wait_for(self.commit_changed.wait_for(
+                    lambda: self.role != "Leader" or self.current_term != term or
+                    (self._term_at(self.commit_index) == term and self.config_history[-1][0] <= self.commit_index)
+                ), timeout=self.replication_timeout)
+        except asyncio.TimeoutError:
+            return False, "The previous configuration has not committed yet."
+        if self.role != "Leader" or self.current_term != term:
+            return False, "This node lost leadership."
+
+        committed, _ = await self.propose("", config=json.dumps(members))
+        if not committed:
+            return False, "The configuration entry was not committed."
+        logger.info(f"[{self.role}] Committed cluster configuration {members}")
+        return True, f"Cluster members: {members}"
+
+    async def _wait_for_catch_up(self, peer: str) -> bool:
+        """Wait until a peer has every entry committed when the wait began."""
+        target = self.commit_index
+        try:
+            async with self.replication_changed:
+                await asyncio.wait_for(self.replication_changed.wait_for(
+                    lambda: self.role != "Leader" or peer not in self.peers or self.match_index[peer] >= target
+                ), timeout=self.catch_up_timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.role == "Leader" and peer in self.peers
+
+    def transfer_leadership(self, target: Optional[str] = None) -> Tuple[bool, str]:
+        """Hand leadership to a peer, or to the most up-to-date one if none is given. Returns (success, message)."""
+        return self._call(self._transfer_leadership(target))
+
+    async def _transfer_leadership(self, target: Optional[str]) -> Tuple[bool, str]:
+        """Stop taking proposals, let the target catch up, then tell it to start an election at once."""
+        if self.role != "Leader":
+            return False, "This node is not the leader."
+        if self.transfer_target is not None:
+            return False, f"Leadership is already being transferred to {self.transfer_target}."
+        if not target and self.voters:
+            target = max(self.voters, key=lambda peer: self.match_index.get(peer, -1))
+        if target not in self.voters:
+            return False, f"{target} is not a voting member of the cluster."
+
+        term = self.current_term
+        self.transfer_target = target
+        logger.info(f"[{self.role}] Transferring leadership to {target}")
+        def caught_up():
+            # Proposals queued before the transfer began are still appended; the target needs them too,
+            # or the other nodes would refuse it their votes
+            return not self.pending_proposals and self.match_index[target] >= len(self.log) - 1
+
+        try:
+            async with self.replication_changed:
+                await asyncio.wait_for(self.replication_changed.wait_for(
+                    lambda: self.role != "Leader" or self.current_term != term or caught_up()
+                ), timeout=self.transfer_timeout)
+            if self.role != "Leader" or self.current_term != term:
+                return False, "This node lost leadership before the transfer."
+
+            self.lease_revoked_term = term
+            response = await self._get_stub(target).TimeoutNow(
+                TimeoutNowRequest(term=term, leader_id=self.node_id, group=self.group), timeout=self.rpc_timeout
+            )
+            if not response.success:
+                return False, f"{target} refused to start an election."
+
+            # The target's RequestVote makes this node step down; wait for the new leader's first
+            # heartbeat too, so requests this node still holds can be forwarded to it
+            async with self.leader_changed:
+                await asyncio.wait_for(self.leader_changed.wait_for(
+                    lambda: self.current_term != term and self.leader_id is not None
+                ), timeout=self.transfer_timeout)
+            if self.leader_id == self.node_id:
+                return False, f"{target} lost the election and this node was elected again."
+            logger.info(f"[{self.role}] Handed leadership to {self.leader_id}")
+            return True, f"Leadership transferred to {self.leader_id}:5000."
+        except asyncio.TimeoutError:
+            return False, f"{target} did not take over within {self.transfer_timeout:.1f}s."
+        except grpc.RpcError:
+            return False, f"{target} did not respond to TimeoutNow."
+        finally:
+            self.transfer_target = None
+
+    def _preferred_leader(self) -> Optional[str]:
+        """Address of the voter that should lead this group, so the leaders of different groups land on different nodes."""
+        voters = sorted(address for address, role in self.members.items() if role == "voter")
+        if self.preferred_leader_rank is None or not voters:
+            return None
+        return voters[self.preferred_leader_rank % len(voters)]
+
+    async def _run_leader_balancer(self):
+        """Background task that hands leadership to the preferred node once it is connected and caught up."""
+        while True:
+            await asyncio.sleep(self.balance_interval)
+            target = self._preferred_leader()
+            if self.role != "Leader" or self.transfer_target is not None or target in (None, self.node_address):
+                continue
+            if target not in self.voters or self.match_index[target] < self.commit_index:
+                continue
+            if self.loop.time() - self.last_ack.get(target, float("-inf")) > self.election_timeout_min:
+                continue  # Not heard from recently; it may be down or restarting
+            success, message = await self._transfer_leadership(target)
+            logger.info(f"[{self.role}] Rebalancing group {self.group}: {message}")
+
+    # RPC handlers for Raft protocol. They run on gRPC server threads and hand the work to the event loop.
     def RequestVote(self, request, context):
         """Handle RequestVote RPC from a candidate."""
-        if (request.term > self.current_term or
-                (request.term == self.current_term and self.voted_for in (None, request.candidate_id))):
+        return self._call(self._handle_request_vote(request))
+
+    async def _handle_request_vote(self, request: VoteRequest) -> VoteResponse:
+        """Grant a vote once per term, and only to a candidate whose log is at least as up to date."""
+        last_log_index = len(self.log) - 1
+        last_log_term = self._term_at(last_log_index)
+        log_ok = (request.last_log_term > last_log_term or
+                  (request.last_log_term == last_log_term and request.last_log_index >= last_log_index))
+
+        if request.pre_vote:
+            # Answer without touching the term, the vote or the election timer
+            granted = request.term > self.current_term and log_ok and not self._leader_recently_seen()
+            return VoteResponse(term=self.current_term, vote_granted=granted)
+
+        if request.term > self.current_term:
+            self._step_down(request.term)
+
+        if (request.term == self.current_term and log_ok and
+                self.voted_for in (None, request.candidate_id)):
             self.voted_for = request.candidate_id
-            self.current_term = request.term
-            self.election_timer.cancel()  # Reset election timer
+            self.save_term()
+            self._reset_election_timer()
             return VoteResponse(term=self.current_term, vote_granted=True)
         return VoteResponse(term=self.current_term, vote_granted=False)
 
     def AppendEntries(self, request: AppendEntriesRequest, context):
         """Follower handling of AppendEntries RPC based on proto definition."""
+        return self._call(self._handle_append_entries(request))
+
+    def AppendEntriesStream(self, request_iterator, context):
+        """Follower handling of the leader's AppendEntries stream: frames are handled in order, each answered in turn."""
+        for request in request_iterator:
+            yield self._call(self._handle_append_entries(request))
 
-        # Reject if the leader's term is outdated
-        if request.term < self.current_term:
+    async def _handle_append_entries(self, request: AppendEntriesRequest) -> AppendEntriesResponse:
+        """Check the leader's term and log consistency, then append the new entries."""
+
+        # Reject if the leader's term is outdated; otherwise follow it and reset the election timer
+        if not self._accept_leader(request.term, request.leader_id):
             logger.warning(f"Received outdated term: {request.term}. Current term: {self.current_term}.")
             return AppendEntriesResponse(term=self.current_term, success=False, node_id=self.node_id)
 
-        # If the leader's term is higher, update the current term and become a follower
-        if request.term > self.current_term:
-            logger.info(f"[{self.role}] Term updated: {self.current_term} -> {request.term}. Becoming follower.")
-            self.current_term = request.term
-            self.role = 'Follower'
-            self.voted_for = None
-            # self.save_state() // Review later
-
-        # Reset the election timer
-        self.election_timer.cancel()
-        self.election_timer = threading.Timer(self._random_timeout(), self.start_election)
-        self.election_timer.start()
+        # Append new log entries (if any) after prev_log_index
+        prev_log_index = request.prev_log_index
+        new_entries = [LogEntry(term=entry.term, data=entry.data, config=entry.config) for entry in request.entries]  # Convert to list of LogEntry
+        if prev_log_index < self.snapshot_index:
+            # Entries covered by the snapshot are committed and match; skip the ones already in it
+            new_entries = new_entries[self.snapshot_index - prev_log_index:]
+            prev_log_index = self.snapshot_index
 
         # Check log consistency with prev_log_index and prev_log_term
-        if request.prev_log_index >= 0:
-            if len(self.log) <= request.prev_log_index:
-                # Log is too short, reject the request
+        if prev_log_index >= 0:
+            if len(self.log) <= prev_log_index:
+                # Log is too short, reject the request and tell the leader where the log ends
                 logger.warning(f"Log consistency failed: Follower's log too short (length {len(self.log)}).")
-                return AppendEntriesResponse(term=self.current_term, success=False, node_id=self.node_id)
+                return AppendEntriesResponse(term=self.current_term, success=False, node_id=self.node_id,
+                                             conflict_term=0, conflict_index=len(self.log))
 
-            if self.log[request.prev_log_index].term != request.prev_log_term:
-                # Log term mismatch at prev_log_index
-                logger.warning(f"Log consistency failed: Term mismatch at index {request.prev_log_index}.")
-                # Optional: Truncate log if necessary (depending on your protocol logic)
-                self.log = self.log[:request.prev_log_index]
-                self.save_log()  # Persist the truncated log
-                return AppendEntriesResponse(term=self.current_term, success=False, node_id=self.node_id)
+            conflict_term = self._term_at(prev_log_index)
+            if prev_log_index == request.prev_log_index and conflict_term != request.prev_log_term:
+                # Log term mismatch at prev_log_index; point the leader at the first entry of the conflicting term
+                conflict_index = max(self.snapshot_index + 1, self.log.first_index_with_term_at_least(conflict_term, prev_log_index))
+                logger.warning(f"Log consistency failed: Term mismatch at index {prev_log_index}. Conflict term {conflict_term} starts at {conflict_index}.")
+                # Drop the conflicting entry and everything after it
+                self.log.truncate(prev_log_index)
+                self._truncate_configuration(prev_log_index)
+                await self._run_io(self.log.sync)
+                return AppendEntriesResponse(term=self.current_term, success=False, node_id=self.node_id,
+                                             conflict_term=conflict_term, conflict_index=conflict_index)
 
-        # Append new log entries (if any) after prev_log_index
-        new_entries = [LogEntry(term=entry.term, data=entry.data) for entry in request.entries]  # Convert to list of LogEntry
         if new_entries:
-            logger.info(f"[{self.role}] Appending {len(new_entries)} new entries to the log.")
-            # Remove conflicting entries and append new ones
-            self.log = self.log[:request.prev_log_index + 1] + new_entries
-            self.save_log()  # Persist the updated log
-
-        # Update commit index and apply new entries to the state machine
-        if request.commit_index > self.commit_index:
-            # Update commit index only if it's within the bounds of the log
-            if request.commit_index < len(self.log):
-                self.commit_index = request.commit_index
-            else:
-                self.commit_index = len(self.log) - 1  # Adjust to the last log index
+            # Skip entries already in the log and truncate only from the first conflicting one
+            index = prev_log_index + 1
+            for offset, entry in enumerate(new_entries):
+                if index + offset >= len(self.log) or self.log[index + offset].term != entry.term:
+                    logger.info(f"[{self.role}] Appending {len(new_entries) - offset} new entries to the log.")
+                    self.log.truncate(index + offset)
+                    self._truncate_configuration(index + offset)
+                    self.log.append(new_entries[offset:])
+                    self._record_configuration(index + offset, new_entries[offset:])
+                    await self._run_io(self.log.sync)  # One fsync for the whole batch
+                    break
+
+        # Update the commit index and let the applier catch up. Only the entries this request showed to
+        # match the leader's log may be committed; entries after them may be left over from an older term
+        self.leader_commit_seen = request.commit_index
+        await self._advance_commit_index(min(request.commit_index, prev_log_index + len(new_entries)))
 
         # Return success after log has been updated
         # logger.info(f"[{self.role}] AppendEntries succeeded, sending success response.")
         return AppendEntriesResponse(term=self.current_term, success=True, node_id=self.node_id)
 
-    def GetLeader(self, request, context):
-        """Handle GetLeader RPC."""
-        if self.role == "Leader":
-            leader_address = self.node_address
-        else:
-            leader_address = ""
+    def InstallSnapshot(self, request_iterator, context):
+        """Follower handling of a streamed InstallSnapshot RPC from the leader.
 
-        return LeaderInfo(leader_address=leader_address)
-    
-    def upload_to_all_nodes(self, file_name, file_content):
-        for peer in self.peers:
-            stub = self._get_stub(peer)
-            try:
-                request = UploadFileAllRequest(filename=file_name, data=file_content)
-                response = stub.UploadFileAll(request)
-            except grpc.RpcError as e:
-                logger.info(f"[{self.role}] Failed to upload file to {peer}: Server did not respond")
+        Chunks are written to disk on the gRPC thread; only the term check and the
+        final install run on the event loop.
+        """
+        writer = None
+        request = None
+        try:
+            for request in request_iterator:
+                if writer is None:
+                    # First chunk: validate the leader's term like AppendEntries does
+                    if not self._call(self._accept_snapshot_leader(request.term, request.leader_id)):
+                        logger.warning(f"Received snapshot with outdated term: {request.term}. Current term: {self.current_term}.")
+                        return InstallSnapshotResponse(term=self.current_term, success=False, node_id=self.node_id)
+                    writer = self.snapshots.writer()
+                    logger.info(f"[{self.role}] Receiving snapshot up to index {request.last_included_index} from {request.leader_id}")
+                else:
+                    self.loop.call_soon_threadsafe(self._reset_election_timer)
+
+                if request.offset != writer.size:
+                    logger.error(f"Snapshot chunk at offset {request.offset} does not follow {writer.size} bytes received")
+                    writer.abort()
+                    return InstallSnapshotResponse(term=self.current_term, success=False, node_id=self.node_id)
+                writer.write(request.data)
+                if request.done:
+                    break
+        except Exception:
+            if writer is not None:
+                writer.abort()
+            raise
+
+        if writer is None or not request.done:
+            logger.error("Snapshot stream ended before the last chunk")
+            if writer is not None:
+                writer.abort()
+            return InstallSnapshotResponse(term=self.current_term, success=False, node_id=self.node_id)
+
+        return self._call(self._install_snapshot(writer, request.last_included_index, request.last_included_term, request.config))
+
+    async def _accept_snapshot_leader(self, term: int, leader_id: str) -> bool:
+        """Term check for the first chunk of a snapshot stream, run on the event loop."""
+        return self._accept_leader(term, leader_id)
+
+    async def _install_snapshot(self, writer, last_index: int, last_term: int, config: str) -> InstallSnapshotResponse:
+        """Publish a fully received snapshot, restore the state machine from it and trim the log."""
+        async with self.snapshot_lock:
+            if last_index <= self.snapshot_index or (last_index <= self.last_applied and self._term_at(last_index) == last_term):
+                # Nothing new: this node already holds and has applied the entries the snapshot covers
+                writer.abort()
+                return InstallSnapshotResponse(term=self.current_term, success=True, node_id=self.node_id)
+
+            await self._run_io(writer.commit, last_index, last_term, config)
+            state = await self._run_io(self.snapshots.read_state)
+            await self.loop.run_in_executor(self.apply_executor, self._restore_state, last_index, state)
+            members = json.loads(config) if config else self._configuration_at(last_index)
+            if self.log.first_index <= last_index < len(self.log) and self.log.entry(last_index).term == last_term:
+                # The log already continues past the snapshot; keep the entries that follow it
+                self.log.compact(last_index)
+                later = [entry for entry in self.config_history if entry[0] > last_index]
+            else:
+                self.log.reset(last_index + 1)
+                later = []
+            self.snapshot_index, self.snapshot_term = last_index, last_term
+            self.config_history = [(last_index, members)] + later
+            self._use_configuration()
+        await self._advance_commit_index(last_index)
+        await self._notify(self.applied_changed)
+        logger.info(f"[{self.role}] Installed snapshot up to index {last_index}")
+        return InstallSnapshotResponse(term=self.current_term, success=True, node_id=self.node_id)
+
+    def ReadIndex(self, request: ReadIndexRequest, context):
+        """Leader handling of a follower's request for a read index."""
+        return self._call(self._handle_read_index(request))
+
+    async def _handle_read_index(self, request: ReadIndexRequest) -> ReadIndexResponse:
+        index = await self.read_index()
+        return ReadIndexResponse(success=index is not None, read_index=index if index is not None else -1, term=self.current_term)
+
+    def TimeoutNow(self, request, context):
+        """Handle TimeoutNow RPC from a leader handing over leadership."""
+        return self._call(self._handle_timeout_now(request))
+
+    async def _handle_timeout_now(self, request: TimeoutNowRequest) -> TimeoutNowResponse:
+        """Start an election right away, skipping the pre-vote that the current leader would fail."""
+        if request.term != self.current_term or self.role == "Leader" or not self._is_voter() or self.stopping:
+            return TimeoutNowResponse(term=self.current_term, success=False)
+        logger.info(f"[{self.role}] {request.leader_id} is handing over leadership")
+        self.start_election()
+        return TimeoutNowResponse(term=self.current_term, success=True)
+
+    def TransferLeadership(self, request, context):
+        """Handle the admin TransferLeadership RPC."""
+        success, message = self.transfer_leadership(request.target or None)
+        return TransferLeadershipResponse(success=success, message=message, leader_address=self.leader_address() or "")
+
+    def ChangeMembership(self, request, context):
+        """Handle the admin ChangeMembership RPC."""
+        success, message = self.change_membership(request.address, request.role or None)
+        return MembershipChangeResponse(success=success, message=message)
+
+    def GetMembers(self, request, context):
+        """Handle GetMembers RPC: the cluster configuration this node knows and its leader, for client discovery."""
+        members = [Member(address=address, role=role) for address, role in self.members.items()]
+        return MembersResponse(members=members, leader_address=self.leader_address() or "")
+
+    def GetPeerHealth(self, request, context):
+        """Handle GetPeerHealth RPC: how this node's channels to the other members are doing."""
+        return self._call(self._peer_health())
+
+    async def _peer_health(self) -> PeerHealthResponse:
+        states = self.connections.health()
+        peers = [PeerHealth(peer=peer, state=states.get(peer, "NOT_CONNECTED"), heartbeat_rtt_ms=self.heartbeat_rtt.get(peer, 0.0))
+                 for peer in self.peers]
+        return PeerHealthResponse(peers=peers, heartbeats=self.heartbeat_count,
+                                  open_fds=open_file_descriptors(), threads=threading.active_count())
+
+    def GetLeader(self, request, context):
+        """Handle GetLeader RPC. Followers answer with the leader they follow, if they know one."""
+        return LeaderInfo(leader_address=self.leader_address() or "")
     
     def UploadFileAll(self, request, context):
         file_name = request.filename
@@ -366,16 +1464,30 @@ class RaftNode(RaftServiceServicer):
         file_path = os.path.join(FILE_STORAGE_DIR, file_name)
         with open(file_path, 'wb') as f:
             f.write(file_content)
+        file_catalog.add_file(file_name)
+        return UploadFileAllResponse(status="success")
+
+    def UploadFileAllStream(self, request_iterator, context):
+        """Store a file streamed by another node, one chunk at a time."""
+        first = next(request_iterator, None)
+        if first is None:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, 'Empty file stream.')
+        file_name = os.path.basename(first.filename)
+        chunks = ((request.data, request.checksum) for request in itertools.chain([first], request_iterator))
+        try:
+            size, digest = write_chunks(chunks, os.path.join(FILE_STORAGE_DIR, file_name))
+        except ChecksumMismatch as e:
+            logger.error(f"[{self.role}] Discarding copy of {file_name}: {e}")
+            context.abort(grpc.StatusCode.DATA_LOSS, str(e))
+        file_catalog.add(file_name, size, digest)
         return UploadFileAllResponse(status="success")
 
-# To run the server, create a function similar to the following:
-def serve(peers: List[str]):
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    raft_node = RaftNode(peers)
-    add_RaftServiceServicer_to_server(raft_node, server)
-    server.add_insecure_port('[::]:50051')  # Bind to port (can be adjusted)
-    server.start()
-    logger.info("Raft server started...")
-    server.wait_for_termination()
+    def FetchFile(self, request, context):
+        """Stream a catalogued file to a peer that is missing it, in checksummed chunks."""
+        file_name = os.path.basename(request.filename)
+        if file_catalog.get(file_name) is None:
+            context.abort(grpc.StatusCode.NOT_FOUND, f'{file_name} is not stored on this node.')
+        for data, checksum in read_chunks(os.path.join(FILE_STORAGE_DIR, file_name)):
+            yield UploadFileAllRequest(filename=file_name, data=data, checksum=checksum)
 
 raft_service = RaftNode()
\ No newline at end of file
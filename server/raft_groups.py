@@ -0,0 +1,160 @@
+import grpc
+import itertools
+import logging
+import zlib
+from conts import RAFT_COURSE_GROUPS
+from document_cache import document_cache
+from file_catalog import file_catalog
+from file_replication import file_replicator
+from lms_pb2 import CatalogEntriesResponse, CatalogEntry, CatalogTreeResponse
+from lms_pb2_grpc import RaftServiceServicer
+from raft import RaftNode, raft_service
+from storage_tiers import storage_tiers
+from typing import Dict, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Multi-Raft: users and sessions stay in the meta group, while course data (assignments, materials,
+# feedback and queries) is partitioned by teacher across RAFT_COURSE_GROUPS independent Raft groups.
+# Every node hosts every group, and each group elects its own leader, so writes to different
+# groups are logged, replicated and applied in parallel.
+META_GROUP = 0
+COURSE_COLLECTIONS = ("assignments", "course_materials", "feedback", "queries")
+
+
+def group_for_key(key: Optional[str]) -> int:
+    """Group that owns the course data of a teacher; the meta group when course data is not sharded."""
+    if RAFT_COURSE_GROUPS == 0:
+        return META_GROUP
+    return 1 + zlib.crc32((key or "").encode()) % RAFT_COURSE_GROUPS
+
+
+def group_for_document(collection: str, document: dict) -> int:
+    """Group whose log writes a database document, so each group snapshots and restores only its own data."""
+    if collection in COURSE_COLLECTIONS:
+        return group_for_key(document.get("teacher_name"))
+    return META_GROUP
+
+
+def group_for_command(command) -> int:
+    """Group whose log a database command is replicated through."""
+    return group_for_key(command.shard_key()) if hasattr(command, "shard_key") else META_GROUP
+
+
+class RaftGroups(RaftServiceServicer):
+    """The Raft groups hosted on this node, registered as the node's single Raft service.
+
+    Every Raft RPC carries its group and is dispatched to that group's RaftNode, so all
+    groups share one port. Each node runs its own event loop, log and snapshots.
+    """
+
+    def __init__(self, meta: RaftNode, course_groups: int):
+        self.nodes: Dict[int, RaftNode] = {META_GROUP: meta}
+        for group in range(1, course_groups + 1):
+            self.nodes[group] = RaftNode(group)
+        if course_groups:
+            # Group g prefers the g-th voter in address order, so the leaders are spread across the nodes
+            for group, node in self.nodes.items():
+                node.preferred_leader_rank = group
+        logger.info(f"Hosting Raft groups {sorted(self.nodes)}")
+
+    @property
+    def meta(self) -> RaftNode:
+        return self.nodes[META_GROUP]
+
+    def node(self, group: int) -> RaftNode:
+        return self.nodes[group]
+
+    def node_for_command(self, command) -> RaftNode:
+        return self.nodes[group_for_command(command)]
+
+    def wait_for_read(self, max_staleness: Optional[float] = None) -> bool:
+        """Block until every group on this node is current enough to serve a read. The groups wait in parallel."""
+        pending = [node.start_read(max_staleness) for node in self.nodes.values()]
+        return all([future.result() for future in pending])
+
+    def hand_over_leadership(self):
+        """Stop taking leadership and hand every group this node leads to another node, before shutting down."""
+        for node in self.nodes.values():
+            node.stopping = True
+        for group, node in self.nodes.items():
+            if node.is_leader():
+                success, message = node.transfer_leadership()
+                logger.info(f"Group {group}: {message}")
+
+    def _route(self, group: int, context) -> RaftNode:
+        if group not in self.nodes:
+            context.abort(grpc.StatusCode.NOT_FOUND, f'Raft group {group} is not hosted on this node.')
+        return self.nodes[group]
+
+    # RPC handlers: hand each request to the node of its group
+    def RequestVote(self, request, context):
+        return self._route(request.group, context).RequestVote(request, context)
+
+    def AppendEntries(self, request, context):
+        return self._route(request.group, context).AppendEntries(request, context)
+
+    def AppendEntriesStream(self, request_iterator, context):
+        # Like InstallSnapshot, the group is read from the first frame
+        first = next(request_iterator, None)
+        if first is None:
+            return iter(())
+        return self._route(first.group, context).AppendEntriesStream(itertools.chain([first], request_iterator), context)
+
+    def InstallSnapshot(self, request_iterator, context):
+        # The group is read from the first chunk, which is then handed on with the rest of the stream
+        first = next(request_iterator, None)
+        group = first.group if first is not None else META_GROUP
+        chunks = itertools.chain([first], request_iterator) if first is not None else iter(())
+        return self._route(group, context).InstallSnapshot(chunks, context)
+
+    def ReadIndex(self, request, context):
+        return self._route(request.group, context).ReadIndex(request, context)
+
+    def TimeoutNow(self, request, context):
+        return self._route(request.group, context).TimeoutNow(request, context)
+
+    def TransferLeadership(self, request, context):
+        return self._route(request.group, context).TransferLeadership(request, context)
+
+    def ChangeMembership(self, request, context):
+        return self._route(request.group, context).ChangeMembership(request, context)
+
+    def GetMembers(self, request, context):
+        return self.meta.GetMembers(request, context)
+
+    def GetPeerHealth(self, request, context):
+        return self._route(request.group, context).GetPeerHealth(request, context)
+
+    def GetLeader(self, request, context):
+        return self.meta.GetLeader(request, context)
+
+    def UploadFileAll(self, request, context):
+        return self.meta.UploadFileAll(request, context)
+
+    def UploadFileAllStream(self, request_iterator, context):
+        return self.meta.UploadFileAllStream(request_iterator, context)
+
+    def GetFileReplication(self, request, context):
+        return file_replicator.lag()
+
+    def GetStorageTiers(self, request, context):
+        return storage_tiers.report()
+
+    def GetDocumentCache(self, request, context):
+        return document_cache.stats()
+
+    def GetCatalogTree(self, request, context):
+        nodes = file_catalog.tree_nodes(list(request.prefixes))
+        return CatalogTreeResponse(hashes=[node_hash for node_hash, _ in nodes], counts=[count for _, count in nodes])
+
+    def GetCatalogEntries(self, request, context):
+        entries = file_catalog.entries_under(list(request.prefixes))
+        return CatalogEntriesResponse(entries=[CatalogEntry(filename=name, size=size, sha256=digest) for name, size, digest in entries])
+
+    def FetchFile(self, request, context):
+        return self.meta.FetchFile(request, context)
+
+
+raft_groups = RaftGroups(raft_service, RAFT_COURSE_GROUPS)
@@ -0,0 +1,373 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Optional
+from lms_pb2 import LogEntry
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Every record is a fixed header followed by the serialized LogEntry
+RECORD_HEADER = struct.Struct("<II")  # Payload length, CRC32 of payload
+# Every slot of a segment index holds the end offset of one record in the segment's data file
+INDEX_SLOT = struct.Struct("<Q")
+
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024  # A segment is sealed once its data file reaches this size
+SEGMENT_MAX_ENTRIES = 65536  # ...or once its index is full
+CACHE_SIZE = 10000  # Number of recent entries kept in memory
+
+
+def encode_record(entry: LogEntry) -> bytes:
+    """Frame a log entry as a length + CRC32 header followed by its payload."""
+    payload = entry.SerializeToString()
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_records(data: bytes) -> List[LogEntry]:
+    """Decode a run of contiguous records, raising ValueError on a corrupt one."""
+    entries = []
+    offset = 0
+    while offset < len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        payload = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+        if zlib.crc32(payload) != crc:
+            raise ValueError(f"CRC mismatch in log record at offset {offset}")
+        entries.append(LogEntry.FromString(payload))
+        offset += RECORD_HEADER.size + length
+    return entries
+
+
+class LogSegment:
+    """A fixed-size piece of the log: a data file of records plus an mmap'd offset index."""
+
+    def __init__(self, directory: str, base_index: int, max_entries: int = SEGMENT_MAX_ENTRIES):
+        self.base_index = base_index  # Log index of the first entry in this segment
+        self.max_entries = max_entries
+        name = f"{base_index:020d}"
+        self.data_path = os.path.join(directory, name + ".log")
+        self.index_path = os.path.join(directory, name + ".idx")
+
+        self.data_fd = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        index_fd = os.open(self.index_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(index_fd, max_entries * INDEX_SLOT.size)
+            self.index = mmap.mmap(index_fd, max_entries * INDEX_SLOT.size)
+        finally:
+            os.close(index_fd)
+
+        self.count = self._count_entries()
+        self.size = self._end_offset(self.count - 1) if self.count else 0
+
+    def _end_offset(self, position: int) -> int:
+        return INDEX_SLOT.unpack_from(self.index, position * INDEX_SLOT.size)[0]
+
+    def _start_offset(self, position: int) -> int:
+        return self._end_offset(position - 1) if position > 0 else 0
+
+    def _count_entries(self) -> int:
+        """Binary search for the first empty index slot; end offsets only ever grow."""
+        low, high = 0, self.max_entries
+        while low < high:
+            middle = (low + high) // 2
+            if self._end_offset(middle) > 0:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _clear_slots(self, position: int):
+        start = position * INDEX_SLOT.size
+        self.index[start:self.count * INDEX_SLOT.size] = bytes(self.count * INDEX_SLOT.size - start)
+
+    def recover(self):
+        """Rebuild the index from the data file and cut off a torn or corrupt tail left by a crash."""
+        data = os.pread(self.data_fd, os.fstat(self.data_fd).st_size, 0)
+        offset = 0
+        position = 0
+        while offset + RECORD_HEADER.size <= len(data) and position < self.max_entries:
+            length, crc = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            offset = start + length
+            INDEX_SLOT.pack_into(self.index, position * INDEX_SLOT.size, offset)
+            position += 1
+
+        # The index may be ahead of the data if the crash hit between the two writes
+        self.count = max(self.count, position)
+        self._clear_slots(position)
+        self.count = position
+        self.size = offset
+        if offset < len(data):
+            logger.warning(f"Discarding {len(data) - offset} bytes of torn or corrupt records at the tail of {self.data_path}")
+            os.ftruncate(self.data_fd, offset)
+        self.sync()
+
+    def is_full(self, max_bytes: int) -> bool:
+        return self.count >= self.max_entries or self.size >= max_bytes
+
+    def append(self, records: List[bytes]):
+        """Write encoded records at the end of the segment and record their offsets in the index."""
+        os.pwrite(self.data_fd, b"".join(records), self.size)
+        for record in records:
+            self.size += len(record)
+            INDEX_SLOT.pack_into(self.index, self.count * INDEX_SLOT.size, self.size)
+            self.count += 1
+
+    def read(self, start: int, end: int) -> List[LogEntry]:
+        """Read the entries at segment positions [start, end) with a single read."""
+        offset = self._start_offset(start)
+        data = os.pread(self.data_fd, self._end_offset(end - 1) - offset, offset)
+        return decode_records(data)
+
+    def truncate(self, position: int):
+        """Drop the entry at the given segment position and every entry after it."""
+        self.size = self._start_offset(position)
+        os.ftruncate(self.data_fd, self.size)
+        self._clear_slots(position)
+        self.count = position
+
+    def sync(self):
+        os.fsync(self.data_fd)
+        self.index.flush()
+
+    def close(self):
+        self.index.close()
+        os.close(self.data_fd)
+
+    def delete(self):
+        self.close()
+        os.remove(self.data_path)
+        os.remove(self.index_path)
+
+
+class RaftLog:
+    """Segmented, append-only write-ahead log of Raft entries.
+
+    Only the active segment is scanned at startup; older segments are opened through
+    their offset index and their entries are read from disk on demand. A bounded cache
+    keeps the most recent entries in memory. Segments covered by a snapshot are removed
+    by compact(), so the log starts at first_index rather than 0.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = SEGMENT_MAX_BYTES,
+                 segment_max_entries: int = SEGMENT_MAX_ENTRIES, cache_size: int = CACHE_SIZE):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_entries = segment_max_entries
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[int, LogEntry]" = OrderedDict()  # Log index -> entry, oldest first
+        self.lock = threading.RLock()  # Guards the segment list against concurrent appends, reads and compaction
+        os.makedirs(self.directory, exist_ok=True)
+
+        base_indexes = sorted(int(name[:-len(".log")]) for name in os.listdir(self.directory) if name.endswith(".log"))
+        self.segments = [LogSegment(self.directory, base, self.segment_max_entries) for base in base_indexes]
+        if self.segments:
+            self.segments[-1].recover()
+        else:
+            self.segments.append(LogSegment(self.directory, 0, self.segment_max_entries))
+        self.unsynced = set()  # Segments written since the last sync()
+        logger.info(f"Opened log with {len(self)} entries in {len(self.segments)} segments from {self.directory}")
+
+    def __len__(self) -> int:
+        active = self.segments[-1]
+        return active.base_index + active.count
+
+    @property
+    def first_index(self) -> int:
+        """Index of the oldest entry still stored in the log."""
+        return self.segments[0].base_index
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("RaftLog slices do not support a step")
+            return self.read(start, stop)
+        if key < 0:
+            key += len(self)
+        if not self.first_index <= key < len(self):
+            raise IndexError("log index out of range")
+        return self.entry(key)
+
+    def _segment_for(self, index: int) -> LogSegment:
+        position = bisect.bisect_right([segment.base_index for segment in self.segments], index) - 1
+        return self.segments[position]
+
+    def _cache_put(self, index: int, entry: LogEntry):
+        self.cache[index] = entry
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def entry(self, index: int) -> LogEntry:
+        """Return one entry, from the cache when it is recent or from its segment otherwise."""
+        with self.lock:
+            if index in self.cache:
+                return self.cache[index]
+            if index < self.first_index:
+                raise IndexError(f"Log index {index} has been compacted into a snapshot")
+            segment = self._segment_for(index)
+            position = index - segment.base_index
+            return segment.read(position, position + 1)[0]
+
+    def read(self, start: int, end: Optional[int] = None) -> List[LogEntry]:
+        """Return entries [start, end), reading each segment that is not cached in one go."""
+        with self.lock:
+            end = len(self) if end is None else min(end, len(self))
+            if start >= end:
+                return []
+            if start in self.cache:
+                return [self.cache[index] for index in range(start, end)]
+            if start < self.first_index:
+                raise IndexError(f"Log index {start} has been compacted into a snapshot")
+
+            entries = []
+            index = start
+            while index < end:
+                segment = self._segment_for(index)
+                segment_end = min(end, segment.base_index + segment.count)
+                entries.extend(segment.read(index - segment.base_index, segment_end - segment.base_index))
+                index = segment_end
+            return entries
+
+    def first_index_with_term_at_least(self, term: int, end: int) -> int:
+        """Binary search [first_index, end] for the first entry whose term is at least term.
+
+        Terms never decrease along the log, so this takes O(log n) reads.
+        """
+        with self.lock:
+            low, high = self.first_index, end
+            while low < high:
+                middle = (low + high) // 2
+                if self.entry(middle).term < term:
+                    low = middle + 1
+                else:
+                    high = middle
+            return low
+
+    def last_index_with_term_at_most(self, term: int) -> Optional[int]:
+        """Binary search for the last stored entry whose term is at most term, or None if there is none."""
+        with self.lock:
+            low, high = self.first_index, len(self)
+            while low < high:
+                middle = (low + high) // 2
+                if self.entry(middle).term <= term:
+                    low = middle + 1
+                else:
+                    high = middle
+            return low - 1 if low > self.first_index else None
+
+    def last_term(self) -> int:
+        """Term of the last stored entry, or 0 if the log holds no entries."""
+        with self.lock:
+            return self.entry(len(self) - 1).term if len(self) > self.first_index else 0
+
+    def append(self, entries: List[LogEntry]):
+        """Append entries to the end of the log. Call sync() to make them durable."""
+        with self.lock:
+            position = 0
+            while position < len(entries):
+                active = self.segments[-1]
+                if active.is_full(self.segment_max_bytes):
+                    # Seal the full segment before starting the next one
+                    active.sync()
+                    self.unsynced.discard(active)
+                    active = LogSegment(self.directory, len(self), self.segment_max_entries)
+                    self.segments.append(active)
+
+                # Fill the active segment up to its entry and byte limits
+                records = []
+                size = active.size
+                while position < len(entries) and active.count + len(records) < active.max_entries and size < self.segment_max_bytes:
+                    records.append(encode_record(entries[position]))
+                    size += len(records[-1])
+                    self._cache_put(active.base_index + active.count + len(records) - 1, entries[position])
+                    position += 1
+                active.append(records)
+                self.unsynced.add(active)
+
+    def truncate(self, index: int):
+        """Drop the entry at index and every entry after it."""
+        with self.lock:
+            if index >= len(self):
+                return
+            for cached_index in [cached for cached in self.cache if cached >= index]:
+                del self.cache[cached_index]
+
+            while len(self.segments) > 1 and self.segments[-1].base_index >= index:
+                segment = self.segments.pop()
+                self.unsynced.discard(segment)
+                segment.delete()
+            active = self.segments[-1]
+            active.truncate(max(0, index - active.base_index))
+            self.unsynced.add(active)
+
+    def compact(self, index: int):
+        """Delete sealed segments whose entries are all at or before index, once a snapshot covers them."""
+        with self.lock:
+            while len(self.segments) > 1 and self.segments[1].base_index <= index + 1:
+                segment = self.segments.pop(0)
+                self.unsynced.discard(segment)
+                segment.delete()
+            for cached_index in [cached for cached in self.cache if cached < self.first_index]:
+                del self.cache[cached_index]
+
+    def reset(self, next_index: int):
+        """Discard every entry and restart the log at next_index, after installing a snapshot."""
+        with self.lock:
+            for segment in self.segments:
+                segment.delete()
+            self.cache.clear()
+            self.unsynced.clear()
+            self.segments = [LogSegment(self.directory, next_index, self.segment_max_entries)]
+
+    def sync(self):
+        """Flush written records and their index slots to disk."""
+        with self.lock:
+            for segment in self.unsynced:
+                segment.sync()
+            self.unsynced.clear()
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments:
+                segment.close()
+
+
+def load_metadata(path: str) -> dict:
+    """Load the durable Raft metadata (current_term and voted_for)."""
+    if not os.path.exists(path):
+        return {"current_term": 0, "voted_for": None}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_metadata(path: str, current_term: int, voted_for: Optional[str]):
+    """Atomically replace the Raft metadata file and fsync it."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"current_term": current_term, "voted_for": voted_for}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+if __name__ == '__main__':
+    # Dump a write-ahead log in a readable form: python raft_log.py /app/logs/wal
+    raft_log = RaftLog(sys.argv[1] if len(sys.argv) > 1 else "/app/logs/wal")
+    for segment in raft_log.segments:
+        for offset, entry in enumerate(segment.read(0, segment.count) if segment.count else []):
+            print(json.dumps({"index": segment.base_index + offset, "term": entry.term, "data": entry.data}))
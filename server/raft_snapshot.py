@@ -0,0 +1,104 @@
+import logging
+import os
+import struct
+import zlib
+from typing import BinaryIO, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# The snapshot file starts with a fixed header, followed by the serialized state and then the
+# cluster configuration as of the last included entry
+SNAPSHOT_HEADER = struct.Struct("<qqQII")  # Last included index, last included term, state size, CRC32 of state, configuration size
+
+
+class SnapshotMeta:
+    """Position in the log covered by a snapshot, the size of its state and the cluster configuration at that point."""
+    def __init__(self, last_included_index: int = -1, last_included_term: int = 0, size: int = 0, crc: int = 0,
+                 config: str = ""):
+        self.last_included_index = last_included_index
+        self.last_included_term = last_included_term
+        self.size = size
+        self.crc = crc
+        self.config = config  # JSON membership, empty if the snapshot predates any configuration
+
+
+class SnapshotWriter:
+    """Writes a snapshot to a temporary file and publishes it atomically once complete."""
+
+    def __init__(self, store: "SnapshotStore"):
+        self.store = store
+        self.tmp_path = store.path + ".tmp"
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(bytes(SNAPSHOT_HEADER.size))  # Filled in by commit()
+        self.size = 0
+        self.crc = 0
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.size += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+
+    def commit(self, last_included_index: int, last_included_term: int, config: str = "") -> SnapshotMeta:
+        """Write the configuration and the header, fsync and atomically replace the previous snapshot."""
+        meta = SnapshotMeta(last_included_index, last_included_term, self.size, self.crc, config)
+        config_data = config.encode()
+        self.file.write(config_data)
+        self.file.seek(0)
+        self.file.write(SNAPSHOT_HEADER.pack(last_included_index, last_included_term, self.size, self.crc, len(config_data)))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp_path, self.store.path)
+        logger.info(f"Snapshot saved up to index {last_included_index} (term {last_included_term}, {self.size} bytes)")
+        return meta
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class SnapshotStore:
+    """Keeps the latest snapshot of the applied state in a single file on disk."""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "snapshot.bin")
+
+    def load_meta(self) -> SnapshotMeta:
+        """Read the header of the current snapshot, or an empty one if there is none."""
+        meta, f = self.open()
+        if f is not None:
+            f.close()
+        return meta
+
+    def open(self) -> Tuple[SnapshotMeta, Optional[BinaryIO]]:
+        """Open the current snapshot positioned at its state. The file stays readable if it is replaced meanwhile."""
+        if not os.path.exists(self.path):
+            return SnapshotMeta(), None
+        f = open(self.path, "rb")
+        index, term, size, crc, config_size = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+        f.seek(SNAPSHOT_HEADER.size + size)
+        config = f.read(config_size).decode()
+        f.seek(SNAPSHOT_HEADER.size)
+        return SnapshotMeta(index, term, size, crc, config), f
+
+    def read_state(self) -> bytes:
+        """Read and verify the state stored in the current snapshot."""
+        meta, f = self.open()
+        if f is None:
+            return b""
+        with f:
+            data = f.read(meta.size)
+        if len(data) != meta.size or zlib.crc32(data) != meta.crc:
+            raise ValueError(f"Snapshot {self.path} is corrupt")
+        return data
+
+    def writer(self) -> SnapshotWriter:
+        return SnapshotWriter(self)
+
+    def save(self, last_included_index: int, last_included_term: int, state: bytes, config: str = "") -> SnapshotMeta:
+        writer = self.writer()
+        writer.write(state)
+        return writer.commit(last_included_index, last_included_term, config)
@@ -1,14 +1,18 @@
+from anti_entropy import anti_entropy  # Fetches files this node missed from its peers
 from concurrent import futures
-from conts import FILE_STORAGE_DIR
-from file_server import app as flask_app  # Import Flask app and routes
+from conts import FILE_SERVER_PORT, FILE_SERVER_THREADS, FILE_STORAGE_DIR, FILE_URL_SECRET
 from lms_server import LMSServer
-from raft import raft_service  # Import the RaftNode class
-from threading import Thread
+from peer_channels import SERVER_OPTIONS
+from raft_groups import raft_groups  # Every Raft group hosted on this node
+from state_machine import LMSStateMachine
 
 import grpc
 import lms_pb2_grpc
 import logging
 import os
+import signal
+import subprocess
+import sys
 
 # Ensure the file storage directory exists
 os.makedirs(FILE_STORAGE_DIR, exist_ok=True)
@@ -20,37 +24,58 @@ os.makedirs(FILE_STORAGE_DIR, exist_ok=True)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def run_flask_app():
-    """Run the Flask app."""
-    flask_app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+def run_file_server():
+    """Start the HTTP file server in a gunicorn process, whose threaded workers send files with sendfile."""
+    command = [
+        sys.executable, "-m", "gunicorn",
+        "--bind", f"0.0.0.0:{FILE_SERVER_PORT}",
+        "--worker-class", "gthread",
+        "--threads", str(FILE_SERVER_THREADS),
+        "--pythonpath", os.path.dirname(os.path.abspath(__file__)),
+        "file_server:app",
+    ]
+    logger.info(f"File server running on port {FILE_SERVER_PORT}")
+    return subprocess.Popen(command)  # Same working directory, so it serves the same FILE_STORAGE_DIR
 
-def serve_grpc():
+def serve_grpc(file_server=None):
     """Run the gRPC server with both LMS and Raft services."""
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    # Each Raft group adds its own RPC traffic, so the pool grows with the number of groups
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10 * len(raft_groups.nodes)), options=SERVER_OPTIONS)
     
     # Initialize the LMS server and Raft node
     lms_service = LMSServer()  # LMS logic
+    for group, raft_node in raft_groups.nodes.items():
+        raft_node.set_state_machine(LMSStateMachine(group))  # Apply committed commands to this node's database
 
 
     # Add LMS and Raft services to the gRPC server
     lms_pb2_grpc.add_LMSServicer_to_server(lms_service, server)
-    lms_pb2_grpc.add_RaftServiceServicer_to_server(raft_service, server)  # Add Raft service
+    lms_pb2_grpc.add_RaftServiceServicer_to_server(raft_groups, server)  # Add Raft service, dispatching to each group
 
     # Expose the gRPC server on port 5000 internally (or other as needed)
     server.add_insecure_port(f'[::]:5000')
     server.start()
     logger.info(f"LMS and Raft services running on port 5000")
+    signal.signal(signal.SIGTERM, lambda signum, frame: shutdown(server, file_server))
     server.wait_for_termination()
 
+def shutdown(server, file_server=None):
+    """Hand over leadership before stopping, so a restart does not wait out an election timeout."""
+    logger.info("Received SIGTERM, shutting down")
+    raft_groups.hand_over_leadership()
+    if file_server:
+        file_server.terminate()  # gunicorn finishes the downloads in progress, then exits
+    server.stop(grace=5).wait()
+    if file_server:
+        file_server.wait()
+
 def serve():
-    """Start Flask and gRPC servers together."""
-    # Run Flask app in a separate thread
-    # flask_thread = Thread(target=run_flask_app)
-    # flask_thread.daemon = True
-    # flask_thread.start()
+    """Start the file and gRPC servers together."""
+    # Signed download URLs point at the file server, so it only runs when they can be issued
+    file_server = run_file_server() if FILE_URL_SECRET else None
 
     # Start the gRPC server (LMS + Raft services)
-    serve_grpc()
+    serve_grpc(file_server)
 
 if __name__ == '__main__':
     # Assign a unique node ID to each Raft node (e.g., 1, 2, 3)
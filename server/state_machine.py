@@ -0,0 +1,40 @@
+from commands import decode_command
+from database import dump_database, load_database
+from lms_pb2 import LogEntry
+from raft import StateMachine
+from raft_groups import META_GROUP, group_for_document
+
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class LMSStateMachine(StateMachine):
+    """Applies committed database commands to this node's MongoDB database.
+
+    Every Raft group on the node applies to the same database; the snapshots of a group
+    cover only the documents that group writes.
+    """
+
+    def __init__(self, group: int = META_GROUP):
+        self.group = group
+
+    def owns(self, collection: str, document: dict) -> bool:
+        return group_for_document(collection, document) == self.group
+
+    def apply(self, index: int, entry: LogEntry):
+        """Run one committed command and return its result to the proposer."""
+        try:
+            command = decode_command(entry.data)
+        except ValueError:
+            # Entries written before commands were typed carry free text and have nothing to apply
+            logger.warning(f"Skipping log entry {index}: not a database command")
+            return None
+        return command.apply()
+
+    def snapshot(self) -> bytes:
+        return dump_database(self.owns)
+
+    def restore(self, data: bytes):
+        load_database(data, self.owns)
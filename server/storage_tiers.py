@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from conts import FILE_STORAGE_DIR, STORAGE_COLD_AFTER_DAYS, STORAGE_TIER_INTERVAL
+from file_transfer import COLD_DIR, COLD_HEADER, TOUCH_INTERVAL, compress_file, decompress_file, read_range, touch_stored
+from lms_pb2 import StorageTier, StorageTiersResponse
+from raft import RaftNode, raft_service
+from typing import Dict, Iterator, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Stored files sit in one of two tiers. Hot files are raw. Files no client has downloaded for
+# STORAGE_COLD_AFTER_DAYS are cold: compressed with zlib and inflated on the fly as they are read.
+# A cold file that is downloaded again is hot, and goes back to raw at the next sweep. A file's last
+# download is its modification time; copies between nodes do not count as reads. Each node tiers
+# its own files, and the catalog and replication only ever see the raw bytes.
+TIERS = ("hot", "cold")
+MAX_COLD_RATIO = 0.9  # Files that do not compress below this fraction of their size stay raw
+ABANDONED_PART_SECONDS = 3600  # A temporary .part file not written to for this long belongs to a copy or move cut short
+
+
+class StorageTiers:
+    """Moves stored files between the raw and compressed tiers, and times the reads served from each."""
+
+    def __init__(self, raft_node: RaftNode, storage_dir: str, cold_after_days: float = STORAGE_COLD_AFTER_DAYS,
+                 interval: float = STORAGE_TIER_INTERVAL):
+        self.raft = raft_node
+        self.storage_dir = storage_dir
+        self.cold_dir = os.path.join(storage_dir, COLD_DIR)
+        self.cold_after = cold_after_days * 24 * 3600  # Seconds without a download before a file is compressed
+        self.interval = interval
+        self.lock = threading.Lock()  # Guards the read statistics, updated from the gRPC threads
+        self.reads = {tier: 0 for tier in TIERS}
+        self.first_chunk_seconds = {tier: 0.0 for tier in TIERS}  # Total time to the first chunk of each read
+        self.read_seconds = {tier: 0.0 for tier in TIERS}  # Total time spent producing chunks
+        self.read_bytes = {tier: 0 for tier in TIERS}
+        self.touched: Dict[str, float] = {}  # When each file's last download was last written down
+        os.makedirs(self.cold_dir, exist_ok=True)
+        self.remove_abandoned_parts()
+        if self.cold_after > 0:
+            self.raft._call(self._start())
+
+    async def _start(self):
+        self.raft._spawn(self._run())
+
+    async def _run(self):
+        """Background task that sweeps the storage directory once per interval."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.raft.loop.run_in_executor(None, self.sweep)
+            except OSError as e:
+                logger.error(f"Storage tier sweep failed: {e}")
+
+    def remove_abandoned_parts(self):
+        """Delete the temporary files of copies and moves between tiers that a crash or restart cut short.
+
+        Only files no one has written to for ABANDONED_PART_SECONDS go, so a copy still under
+        way, on this node or another one sharing the directory, keeps its file.
+        """
+        cutoff = time.time() - ABANDONED_PART_SECONDS
+        for directory in (self.storage_dir, self.cold_dir):
+            with os.scandir(directory) as files:
+                for entry in files:
+                    try:
+                        if entry.name.endswith(".part") and entry.is_file() and entry.stat().st_mtime < cutoff:
+                            os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass  # Finished or removed since the directory was listed
+
+    def sweep(self):
+        """Compress raw files not downloaded for cold_after seconds, and restore cold files downloaded since.
+
+        A file can move or vanish while the sweep runs, for instance under another node's sweep
+        of a shared directory; it is skipped and the sweep carries on with the next one.
+        """
+        cutoff = time.time() - self.cold_after
+        compressed = restored = saved = skipped = 0
+        self.remove_abandoned_parts()
+        with os.scandir(self.storage_dir) as files:
+            for entry in files:
+                try:
+                    if not entry.is_file() or entry.name.endswith(".part") or entry.stat().st_mtime >= cutoff:
+                        continue
+                    compressed_size = compress_file(entry.path, MAX_COLD_RATIO)
+                    if compressed_size is None:
+                        os.utime(entry.path)  # Does not compress; check it again after another cold_after
+                    else:
+                        compressed += 1
+                        saved += entry.stat().st_size - compressed_size
+                except FileNotFoundError:
+                    skipped += 1
+        with os.scandir(self.cold_dir) as files:
+            for entry in files:
+                try:
+                    if not entry.is_file() or entry.name.endswith(".part"):
+                        continue
+                    file_path = os.path.join(self.storage_dir, entry.name)
+                    if os.path.exists(file_path):
+                        os.remove(entry.path)  # A peer copied the file here again while it was cold
+                    elif entry.stat().st_mtime >= cutoff:
+                        decompress_file(file_path)
+                        restored += 1
+                except FileNotFoundError:
+                    skipped += 1
+        if skipped:
+            logger.info(f"Storage tiers: skipped {skipped} files that moved during the sweep")
+        if compressed or restored:
+            logger.info(f"Storage tiers: compressed {compressed} cold files, saving {saved} bytes; restored {restored} hot files")
+
+    def touch(self, file_path: str):
+        """Record a download of a stored file, which keeps it hot. Written to disk at most once per TOUCH_INTERVAL."""
+        now = time.monotonic()
+        if now - self.touched.get(file_path, -TOUCH_INTERVAL) < TOUCH_INTERVAL:
+            return
+        self.touched[file_path] = now
+        touch_stored(file_path)
+
+    def read_range(self, file_path: str, offset: int, end: int) -> Iterator[Tuple[int, bytes]]:
+        """Like file_transfer.read_range, for a download: marks the file as read and times the read for its tier."""
+        tier = "hot" if os.path.isfile(file_path) else "cold"
+        self.touch(file_path)
+        chunks = read_range(file_path, offset, end)
+        busy = 0.0  # Time spent producing chunks, leaving out the time the receiver takes
+        first_chunk = None
+        size = 0
+        try:
+            while True:
+                start = time.monotonic()
+                chunk = next(chunks, None)
+                busy += time.monotonic() - start
+                if chunk is None:
+                    return
+                if first_chunk is None:
+                    first_chunk = busy
+                size += len(chunk[1])
+                yield chunk
+        finally:
+            chunks.close()
+            with self.lock:
+                self.reads[tier] += 1
+                self.first_chunk_seconds[tier] += first_chunk or 0.0
+                self.read_seconds[tier] += busy
+                self.read_bytes[tier] += size
+
+    def report(self) -> StorageTiersResponse:
+        """Files, raw and stored bytes, and read latency of each tier."""
+        hot, cold = StorageTier(name="hot"), StorageTier(name="cold")
+        with os.scandir(self.storage_dir) as files:
+            for entry in files:
+                if entry.is_file() and not entry.name.endswith(".part"):
+                    hot.files += 1
+                    hot.raw_bytes += entry.stat().st_size
+        hot.stored_bytes = hot.raw_bytes
+        with os.scandir(self.cold_dir) as files:
+            for entry in files:
+                if entry.is_file() and not entry.name.endswith(".part"):
+                    with open(entry.path, 'rb') as f:
+                        cold.raw_bytes += COLD_HEADER.unpack(f.read(COLD_HEADER.size))[0]
+                    cold.files += 1
+                    cold.stored_bytes += entry.stat().st_size
+        with self.lock:
+            for tier in (hot, cold):
+                tier.reads = self.reads[tier.name]
+                if tier.reads:
+                    tier.mean_first_chunk_ms = 1000 * self.first_chunk_seconds[tier.name] / tier.reads
+                if self.read_seconds[tier.name]:
+                    tier.read_mb_per_second = self.read_bytes[tier.name] / self.read_seconds[tier.name] / (1 << 20)
+        return StorageTiersResponse(tiers=[hot, cold], saved_bytes=cold.raw_bytes - cold.stored_bytes)
+
+
+storage_tiers = StorageTiers(raft_service, str(FILE_STORAGE_DIR))
@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+import time
+from concurrent import futures
+
+import grpc
+import pytest
+from grpc_tools import protoc
+
+# The servers import their modules by name from server/, and lms_pb2 is generated at build time,
+# so generate it here too. The working directory and the Raft environment are set before any server
+# module is imported: conts creates the storage directory in the working directory, and importing
+# raft starts the module's node, which must not join the default cluster.
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROTO_DIR = os.path.join(os.path.dirname(SERVER_DIR), "proto")
+WORK_DIR = tempfile.mkdtemp(prefix="lms-tests-")
+
+os.environ["RAFT_LOG_DIR"] = os.path.join(WORK_DIR, "logs")
+os.environ["RAFT_INITIAL_MEMBERS"] = ""
+os.environ["SERVER_NAME"] = "lms_test"
+# Every node of a test cluster shares one process and its GIL, so heartbeats can run late under
+# load. Wider election timeouts keep a busy leader from being voted out in the middle of a test
+os.environ.setdefault("RAFT_ELECTION_TIMEOUT_MIN", "1.0")
+os.environ.setdefault("RAFT_ELECTION_TIMEOUT_MAX", "2.0")
+os.chdir(WORK_DIR)
+if protoc.main(["protoc", f"-I{PROTO_DIR}", f"--python_out={WORK_DIR}", f"--grpc_python_out={WORK_DIR}",
+                os.path.join(PROTO_DIR, "lms.proto")]) != 0:
+    raise RuntimeError("Could not generate the gRPC code from lms.proto")
+sys.path[:0] = [WORK_DIR, SERVER_DIR]
+
+
+def wait_until(predicate, timeout: float = 10, interval: float = 0.02) -> bool:
+    """Poll predicate until it holds or timeout seconds pass. Returns its last result."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return predicate()
+        time.sleep(interval)
+    return True
+
+
+@pytest.fixture
+def make_node(tmp_path, monkeypatch):
+    """Factory for RaftNodes named by address host, each with its own log directory under tmp_path.
+
+    Making a node again under the same name restarts it from that directory.
+    """
+    import raft
+    nodes = []
+
+    def make(name, members=(), state_machine=None):
+        monkeypatch.setenv("SERVER_NAME", name)
+        monkeypatch.setattr(raft, "RAFT_LOG_DIR", str(tmp_path / name))
+        monkeypatch.setattr(raft, "RAFT_INITIAL_MEMBERS", list(members))
+        node = raft.RaftNode()
+        if state_machine is not None:
+            node.set_state_machine(state_machine)
+        nodes.append(node)
+        return node
+
+    yield make
+    for node in nodes:
+        node.stop()
+
+
+class Cluster:
+    """Raft nodes that talk to each other over gRPC, each served on its own loopback address at port 5000."""
+
+    def __init__(self, make_node):
+        self.make_node = make_node
+        self.nodes = {}
+        self.servers = {}
+
+    def start(self, address, members, state_machine=None):
+        from lms_pb2_grpc import add_RaftServiceServicer_to_server
+        from peer_channels import SERVER_OPTIONS
+        node = self.make_node(address.split(":")[0], members, state_machine)
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=16), options=SERVER_OPTIONS)
+        add_RaftServiceServicer_to_server(node, server)
+        server.add_insecure_port(address)
+        server.start()
+        self.nodes[address], self.servers[address] = node, server
+        return node
+
+    def stop(self, address):
+        """Take a node off the network and stop it."""
+        self.servers.pop(address).stop(grace=None).wait()
+        self.nodes.pop(address).stop()
+
+    def leader(self, timeout: float = 10):
+        """The single leader among the running nodes, once there is one."""
+        wait_until(lambda: len(self.leaders()) == 1, timeout)
+        leaders = self.leaders()
+        assert len(leaders) == 1, f"Expected one leader, found {len(leaders)}"
+        return leaders[0]
+
+    def leaders(self):
+        return [node for node in self.nodes.values() if node.is_leader()]
+
+    def close(self):
+        for address in list(self.servers):
+            self.stop(address)
+
+
+@pytest.fixture
+def cluster(make_node):
+    cluster = Cluster(make_node)
+    yield cluster
+    cluster.close()
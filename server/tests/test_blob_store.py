@@ -0,0 +1,26 @@
+import hashlib
+import os
+
+from blob_store import BlobStore
+from file_catalog import FileCatalog
+
+
+def test_restart_keeps_other_nodes_incoming_uploads(tmp_path):
+    storage_dir = str(tmp_path / "documents")
+    os.makedirs(storage_dir)
+    catalog = FileCatalog(storage_dir, str(tmp_path / "logs" / "file_catalog.jsonl"))
+    first = BlobStore(storage_dir, catalog, "lms_server_1")
+    in_flight = os.path.join(first.incoming_dir, "upload")
+    with open(in_flight, 'wb') as f:
+        f.write(b"half an upload")
+
+    # Another node starting on the same storage directory clears only its own uploads
+    second = BlobStore(storage_dir, catalog, "lms_server_2")
+    assert os.path.exists(in_flight)
+    digest, created = second.put(b"content")
+    assert created and digest == hashlib.sha256(b"content").hexdigest()
+    assert os.listdir(second.incoming_dir) == []
+
+    # The node's own restart clears what it was receiving
+    BlobStore(storage_dir, catalog, "lms_server_1")
+    assert not os.path.exists(in_flight)
@@ -0,0 +1,70 @@
+import os
+import threading
+from concurrent import futures
+
+import grpc
+
+import file_replication
+from file_transfer import compress_file, read_chunks
+from lms_pb2 import UploadFileAllResponse
+from lms_pb2_grpc import RaftServiceServicer, add_RaftServiceServicer_to_server
+
+PEER = "127.0.0.9:5000"
+
+
+class ReceivingPeer(RaftServiceServicer):
+    """A peer that keeps the files copied to it in memory."""
+
+    def __init__(self):
+        self.files = {}
+
+    def UploadFileAllStream(self, request_iterator, context):
+        data = b""
+        for request in request_iterator:
+            filename = request.filename or filename
+            data += request.data
+        self.files[filename] = data
+        return UploadFileAllResponse(status="success")
+
+
+def test_copy_reads_the_file_off_the_event_loop(make_node, tmp_path, monkeypatch):
+    storage_dir = tmp_path / "documents"
+    storage_dir.mkdir()
+    data = b"compressible " * 100000
+    (storage_dir / "cold-file").write_bytes(data)
+    compress_file(str(storage_dir / "cold-file"), 0.9)  # Copying a cold file inflates it as it is read
+    monkeypatch.setattr(file_replication, "FILE_STORAGE_DIR", storage_dir)
+
+    # Record the thread of every disk access the copy makes
+    threads = []
+
+    def recorded(function):
+        def wrapper(*args):
+            threads.append(threading.current_thread().name)
+            return function(*args)
+        return wrapper
+
+    def recorded_chunks(file_path):
+        for chunk in read_chunks(file_path, chunk_size=4096):
+            threads.append(threading.current_thread().name)
+            yield chunk
+
+    monkeypatch.setattr(file_replication, "is_stored", recorded(file_replication.is_stored))
+    monkeypatch.setattr(file_replication, "read_chunks", recorded_chunks)
+
+    peer = ReceivingPeer()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    add_RaftServiceServicer_to_server(peer, server)
+    server.add_insecure_port(PEER)
+    server.start()
+    try:
+        node = make_node("127.0.0.8", members=["127.0.0.8:5000", PEER])
+        replicator = file_replication.FileReplicator(node)
+        replicator.queue.add([PEER], "cold-file")
+        assert node._call(replicator._transfer(PEER, "cold-file"))
+    finally:
+        server.stop(grace=None)
+
+    assert peer.files == {"cold-file": data}
+    assert "cold-file" not in replicator.queue.pending(PEER)
+    assert len(threads) > 10 and "raft-loop" not in threads
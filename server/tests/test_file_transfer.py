@@ -0,0 +1,38 @@
+import hashlib
+import os
+import zlib
+
+import pytest
+from file_transfer import ChecksumMismatch, write_chunks
+
+DATA = [b"a" * 100, b"b" * 100, b"c" * 50]
+
+
+def chunks(data, during=None):
+    """Yield (data, running CRC32) chunks, calling during() after the first one."""
+    checksum = 0
+    for n, chunk in enumerate(data):
+        if n == 1 and during is not None:
+            during()
+        checksum = zlib.crc32(chunk, checksum)
+        yield chunk, checksum
+
+
+def test_concurrent_copies_of_a_file_do_not_collide(tmp_path):
+    path = str(tmp_path / "file")
+    expected = (sum(map(len, DATA)), hashlib.sha256(b"".join(DATA)).hexdigest())
+
+    # A second copy of the same file arrives, and completes, while the first is half written
+    inner = []
+    assert write_chunks(chunks(DATA, lambda: inner.append(write_chunks(chunks(DATA), path))), path) == expected
+    assert inner == [expected]
+    with open(path, 'rb') as f:
+        assert f.read() == b"".join(DATA)
+    assert os.listdir(tmp_path) == ["file"]
+
+
+def test_corrupt_chunk_leaves_nothing_behind(tmp_path):
+    path = str(tmp_path / "file")
+    with pytest.raises(ChecksumMismatch):
+        write_chunks([(DATA[0], zlib.crc32(DATA[0])), (DATA[1], 0)], path)
+    assert os.listdir(tmp_path) == []
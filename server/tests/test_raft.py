@@ -0,0 +1,171 @@
+from concurrent import futures
+
+from conftest import wait_until
+from lms_pb2 import AppendEntriesRequest, LogEntry, PeerHealthRequest
+from raft import StateMachine
+from raft_log import RaftLog
+
+
+class Recorder(StateMachine):
+    """Keeps every applied command in order, so tests can compare what the nodes applied."""
+
+    def __init__(self):
+        self.applied = []
+
+    def apply(self, index, entry):
+        self.applied.append((index, entry.term, entry.data))
+        return entry.data
+
+
+def append(node, term, prev_log_index, prev_log_term, entries, commit_index):
+    request = AppendEntriesRequest(term=term, leader_id="leader", prev_log_index=prev_log_index, prev_log_term=prev_log_term,
+                                   entries=[LogEntry(term=entry_term, data=data) for entry_term, data in entries],
+                                   commit_index=commit_index)
+    return node.AppendEntries(request, None)
+
+
+def log_of(node):
+    return [(entry.term, entry.data) for entry in node.log.read(node.log.first_index)]
+
+
+def test_heartbeat_does_not_commit_unverified_entries(make_node):
+    recorder = Recorder()
+    follower = make_node("follower", state_machine=recorder)
+
+    # The leader of term 2 replicated two entries that it never got committed
+    assert append(follower, 2, -1, 0, [(1, "a"), (2, "stale1"), (2, "stale2")], 0).success
+    assert wait_until(lambda: follower.last_applied == 0)
+
+    # The leader of term 3 has other entries at 1 and 2, and has committed them. Its heartbeat
+    # only shows that entry 0 matches, so the follower's entries 1 and 2 must not be applied
+    assert append(follower, 3, 0, 1, [], 2).success
+    assert not wait_until(lambda: follower.last_applied > 0, timeout=0.5)
+    assert recorder.applied == [(0, 1, "a")]
+
+    # Once the leader sends its entries, they replace the stale ones and are applied
+    assert append(follower, 3, 0, 1, [(3, "x"), (3, "y")], 2).success
+    assert wait_until(lambda: follower.last_applied == 2)
+    assert recorder.applied == [(0, 1, "a"), (1, 3, "x"), (2, 3, "y")]
+    assert log_of(follower) == [(1, "a"), (3, "x"), (3, "y")]
+
+
+ADDRESSES = [f"127.0.0.{n}:5000" for n in (1, 2, 3)]
+
+
+def start_cluster(cluster):
+    recorders = {address: Recorder() for address in ADDRESSES}
+    for address in ADDRESSES:
+        cluster.start(address, ADDRESSES, recorders[address])
+    return recorders
+
+
+def write(node, count, prefix):
+    """Commit count commands through the leader concurrently, so they go out in batches."""
+    with futures.ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda n: node.execute(f"{prefix}-{n}"), range(count)))
+    assert all(committed for committed, _ in results)
+
+
+def address_of(node):
+    return node.node_address
+
+
+def test_divergent_follower_far_behind_converges(cluster, tmp_path):
+    recorders = start_cluster(cluster)
+    leader = cluster.leader()
+    write(leader, 20, "before")
+    follower, other = [node for node in cluster.nodes.values() if node is not leader]
+    assert wait_until(lambda: len(follower.log) == len(other.log) == len(leader.log))
+
+    # The follower goes down. The leader then appends entries of its term that only reach the
+    # follower's disk, as if it crashed right after sending them, and the other node takes over
+    old_term = leader.current_term
+    old_leader, follower_address, other_address = leader, address_of(follower), address_of(other)
+    cluster.stop(follower_address)
+    success, message = leader.transfer_leadership(other_address)
+    assert success, message
+    leader = cluster.leader()
+    assert leader is other and leader.current_term > old_term
+
+    # While the follower is down, the new leader commits many more entries than one AppendEntries carries
+    write(leader, 200, "after")
+    assert wait_until(lambda: len(old_leader.log) == len(leader.log))
+    wal = RaftLog(str(tmp_path / follower.node_id / "wal"))
+    wal.append([LogEntry(term=old_term, data=f"divergent-{n}") for n in range(30)])
+    wal.sync()
+    assert len(wal) < len(leader.log)  # The leader holds other entries at every divergent index
+    wal.close()
+
+    # The new leader goes down and the follower comes back. The old leader wins the next election
+    # knowing nothing of the follower's log, so it has to find where the two diverge from the
+    # follower's conflict hints, then catch it up in many AppendEntries
+    old_leader.max_append_entries = 16
+    cluster.stop(other_address)
+    recorders[follower_address] = Recorder()  # A restarted node applies its log from the start
+    cluster.start(follower_address, ADDRESSES, recorders[follower_address])
+    leader = cluster.leader()
+    assert leader is old_leader
+    recorders[other_address] = Recorder()
+    cluster.start(other_address, ADDRESSES, recorders[other_address])
+
+    assert wait_until(lambda: all(log_of(node) == log_of(leader) for node in cluster.nodes.values()), timeout=20)
+    assert wait_until(lambda: all(node.last_applied == leader.commit_index for node in cluster.nodes.values()), timeout=20)
+    applied = [[data for _, _, data in recorder.applied] for recorder in recorders.values()]
+    assert applied[0] == applied[1] == applied[2]
+    assert sorted(applied[0]) == sorted([f"before-{n}" for n in range(20)] + [f"after-{n}" for n in range(200)])
+
+
+def test_transfer_leadership_keeps_committed_writes(cluster):
+    recorders = start_cluster(cluster)
+    leader = cluster.leader()
+    target = [node for node in cluster.nodes.values() if node is not leader][0]
+    old_term = leader.current_term
+
+    # Writes keep arriving at the old leader while it hands over; it refuses them once the transfer
+    # starts, but every write it reported as committed must survive on the new leader
+    committed = []
+
+    def write_until_refused(writer):
+        for n in range(1000):
+            data = f"{writer}-{n}"
+            ok, result = leader.execute(data)
+            if not ok:
+                return
+            assert result == data
+            committed.append(data)
+
+    with futures.ThreadPoolExecutor(max_workers=4) as pool:
+        writers = [pool.submit(write_until_refused, writer) for writer in range(4)]
+        assert wait_until(lambda: len(committed) >= 20)
+        success, message = leader.transfer_leadership(address_of(target))
+        for writer in writers:
+            writer.result()
+    assert success, message
+
+    assert cluster.leader() is target
+    assert target.current_term > old_term
+    assert not leader.is_leader() and leader.leader_id == target.node_id
+    assert target.execute("after")[0]
+    committed.append("after")
+
+    assert wait_until(lambda: all(node.last_applied == target.commit_index for node in cluster.nodes.values()))
+    for recorder in recorders.values():
+        applied = [data for _, _, data in recorder.applied]
+        assert set(committed) <= set(applied)
+        assert len(applied) == len(set(applied))
+
+
+def test_peer_health_reports_heartbeats_without_leaking_connections(cluster):
+    start_cluster(cluster)
+    leader = cluster.leader()
+    assert wait_until(lambda: len(leader.heartbeat_rtt) == 2)
+
+    health = leader.GetPeerHealth(PeerHealthRequest(), None)
+    assert {peer.peer for peer in health.peers} == {address_of(node) for node in cluster.nodes.values() if node is not leader}
+    assert all(peer.state == "READY" and peer.heartbeat_rtt_ms > 0 for peer in health.peers)
+    assert health.open_fds > 0
+
+    # Every heartbeat reuses the peers' channels, so the descriptors stay put as heartbeats go by
+    assert wait_until(lambda: leader.heartbeat_count >= health.heartbeats + 50)
+    later = leader.GetPeerHealth(PeerHealthRequest(), None)
+    assert later.open_fds <= health.open_fds + 2
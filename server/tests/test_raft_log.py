@@ -0,0 +1,58 @@
+import os
+
+from lms_pb2 import LogEntry
+from raft_log import RaftLog
+
+
+def entries(*data, term=1):
+    return [LogEntry(term=term, data=item) for item in data]
+
+
+def data_of(raft_log):
+    return [entry.data for entry in raft_log.read(raft_log.first_index)]
+
+
+def tear_last_record(raft_log, keep_index_slot):
+    """Cut the last record of the active segment in half, as a crash in the middle of its write would."""
+    segment = raft_log.segments[-1]
+    os.ftruncate(segment.data_fd, segment.size - 3)
+    if not keep_index_slot:
+        segment._clear_slots(segment.count - 1)  # The crash came before the index slot was written
+    raft_log.close()
+
+
+def test_reopen_drops_torn_tail(tmp_path):
+    for keep_index_slot in (False, True):
+        directory = str(tmp_path / f"wal-{keep_index_slot}")
+        raft_log = RaftLog(directory)
+        raft_log.append(entries("a", "b", "c"))
+        raft_log.sync()
+        tear_last_record(raft_log, keep_index_slot)
+
+        raft_log = RaftLog(directory)
+        assert len(raft_log) == 2
+        assert data_of(raft_log) == ["a", "b"]
+
+        # New entries follow the complete records and survive another restart
+        raft_log.append(entries("d", term=2))
+        raft_log.sync()
+        raft_log.close()
+        raft_log = RaftLog(directory)
+        assert data_of(raft_log) == ["a", "b", "d"]
+        assert raft_log.last_term() == 2
+        raft_log.close()
+
+
+def test_reopen_drops_torn_tail_of_later_segment(tmp_path):
+    directory = str(tmp_path / "wal")
+    raft_log = RaftLog(directory, segment_max_entries=2)
+    raft_log.append(entries("a", "b", "c", "d", "e"))
+    raft_log.sync()
+    tear_last_record(raft_log, keep_index_slot=True)
+
+    raft_log = RaftLog(directory, segment_max_entries=2)
+    assert data_of(raft_log) == ["a", "b", "c", "d"]
+    raft_log.append(entries("f"))
+    raft_log.sync()
+    raft_log.close()
+    assert data_of(RaftLog(directory, segment_max_entries=2)) == ["a", "b", "c", "d", "f"]
@@ -0,0 +1,52 @@
+import os
+import time
+
+import storage_tiers
+from file_transfer import COLD_DIR, open_stored
+from storage_tiers import ABANDONED_PART_SECONDS, StorageTiers
+
+
+def store(directory, name, data=b"compressible " * 1000):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_sweep_skips_files_that_vanish(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    tiers = StorageTiers(None, directory, cold_after_days=0)  # Every file counts as cold, and no sweep is scheduled
+    paths = [store(directory, name) for name in ("a", "b", "c")]
+
+    # Another sweep on a shared directory moves the first file the sweep reaches before it does
+    compress_file = storage_tiers.compress_file
+    moved = []
+
+    def compress_moved_first(file_path, max_ratio):
+        if not moved:
+            moved.append(file_path)
+            compress_file(file_path, max_ratio)
+        return compress_file(file_path, max_ratio)
+
+    monkeypatch.setattr(storage_tiers, "compress_file", compress_moved_first)
+    tiers.sweep()
+    assert sorted(os.listdir(os.path.join(directory, COLD_DIR))) == ["a", "b", "c"]
+    for path in paths:
+        assert not os.path.exists(path)
+        with open_stored(path) as f:
+            assert f.read() == b"compressible " * 1000
+
+
+def test_only_abandoned_part_files_are_removed(tmp_path):
+    directory = str(tmp_path)
+    os.makedirs(os.path.join(directory, COLD_DIR))
+    abandoned = store(directory, "a.1.part")
+    abandoned_cold = store(os.path.join(directory, COLD_DIR), "a.2.part")
+    in_progress = store(directory, "b.3.part")
+    old = time.time() - ABANDONED_PART_SECONDS - 1
+    for path in (abandoned, abandoned_cold):
+        os.utime(path, (old, old))
+
+    StorageTiers(None, directory, cold_after_days=0)
+    assert not os.path.exists(abandoned) and not os.path.exists(abandoned_cold)
+    assert os.path.exists(in_progress)
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from blob_store import BlobStore, blob_store
+from conts import FILE_CHUNK_SIZE, FILE_STORAGE_DIR, UPLOAD_SESSION_EXPIRY_HOURS, UPLOAD_SESSION_GC_INTERVAL
+from dataclasses import dataclass, field
+from file_transfer import ChecksumMismatch
+from lms_pb2 import ByteRange
+from raft import RaftNode, raft_service
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# A resumable upload is a session on the leader of the Raft group its record goes to, and its upload
+# ID starts with that group. The client announces the file's size and SHA-256 up front. Chunks then
+# arrive in any order, over as many UploadChunks streams as it takes. Each chunk has its own CRC32;
+# once it checks out it is written at its offset in a sparse part file, and its index is appended to
+# a journal. A client that lost its connection asks which byte ranges arrived and sends only the
+# rest. Finalizing checks the whole file against its SHA-256, moves it into the blob store and
+# records the assignment or course material. Sessions live on the leader's own disk beside its stored
+# files, so they survive a restart of that node. Each node has its own storage, so if leadership of
+# the group moves, the new leader does not know the session and the client starts another one.
+# Sessions that receive nothing for UPLOAD_SESSION_EXPIRY_HOURS are deleted.
+UPLOADS_DIR = ".uploads"
+UPLOAD_ID = re.compile(r"\d+-[0-9a-f]{32}")
+PERSISTED_FIELDS = ("upload_id", "username", "filename", "size", "sha256", "teacher_name", "chunk_size")
+
+
+@dataclass
+class UploadSession:
+    """An unfinished upload: who sends it, what it is, and which of its chunks are on disk."""
+    upload_id: str
+    username: str
+    filename: str
+    size: int
+    sha256: str
+    teacher_name: str
+    chunk_size: int
+    received: Set[int] = field(default_factory=set)  # Indices of the chunks written
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)  # Held while finalizing
+
+    @property
+    def chunks(self) -> int:
+        return -(-self.size // self.chunk_size)
+
+    def chunk_length(self, index: int) -> int:
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+
+class UploadSessions:
+    """Resumable upload sessions, kept in a directory beside the stored files."""
+
+    def __init__(self, raft_node: RaftNode, storage_dir: str, blobs: BlobStore,
+                 expiry_hours: float = UPLOAD_SESSION_EXPIRY_HOURS, interval: float = UPLOAD_SESSION_GC_INTERVAL):
+        self.raft = raft_node
+        self.dir = os.path.join(storage_dir, UPLOADS_DIR)
+        self.blobs = blobs
+        self.expiry = expiry_hours * 3600  # Seconds without a chunk before a session is deleted
+        self.interval = interval
+        self.lock = threading.Lock()  # Guards sessions and their received chunks
+        self.sessions: Dict[str, UploadSession] = {}  # Sessions in use, read from disk on first use
+        os.makedirs(self.dir, exist_ok=True)
+        self.raft._call(self._start())
+
+    async def _start(self):
+        self.raft._spawn(self._run())
+
+    async def _run(self):
+        """Background task that deletes abandoned sessions once per interval."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.raft.loop.run_in_executor(None, self.sweep)
+            except OSError as e:
+                logger.error(f"Upload session sweep failed: {e}")
+
+    def _path(self, upload_id: str, suffix: str) -> str:
+        """A session's files: .json describes it, .part holds its data and .chunks lists the chunks written."""
+        return os.path.join(self.dir, f"{upload_id}{suffix}")
+
+    def start(self, group: int, username: str, filename: str, size: int, sha256: str, teacher_name: str) -> UploadSession:
+        """Open a session for a file of size bytes, on the leader of the given Raft group."""
+        upload = UploadSession(f"{group}-{uuid.uuid4().hex}", username, filename, size, sha256, teacher_name, FILE_CHUNK_SIZE)
+        with open(self._path(upload.upload_id, ".part"), 'wb') as f:
+            f.truncate(size)  # Sparse: takes disk space only as chunks arrive
+        open(self._path(upload.upload_id, ".chunks"), 'w').close()
+        # The description is written last, so a session is only found once all its files exist
+        description_path = self._path(upload.upload_id, ".json")
+        with open(f"{description_path}.tmp", 'w') as f:
+            json.dump({name: getattr(upload, name) for name in PERSISTED_FIELDS}, f)
+        os.replace(f"{description_path}.tmp", description_path)
+        with self.lock:
+            self.sessions[upload.upload_id] = upload
+        return upload
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        if not UPLOAD_ID.fullmatch(upload_id):
+            return None
+        with self.lock:
+            upload = self.sessions.get(upload_id)
+            if upload is None:
+                upload = self._load(upload_id)
+                if upload is not None:
+                    self.sessions[upload_id] = upload
+            return upload
+
+    def _load(self, upload_id: str) -> Optional[UploadSession]:
+        """Read a session from disk after a restart."""
+        try:
+            with open(self._path(upload_id, ".json")) as f:
+                upload = UploadSession(**json.load(f))
+            with open(self._path(upload_id, ".chunks")) as f:
+                upload.received = {int(line) for line in f if line.endswith("\n")}  # A torn last line was not journaled
+        except FileNotFoundError:
+            return None
+        return upload
+
+    def receive(self, upload: UploadSession, chunks: Iterable[Tuple[int, bytes, int]]):
+        """Write (offset, data, CRC32 of data) chunks to a session. Raises ChecksumMismatch or ValueError.
+
+        Each chunk is journaled as soon as it is written, so the chunks before a bad one are kept.
+        A chunk already received is skipped.
+        """
+        with open(self._path(upload.upload_id, ".part"), 'r+b') as f, open(self._path(upload.upload_id, ".chunks"), 'a') as journal:
+            for offset, data, checksum in chunks:
+                index, misaligned = divmod(offset, upload.chunk_size)
+                if misaligned or not 0 <= index < upload.chunks or len(data) != upload.chunk_length(index):
+                    raise ValueError(f"The chunk at byte {offset} does not fit upload {upload.upload_id}")
+                if zlib.crc32(data) != checksum:
+                    raise ChecksumMismatch(f"Checksum mismatch in the chunk at byte {offset} of {upload.filename}")
+                if index in upload.received:
+                    continue
+                os.pwrite(f.fileno(), data, offset)
+                journal.write(f"{index}\n")
+                journal.flush()
+                with self.lock:
+                    upload.received.add(index)
+
+    def received_ranges(self, upload: UploadSession) -> List[ByteRange]:
+        """The chunks of a session written so far, as merged byte ranges."""
+        with self.lock:
+            received = sorted(upload.received)
+        ranges: List[ByteRange] = []
+        for index in received:
+            start = index * upload.chunk_size
+            end = start + upload.chunk_length(index)
+            if ranges and ranges[-1].end == start:
+                ranges[-1].end = end
+            else:
+                ranges.append(ByteRange(start=start, end=end))
+        return ranges
+
+    def is_complete(self, upload: UploadSession) -> bool:
+        with self.lock:
+            return len(upload.received) == upload.chunks
+
+    def publish(self, upload: UploadSession) -> bool:
+        """Move a complete upload into the blob store. Returns whether its content was new.
+
+        Raises ChecksumMismatch if the file is not the one announced, and starts the session over.
+        """
+        try:
+            _, created = self.blobs.put_file(self._path(upload.upload_id, ".part"), upload.sha256)
+        except ChecksumMismatch:
+            open(self._path(upload.upload_id, ".chunks"), 'w').close()
+            with self.lock:
+                upload.received.clear()
+            raise
+        return created
+
+    def remove(self, upload: UploadSession):
+        """Delete a finished or abandoned session."""
+        with self.lock:
+            self.sessions.pop(upload.upload_id, None)
+        for suffix in (".json", ".chunks", ".part"):
+            try:
+                os.remove(self._path(upload.upload_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def sweep(self):
+        """Delete the files of sessions that have received nothing for the expiry time."""
+        cutoff = time.time() - self.expiry
+        files_by_upload: Dict[str, List[os.DirEntry]] = {}
+        with os.scandir(self.dir) as files:
+            for entry in files:
+                files_by_upload.setdefault(entry.name.split(".", 1)[0], []).append(entry)
+        abandoned = freed = 0
+        for upload_id, entries in files_by_upload.items():
+            if max(entry.stat().st_mtime for entry in entries) >= cutoff:
+                continue
+            with self.lock:
+                self.sessions.pop(upload_id, None)
+            for entry in entries:
+                freed += entry.stat().st_blocks * 512
+                os.remove(entry.path)
+            abandoned += 1
+        if abandoned:
+            logger.info(f"Deleted {abandoned} abandoned uploads, freeing {freed} bytes")
+
+
+upload_sessions = UploadSessions(raft_service, str(FILE_STORAGE_DIR), blob_store)